@@ -0,0 +1,81 @@
+"""
+כלי מיגרציה לנתוני OHLC ב-Mongo:
+- --legacy: ממיר את הדוקומנטים הישנים ב-collection "ohlc" (מערך ohlc אחד ענק עם datetime כמחרוזת)
+  ל-buckets + ohlc_coverage.
+- --to packed|docs: ממיר buckets קיימים לפורמט המבוקש (packed = עמודות בינאריות דחוסות).
+
+הרצה (מתוך BE/):
+    python -m app.db.migrate_ohlc --legacy --to packed
+    python -m app.db.migrate_ohlc --to packed --dry-run
+"""
+import argparse
+import asyncio
+from typing import Optional
+
+import pandas as pd
+from pymongo import ReplaceOne
+
+from .ohlc_db import (
+    PACKED,
+    ohlc_collection,
+    ohlc_buckets,
+    save_ohlc_to_db,
+    _bucket_columns,
+    _bucket_doc,
+    _utc_now_iso,
+)
+
+BATCH_SIZE = 500
+
+
+async def migrate_legacy(dry_run: bool = False) -> int:
+    """מעביר כל דוקומנט ישן ל-buckets (ממוזג עם מה שכבר קיים) ורושם את הטווח שלו ככיסוי."""
+    migrated = 0
+    async for doc in ohlc_collection.find({}):
+        candles = doc.get("ohlc") or []
+        print(f"{doc['symbol']} {doc['timeframe']} {doc['start_date']}..{doc['end_date']}: {len(candles)} candles")
+        if not dry_run and candles:
+            await save_ohlc_to_db(doc["symbol"], doc["timeframe"], doc["start_date"], doc["end_date"], candles)
+        migrated += 1
+    return migrated
+
+
+async def convert_buckets(storage_format: str, dry_run: bool = False) -> int:
+    """ממיר כל bucket שלא בפורמט storage_format."""
+    query = {"fmt": PACKED} if storage_format != PACKED else {"fmt": {"$ne": PACKED}}
+    converted = 0
+    ops = []
+    async for bucket in ohlc_buckets.find(query):
+        group = pd.DataFrame(_bucket_columns(bucket))
+        if group.empty:
+            continue
+        doc = _bucket_doc(
+            bucket["symbol"], bucket["timeframe"], bucket["bucket_start"], group,
+            bucket.get("fetched_at") or _utc_now_iso(), storage_format=storage_format,
+        )
+        ops.append(ReplaceOne({"_id": bucket["_id"]}, doc))
+        converted += 1
+        if len(ops) >= BATCH_SIZE and not dry_run:
+            await ohlc_buckets.bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        await ohlc_buckets.bulk_write(ops, ordered=False)
+    return converted
+
+
+async def main(legacy: bool, storage_format: Optional[str], dry_run: bool) -> None:
+    if legacy:
+        n = await migrate_legacy(dry_run)
+        print(f"✅ Migrated {n} legacy documents")
+    if storage_format:
+        n = await convert_buckets(storage_format, dry_run)
+        print(f"✅ Converted {n} buckets to '{storage_format}'")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate stored OHLC documents")
+    parser.add_argument("--legacy", action="store_true", help="convert one-document-per-fetch 'ohlc' docs to buckets")
+    parser.add_argument("--to", dest="storage_format", choices=[PACKED, "docs"], help="convert buckets to this format")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.legacy, args.storage_format, args.dry_run))
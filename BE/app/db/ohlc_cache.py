@@ -0,0 +1,189 @@
+"""
+שכבת cache מקומית (Arrow IPC על הדיסק) מול Mongo, לכל symbol/timeframe.
+הקבצים נפתחים ב-memory map, כך שטעינה של מניה "חמה" לא עוברת ברשת ולא בונה DataFrame מ-dicts.
+אם pyarrow לא מותקן – ה-cache פשוט כבוי.
+הפונקציות סינכרוניות (I/O לדיסק) – מקוד async קוראים להן דרך asyncio.to_thread, כדי לא לחסום את ה-event loop;
+lock אחד שומר על index.json מפני קריאה-כתיבה מקבילה של כמה threads.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..settings import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow אופציונלי
+    pa = None
+
+CACHE_DIR = Path(settings.OHLC_CACHE_DIR)
+INDEX_PATH = CACHE_DIR / "index.json"
+_lock = threading.Lock()
+
+
+# ---------- helpers ----------
+def _key(symbol: str, timeframe: str) -> str:
+    return f"{symbol.upper()}_{timeframe}"
+
+def _day(d: Any) -> str:
+    """YYYY-MM-DD מכל מחרוזת/תאריך."""
+    return d.isoformat()[:10] if hasattr(d, "isoformat") else str(d)[:10]
+
+def _load_index() -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_index(index: Dict[str, Dict[str, Any]]) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = INDEX_PATH.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, INDEX_PATH)
+
+def _remove_file(file_name: str) -> None:
+    # ב-Windows קובץ שעדיין ממופה לזיכרון לא נמחק – ננסה שוב בפינוי הבא
+    try:
+        (CACHE_DIR / file_name).unlink()
+    except OSError:
+        pass
+
+def _locked(fn):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return fn(*args, **kwargs)
+    return wrapper
+
+def _is_fresh(entry: Dict[str, Any], end_d: str) -> bool:
+    """טווח שנגמר לפני היום שבו נכתב ה-cache הוא היסטוריה סגורה; אחרת תקף עד OHLC_CACHE_TTL_SECONDS."""
+    written_day = date.fromtimestamp(entry["written_at"]).isoformat()
+    if end_d < written_day:
+        return True
+    return time.time() - entry["written_at"] < settings.OHLC_CACHE_TTL_SECONDS
+
+def _read_file(file_name: str) -> pd.DataFrame:
+    source = pa.memory_map(str(CACHE_DIR / file_name), "r")
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+def _evict(index: Dict[str, Dict[str, Any]]) -> None:
+    """LRU: מוחק את הרשומות שלא נקראו הכי הרבה זמן עד שהגודל הכולל מתחת ל-OHLC_CACHE_MAX_MB."""
+    max_bytes = settings.OHLC_CACHE_MAX_MB * 1024 * 1024
+    total = sum(e["size"] for e in index.values())
+    for key, entry in sorted(index.items(), key=lambda kv: kv[1]["last_access"]):
+        if total <= max_bytes:
+            break
+        _remove_file(entry["file"])
+        total -= entry["size"]
+        del index[key]
+
+
+# ---------- core ----------
+@_locked
+def get_ohlc_from_cache(
+    symbol: str,
+    timeframe: str,
+    start_date: str,
+    end_date: str,
+) -> Optional[pd.DataFrame]:
+    """
+    מחזיר DataFrame לטווח [start_date, end_date] אם ה-cache מכסה אותו ועדיין טרי.
+    אחרת None.
+    """
+    if pa is None:
+        return None
+
+    index = _load_index()
+    key = _key(symbol, timeframe)
+    entry = index.get(key)
+    start_d, end_d = _day(start_date), _day(end_date)
+    if not entry or entry["start"] > start_d or entry["end"] < end_d or not _is_fresh(entry, end_d):
+        return None
+
+    try:
+        df = _read_file(entry["file"])
+    except (OSError, pa.ArrowInvalid):
+        del index[key]
+        _save_index(index)
+        return None
+
+    # חיתוך לטווח עם חיפוש בינארי על עמודת הזמן (ממויינת)
+    dts = df["datetime"].to_numpy()
+    lo = np.searchsorted(dts, np.datetime64(start_d), side="left")
+    hi = np.searchsorted(dts, np.datetime64(end_d) + np.timedelta64(1, "D"), side="left")
+
+    entry["last_access"] = time.time()
+    _save_index(index)
+    return df.iloc[lo:hi].reset_index(drop=True)
+
+@_locked
+def save_ohlc_to_cache(
+    symbol: str,
+    timeframe: str,
+    start_date: str,
+    end_date: str,
+    df: pd.DataFrame,
+) -> None:
+    """
+    כותב את ה-DataFrame (עמודת datetime + OHLCV) לקובץ Arrow IPC.
+    אם יש כבר רשומה טרייה שחופפת/צמודה לטווח – ממזג כדי שה-cache רק יגדל.
+    """
+    if pa is None or df is None or df.empty:
+        return
+
+    index = _load_index()
+    key = _key(symbol, timeframe)
+    start_d, end_d = _day(start_date), _day(end_date)
+    old = index.get(key)
+
+    if old and _is_fresh(old, old["end"]) and old["start"] <= end_d and start_d <= old["end"]:
+        try:
+            df = pd.concat([_read_file(old["file"]), df])
+            df = df.drop_duplicates(subset="datetime", keep="last")
+            start_d, end_d = min(start_d, old["start"]), max(end_d, old["end"])
+        except (OSError, pa.ArrowInvalid):
+            pass
+    df = df.sort_values("datetime").reset_index(drop=True)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    # שם קובץ חדש בכל כתיבה – לא דורסים קובץ שאולי עדיין ממופה ע"י קורא אחר
+    file_name = f"{key}.{int(now * 1000)}.arrow"
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(CACHE_DIR / file_name), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    if old:
+        _remove_file(old["file"])
+    index[key] = {
+        "file": file_name,
+        "size": (CACHE_DIR / file_name).stat().st_size,
+        "start": start_d,
+        "end": end_d,
+        "rows": len(df),
+        "written_at": now,
+        "last_access": now,
+    }
+    _evict(index)
+    _save_index(index)
+
+@_locked
+def invalidate_cache(symbol: str, timeframe: str) -> None:
+    index = _load_index()
+    entry = index.pop(_key(symbol, timeframe), None)
+    if entry:
+        _remove_file(entry["file"])
+        _save_index(index)
@@ -1,12 +1,15 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne
+from bson import Binary
 from ..settings import settings
 from datetime import datetime
 import asyncio
 import json
 import os
+import zlib
 # from pymongo import MongoClient
-from typing import List, Dict, Any, Optional, Union
-from datetime import datetime, timezone, date
+from typing import List, Dict, Any, Optional, Tuple, Union
+from datetime import datetime, timezone, date, timedelta
 import pandas as pd
 import numpy as np
 
@@ -14,6 +17,10 @@ import numpy as np
 client = AsyncIOMotorClient(settings.MONGO_URI)
 db = client[settings.MONGO_DB]
 ohlc_collection = db['ohlc']
+# נרות שמורים ב-buckets: דוקומנט אחד לכל symbol/timeframe/תקופה (יום/חודש/שנה)
+ohlc_buckets = db['ohlc_buckets']
+# אילו טווחי תאריכים כבר נמשכו ונשמרו לכל symbol/timeframe
+ohlc_coverage = db['ohlc_coverage']
 print("✅ Connected to MongoDB successfully!")
 
 # פונקציה לבדוק חיבור
@@ -81,6 +88,30 @@ async def ensure_indexes() -> None:
         [("symbol", 1), ("timeframe", 1), ("start_date", 1), ("end_date", 1)],
         name="symbol_timeframe_range"
     )
+    await ohlc_buckets.create_index(
+        [("symbol", 1), ("timeframe", 1), ("bucket_start", 1)],
+        name="symbol_timeframe_bucket",
+        unique=True,
+    )
+    await ohlc_coverage.create_index(
+        [("symbol", 1), ("timeframe", 1)],
+        name="symbol_timeframe",
+        unique=True,
+    )
+
+OHLC_COLUMNS = ("datetime", "open", "high", "low", "close", "volume")
+
+# גודל ה-bucket לפי timeframe – כך שדוקומנט נשאר קטן (מאות עד אלפי נרות) גם ב-1m
+BUCKET_SPAN = {
+    "1m": "day", "5m": "day", "15m": "day",
+    "60m": "month", "1h": "month",
+    "1d": "year", "1w": "year", "1M": "year",
+}
+
+# פורמט compact ("packed"): כל bucket שומר עמודות כ-BSON binary –
+# זמנים כ-int64 (ms) בקידוד delta (הערך הראשון מוחלט) ו-OHLCV כ-float64/float32, עם דחיסת zlib אופציונלית
+PACKED = "packed"
+PACKED_DTYPES = {"float64": "<f8", "float32": "<f4"}
 
 # ---------- helpers ----------
 def _iso_date_str(d: Union[str, date, datetime]) -> str:
@@ -96,38 +127,150 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 def _df_to_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
-    """ממיר DataFrame לרשימת dicts עם datetime כמחרוזת וערכים מספריים כ-float."""
+    """ממיר DataFrame לרשימת dicts עם datetime כ-datetime (BSON date) וערכים מספריים כ-float."""
     out = df.copy()
 
     # אם datetime לא בעמודות אלא באינדקס—העבר לעמודה
     if "datetime" not in out.columns:
         out = out.reset_index().rename(columns={"index": "datetime"})
 
-    # ודא ש-datetime הוא מחרוזת סטנדרטית
-    out["datetime"] = pd.to_datetime(out["datetime"], errors="coerce")
-    out["datetime"] = out["datetime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    # datetime נשמר כ-BSON date – בלי parsing של מחרוזות בקריאה
+    dts = pd.to_datetime(out["datetime"], errors="coerce").dt.to_pydatetime()
 
-    # כפיית טיפוסים מספריים
-    for col in ("open", "high", "low", "close", "volume"):
+    # כפיית טיפוסים מספריים; Mongo לא אוהב NaN -> None
+    values = {}
+    for col in OHLC_COLUMNS[1:]:
         if col in out.columns:
-            out[col] = out[col].astype(float)
+            arr = out[col].to_numpy(dtype=np.float64)
+            values[col] = [None if v != v else v for v in arr.tolist()]
 
-    # Mongo לא אוהב NaN/NaT -> המר ל-None
-    out = out.replace({np.nan: None})
-    return out.to_dict(orient="records")
+    return [
+        {"datetime": dt, **{col: vals[i] for col, vals in values.items()}}
+        for i, dt in enumerate(dts)
+    ]
 
-def _parse_dt(s: str) -> datetime:
-    # תומך גם ב-"YYYY-MM-DD HH:MM:SS" וגם ב-ISO עם Z
-    s = s.replace("Z", "")
-    try:
-        return datetime.fromisoformat(s)
-    except ValueError:
-        # fallback: אם יש רווח בין תאריך לשעה בלי T
-        try:
-            return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
-        except Exception:
-            # נסיון מינימלי – אם נכשל נחזיר כעת כדי לא להפיל
-            return datetime.now(timezone.utc)
+def _pack_candles(
+    df: pd.DataFrame,
+    float_dtype: Optional[str] = None,
+    compression: Optional[str] = None,
+) -> Dict[str, Any]:
+    """מקודד נרות (datetime + OHLCV) לשדה packed של bucket."""
+    float_dtype = float_dtype or settings.OHLC_PACKED_FLOAT_DTYPE
+    compression = compression or settings.OHLC_PACKED_COMPRESSION
+    ts = df["datetime"].to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    blobs = {"ts": np.diff(ts, prepend=np.int64(0)).astype("<i8").tobytes()}
+    for col in OHLC_COLUMNS[1:]:
+        values = df[col].to_numpy(dtype=np.float64) if col in df.columns else np.full(len(df), np.nan)
+        blobs[col] = values.astype(PACKED_DTYPES[float_dtype]).tobytes()
+    if compression == "zlib":
+        blobs = {k: zlib.compress(v, 6) for k, v in blobs.items()}
+    return {
+        "dtype": float_dtype,
+        "compression": compression,
+        **{k: Binary(v) for k, v in blobs.items()},
+    }
+
+def _unpack_candles(packed: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """הפעולה ההפוכה ל-_pack_candles: מחזיר עמודות numpy (datetime כ-datetime64[ms])."""
+    def raw(key: str) -> bytes:
+        data = bytes(packed[key])
+        return zlib.decompress(data) if packed.get("compression") == "zlib" else data
+
+    columns = {"datetime": np.cumsum(np.frombuffer(raw("ts"), dtype="<i8")).astype("datetime64[ms]")}
+    dtype = PACKED_DTYPES[packed.get("dtype", "float64")]
+    for col in OHLC_COLUMNS[1:]:
+        columns[col] = np.frombuffer(raw(col), dtype=dtype).astype(np.float64)
+    return columns
+
+def _bucket_columns(bucket: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """עמודות numpy מ-bucket בכל אחד מהפורמטים (candles או packed)."""
+    if bucket.get("fmt") == PACKED:
+        return _unpack_candles(bucket["packed"])
+    candles = bucket.get("candles") or []
+    columns = {"datetime": np.array([c["datetime"] for c in candles], dtype="datetime64[ms]")}
+    for col in OHLC_COLUMNS[1:]:
+        columns[col] = np.array([c.get(col) for c in candles], dtype=np.float64)
+    return columns
+
+def _bucket_doc(
+    symbol: str,
+    timeframe: str,
+    bucket_start: datetime,
+    group: pd.DataFrame,
+    fetched_at: str,
+    storage_format: Optional[str] = None,
+) -> Dict[str, Any]:
+    """דוקומנט bucket בפורמט שנבחר (ברירת מחדל: settings.OHLC_STORAGE_FORMAT)."""
+    doc = {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "bucket_start": bucket_start,
+        "bucket_end": group["datetime"].iloc[-1].to_pydatetime(),
+        "count": len(group),
+        "fetched_at": fetched_at,
+    }
+    if (storage_format or settings.OHLC_STORAGE_FORMAT) == PACKED:
+        doc["fmt"] = PACKED
+        doc["packed"] = _pack_candles(group)
+    else:
+        doc["candles"] = _df_to_records(group)
+    return doc
+
+def _bucket_starts(dts: pd.Series, timeframe: str) -> pd.Series:
+    """תחילת ה-bucket (יום/חודש/שנה) של כל נר, וקטורית."""
+    span = BUCKET_SPAN.get(timeframe, "month")
+    if span == "day":
+        return dts.dt.floor("D")
+    return dts.dt.to_period("M" if span == "month" else "Y").dt.start_time
+
+def _bucket_start(dt: datetime, timeframe: str) -> datetime:
+    return _bucket_starts(pd.Series([pd.Timestamp(dt)]), timeframe).iloc[0].to_pydatetime()
+
+def _to_ohlc_frame(ohlc: Union[pd.DataFrame, List[Dict[str, Any]]]) -> pd.DataFrame:
+    """DataFrame עם עמודת datetime (datetime64) ועמודות OHLCV, ממויין ובלי כפילויות."""
+    if isinstance(ohlc, pd.DataFrame):
+        df = ohlc.copy()
+        if "datetime" not in df.columns:
+            df = df.reset_index().rename(columns={"index": "datetime"})
+    else:
+        df = pd.DataFrame(ohlc or [])
+    if df.empty or "datetime" not in df.columns:
+        return pd.DataFrame(columns=list(OHLC_COLUMNS))
+
+    df["datetime"] = pd.to_datetime(df["datetime"], errors="coerce")
+    df = df.dropna(subset=["datetime"])
+    df = df.drop_duplicates(subset="datetime", keep="last")
+    return df.sort_values("datetime").reset_index(drop=True)
+
+def _shift_day(d: str, days: int) -> str:
+    return (date.fromisoformat(d) + timedelta(days=days)).isoformat()
+
+def _merge_ranges(ranges: List[List[str]]) -> List[List[str]]:
+    """ממזג טווחי תאריכים [start, end] (YYYY-MM-DD) חופפים או צמודים לרשימה ממויינת."""
+    merged: List[List[str]] = []
+    for r_start, r_end in sorted(ranges):
+        if merged and r_start <= _shift_day(merged[-1][1], 1):
+            merged[-1][1] = max(merged[-1][1], r_end)
+        else:
+            merged.append([r_start, r_end])
+    return merged
+
+def _missing_ranges(ranges: List[List[str]], start_d: str, end_d: str) -> List[Tuple[str, str]]:
+    """אילו חלקים מ-[start_d, end_d] לא מכוסים ע"י ranges (ממוזגים). כולל חורים באמצע."""
+    gaps: List[Tuple[str, str]] = []
+    cursor = start_d
+    for r_start, r_end in ranges:
+        if r_end < cursor:
+            continue
+        if r_start > end_d:
+            break
+        if r_start > cursor:
+            gaps.append((cursor, _shift_day(r_start, -1)))
+        cursor = _shift_day(r_end, 1)
+        if cursor > end_d:
+            return gaps
+    gaps.append((cursor, end_d))
+    return gaps
 
 # ---------- core ----------
 async def get_ohlc_from_db(
@@ -137,41 +280,97 @@ async def get_ohlc_from_db(
     end_date: Optional[str] = None,
 ) -> Optional[pd.DataFrame]:
     """
-    מחפש דוקומנט שמכסה לגמרי את הטווח [start_date, end_date] ל-symbol+timeframe.
+    בודק שהטווח [start_date, end_date] כבר נשמר ל-symbol+timeframe (ע"פ ohlc_coverage),
+    ואז קורא רק את ה-buckets שנחתכים עם הטווח (לפי האינדקס symbol/timeframe/bucket_start).
     אם נמצא -> מחזיר DataFrame מסונן לטווח המבוקש (ממויין לפי datetime).
     אם לא נמצא -> None.
     """
+    if await get_missing_ranges(symbol, timeframe, start_date, end_date):
+        return None
+    return await read_ohlc_range(symbol, timeframe, start_date, end_date)
+
+async def get_coverage(symbol: str, timeframe: str) -> List[List[str]]:
+    """טווחי התאריכים שכבר שמורים ל-symbol+timeframe, ממוזגים וממויינים."""
+    coverage = await ohlc_coverage.find_one({"symbol": symbol, "timeframe": timeframe})
+    return _merge_ranges((coverage or {}).get("ranges", []))
+
+async def get_missing_ranges(
+    symbol: str,
+    timeframe: str,
+    start_date: str,
+    end_date: Optional[str] = None,
+) -> List[Tuple[str, str]]:
+    """
+    מחזיר את הפערים (head / tail / חורים באמצע) שעוד לא נשמרו בטווח המבוקש,
+    כרשימת (start, end) בפורמט YYYY-MM-DD. רשימה ריקה -> הטווח מכוסה לגמרי.
+    """
     start_d = _iso_date_str(start_date)
     end_d = _iso_date_str(end_date or _utc_now_iso())
+    if start_d > end_d:
+        return []
+    ranges = await get_coverage(symbol, timeframe)
+    return _missing_ranges(ranges, start_d, end_d)
 
-    doc = await ohlc_collection.find_one({
-        "symbol": symbol,
-        "timeframe": timeframe,
-        "start_date": {"$lte": start_d},
-        "end_date": {"$gte": end_d},
-    })
-
-    if not doc:
-        return None
+async def read_ohlc_range(
+    symbol: str,
+    timeframe: str,
+    start_date: str,
+    end_date: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    קורא את הנרות השמורים בטווח [start_date, end_date] בלי לבדוק כיסוי –
+    מחזיר מה שיש (יכול להיות DataFrame ריק).
+    """
+    start_d = _iso_date_str(start_date)
+    end_d = _iso_date_str(end_date or _utc_now_iso())
 
-    candles: List[Dict[str, Any]] = doc.get("ohlc", [])
-    # חיתוך לטווח זמן
+    # חיתוך לטווח זמן – [start_dt, end_dt)
     start_dt = datetime.fromisoformat(start_d + "T00:00:00")
-    end_dt = datetime.fromisoformat(end_d + "T23:59:59")
-
-    filtered = [
-        c for c in candles
-        if "datetime" in c and start_dt <= _parse_dt(c["datetime"]) <= end_dt
+    end_dt = datetime.fromisoformat(end_d + "T00:00:00") + timedelta(days=1)
+
+    # החיתוך נעשה ב-Mongo ($filter), והנרות יוצאים כבר כעמודות (מערך לכל שדה).
+    # buckets בפורמט packed עוברים כמו שהם ונחתכים אחרי הפענוח (searchsorted על הזמנים)
+    pipeline = [
+        {"$match": {
+            "symbol": symbol,
+            "timeframe": timeframe,
+            "bucket_start": {"$gte": _bucket_start(start_dt, timeframe), "$lt": end_dt},
+        }},
+        {"$sort": {"bucket_start": 1}},
+        {"$project": {
+            "_id": 0,
+            "fmt": 1,
+            "packed": 1,
+            "candles": {"$filter": {
+                "input": "$candles",
+                "as": "c",
+                "cond": {"$and": [
+                    {"$gte": ["$$c.datetime", start_dt]},
+                    {"$lt": ["$$c.datetime", end_dt]},
+                ]},
+            }},
+        }},
+        {"$project": {"fmt": 1, "packed": 1, **{col: f"$candles.{col}" for col in OHLC_COLUMNS}}},
     ]
 
-    if not filtered:
-        return pd.DataFrame(columns=["datetime", "open", "high", "low", "close", "volume"])
-
-    df = pd.DataFrame(filtered)
-    # המרה ל-datetime ומיון
-    df["datetime"] = pd.to_datetime(df["datetime"], utc=False, errors="coerce")
-    df = df.sort_values("datetime").reset_index(drop=True)
-    return df
+    chunks: Dict[str, List[np.ndarray]] = {col: [] for col in OHLC_COLUMNS}
+    start_ms, end_ms = np.datetime64(start_dt, "ms"), np.datetime64(end_dt, "ms")
+    async for bucket in ohlc_buckets.aggregate(pipeline):
+        if bucket.get("fmt") == PACKED:
+            columns = _unpack_candles(bucket["packed"])
+            lo, hi = np.searchsorted(columns["datetime"], [start_ms, end_ms], side="left")
+            for col in OHLC_COLUMNS:
+                chunks[col].append(columns[col][lo:hi])
+        elif bucket.get("datetime"):
+            chunks["datetime"].append(np.array(bucket["datetime"], dtype="datetime64[ms]"))
+            for col in OHLC_COLUMNS[1:]:
+                chunks[col].append(np.array(bucket.get(col) or [], dtype=np.float64))
+
+    if not chunks["datetime"]:
+        return pd.DataFrame(columns=list(OHLC_COLUMNS))
+
+    # buckets ממויינים וכל bucket ממויין -> אין צורך במיון נוסף
+    return pd.DataFrame({col: np.concatenate(chunks[col]) for col in OHLC_COLUMNS})
 
 async def save_ohlc_to_db(
     symbol: str,
@@ -179,47 +378,64 @@ async def save_ohlc_to_db(
     start_date: str,
     end_date: str,
     ohlc: List[Dict[str, Any]],
+    mark_covered: bool = True,
 ) -> None:
     """
-    שומר/מעדכן דוקומנט בפורמט:
+    מפצל את הנרות ל-buckets ושומר/מעדכן דוקומנט לכל bucket בפורמט:
     {
-      symbol, timeframe, start_date, end_date, ohlc: [...], fetched_at
+      symbol, timeframe, bucket_start, bucket_end, count, candles: [...], fetched_at
     }
-    ה-upsert מבוסס על (symbol,timeframe,start_date).
+    כל נר נשמר עם datetime כ-BSON date (לא מחרוזת), כדי שהקריאה תחתוך טווחים בתוך Mongo.
+    עם OHLC_STORAGE_FORMAT=packed, במקום candles נשמר packed: {ts, open, ..., dtype, compression}
+    (ראה _pack_candles).
+    נרות שכבר קיימים ב-bucket נשמרים וממוזגים (הנר החדש גובר על ישן באותו datetime).
+    ה-upsert מבוסס על (symbol,timeframe,bucket_start), והטווח [start_date, end_date]
+    ממוזג לטווחים שב-ohlc_coverage (אלא אם mark_covered=False, למשל ליום מסחר שעוד לא נסגר).
     """
-# document = {
-#     "symbol": "AAPL",
-#     "timeframe": "1h",
-#     "start_date": "2021-01-04",
-#     "end_date": "2025-08-19",
-#     "ohlc": ohlc_data,   # כאן נכנס כל התוכן של הקובץ
-#     "fetched_at": datetime.utcnow().isoformat()
-# }
-
-    if isinstance(ohlc, pd.DataFrame):
-        ohlc_records = _df_to_records(ohlc)
-    else:
-        # נניח שכבר list[dict]
-        ohlc_records = ohlc
-    
-    end_date_str = datetime.fromisoformat(end_date).date().isoformat()
-
-    payload = {
-        "symbol": symbol,
-        "timeframe": timeframe,
-        "start_date": _iso_date_str(start_date),
-        "end_date": end_date_str,
-        "ohlc": ohlc_records,
-        "fetched_at": _utc_now_iso(),
-    }
-
-    await save_ohlc(payload)
-
-    # await ohlc_collection.update_one(
-    #     {"symbol": payload["symbol"], "timeframe": payload["timeframe"], "start_date": payload["start_date"]},
-    #     {"$set": payload},
-    #     upsert=True,
-    # )
+    df = _to_ohlc_frame(ohlc)
+    start_d = _iso_date_str(start_date)
+    end_d = _iso_date_str(end_date)
+    fetched_at = _utc_now_iso()
+
+    if not df.empty:
+        df["bucket_start"] = _bucket_starts(df["datetime"], timeframe)
+        first_bucket = df["bucket_start"].iloc[0].to_pydatetime()
+        last_bucket = df["bucket_start"].iloc[-1].to_pydatetime()
+
+        # מיזוג עם נרות שכבר שמורים ב-buckets האלה
+        existing: List[pd.DataFrame] = []
+        async for bucket in ohlc_buckets.find(
+            {
+                "symbol": symbol,
+                "timeframe": timeframe,
+                "bucket_start": {"$gte": first_bucket, "$lte": last_bucket},
+            },
+            {"_id": 0, "candles": 1, "fmt": 1, "packed": 1},
+        ):
+            existing.append(pd.DataFrame(_bucket_columns(bucket)))
+        if existing:
+            merged = pd.concat(existing + [df.drop(columns="bucket_start")])
+            df = _to_ohlc_frame(merged)
+            df["bucket_start"] = _bucket_starts(df["datetime"], timeframe)
+
+        ops = []
+        for bucket_start, group in df.groupby("bucket_start", sort=True):
+            bucket_start = bucket_start.to_pydatetime()
+            ops.append(ReplaceOne(
+                {"symbol": symbol, "timeframe": timeframe, "bucket_start": bucket_start},
+                _bucket_doc(symbol, timeframe, bucket_start, group.drop(columns="bucket_start"), fetched_at),
+                upsert=True,
+            ))
+        await ohlc_buckets.bulk_write(ops, ordered=False)
+
+    # גם בלי נרות: טווח סגור שהספק ענה עליו ריק (חג, עצירת מסחר) הוא כיסוי – לא מושכים אותו שוב
+    if mark_covered and start_d <= end_d:
+        ranges = _merge_ranges(await get_coverage(symbol, timeframe) + [[start_d, end_d]])
+        await ohlc_coverage.update_one(
+            {"symbol": symbol, "timeframe": timeframe},
+            {"$set": {"ranges": ranges, "updated_at": fetched_at}},
+            upsert=True,
+        )
 
 if __name__ == "__main__":
     asyncio.run(test_db())
@@ -0,0 +1,73 @@
+"""
+בניית timeframe גס (למשל 1h / 1d) מהנרות העדינים ביותר ששמורים (למשל 5m),
+במקום להוריד ולשמור כל timeframe בנפרד.
+האגרגציה וקטורית, ונרות לא חוצים גבול של יום מסחר: נר שעתי מתחיל בפתיחת המסחר (09:30) ולא בשעה עגולה.
+"""
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+# אורך נר בשניות. 1M הוא קלנדרי (נבנה לפי חודש) – הערך כאן רק לסדר בין timeframes.
+TIMEFRAME_SECONDS = {
+    "1m": 60, "5m": 300, "15m": 900, "60m": 3600,
+    "1h": 3600, "1d": 86400, "1w": 604800, "1M": 2592000,
+}
+INTRADAY = {"1m", "5m", "15m", "60m", "1h"}
+
+# פתיחת המסחר (זמן הבורסה, כמו שהספק מחזיר) – נרות תוך-יומיים מיושרים אליה
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+
+_AGG = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+
+
+def can_resample(source_tf: str, target_tf: str) -> bool:
+    """האם אפשר לבנות את target_tf מ-source_tf בלי לאבד דיוק."""
+    if source_tf not in TIMEFRAME_SECONDS or target_tf not in TIMEFRAME_SECONDS:
+        return False
+    src, dst = TIMEFRAME_SECONDS[source_tf], TIMEFRAME_SECONDS[target_tf]
+    if src >= dst:
+        return False
+    if target_tf in INTRADAY or target_tf == "1d":
+        return dst % src == 0
+    # שבועי/חודשי נבנים קלנדרית – מספיק שהמקור הוא יומי או עדין יותר
+    return src <= TIMEFRAME_SECONDS["1d"]
+
+
+def source_timeframes(target_tf: str) -> List[str]:
+    """timeframes שמהם אפשר לגזור את target_tf, מהגס לעדין (פחות שורות לאגרגציה קודם)."""
+    candidates = [tf for tf in TIMEFRAME_SECONDS if tf != "60m" and can_resample(tf, target_tf)]
+    return sorted(candidates, key=lambda tf: TIMEFRAME_SECONDS[tf], reverse=True)
+
+
+def _bucket_labels(dts: pd.Series, target_tf: str) -> np.ndarray:
+    """תחילת הנר המאוגד של כל שורה – חשבון int64 על ns, בלי לולאה."""
+    day = dts.dt.floor("D")
+    if target_tf in INTRADAY:
+        step = np.int64(TIMEFRAME_SECONDS[target_tf] * 1_000_000_000)
+        session_start = (day + SESSION_OPEN).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        offset = dts.to_numpy(dtype="datetime64[ns]").astype(np.int64) - session_start
+        # floor division גם לנרות pre-market (offset שלילי) – עדיין בתוך אותו יום
+        labels = session_start + (offset // step) * step
+        return labels.astype("datetime64[ns]")
+    if target_tf == "1d":
+        return day.to_numpy(dtype="datetime64[ns]")
+    if target_tf == "1w":
+        return (day - pd.to_timedelta(day.dt.dayofweek, unit="D")).to_numpy(dtype="datetime64[ns]")
+    return day.dt.to_period("M").dt.start_time.to_numpy(dtype="datetime64[ns]")
+
+
+def resample_ohlc(df: pd.DataFrame, target_tf: str) -> pd.DataFrame:
+    """
+    df: עמודת datetime + OHLCV, ממויין לפי datetime (כמו ש-read_ohlc_range מחזיר).
+    מחזיר DataFrame באותו פורמט ב-target_tf; datetime של כל נר = תחילת הנר.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=["datetime", "open", "high", "low", "close", "volume"])
+
+    labels = _bucket_labels(pd.to_datetime(df["datetime"]), target_tf)
+    cols = {col: agg for col, agg in _AGG.items() if col in df.columns}
+    out = df[list(cols)].groupby(labels, sort=True).agg(cols)
+    out.index.name = "datetime"
+    return out.reset_index()
+
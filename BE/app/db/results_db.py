@@ -0,0 +1,33 @@
+"""
+שמירת תוצאות backtest ב-Mongo (persistence אופציונלי ל-cache של התוצאות, ראה services/result_cache.py).
+דוקומנט לכל key: hash של האסטרטגיה + גרסת הנתונים, כך שתוצאה ישנה פשוט לא נמצאת אחרי שנוספו נרות.
+"""
+from typing import Any, Dict, Optional
+
+from .ohlc_db import db, _utc_now_iso
+
+backtest_results = db['backtest_results']
+
+
+async def ensure_result_indexes() -> None:
+    await backtest_results.create_index([("key", 1)], name="key", unique=True)
+    await backtest_results.create_index([("symbol", 1)], name="symbol")
+
+
+async def get_result(key: str) -> Optional[Dict[str, Any]]:
+    doc = await backtest_results.find_one({"key": key}, {"_id": 0, "result": 1})
+    return doc["result"] if doc else None
+
+
+async def save_result(key: str, symbol: str, timeframe: str, result: Dict[str, Any]) -> None:
+    """result חייב להיות JSON-ready (בלי Timestamp / numpy)."""
+    await backtest_results.replace_one(
+        {"key": key},
+        {"key": key, "symbol": symbol, "timeframe": timeframe, "result": result, "created_at": _utc_now_iso()},
+        upsert=True,
+    )
+
+
+async def delete_results(symbol: str) -> int:
+    res = await backtest_results.delete_many({"symbol": symbol})
+    return res.deleted_count
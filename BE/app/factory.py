@@ -1,12 +1,40 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .settings import settings
 from .routers import strategies
 from .routers import run
+from .routers import jobs
 from .sockets import stream
+from .db.ohlc_db import ensure_indexes
+from .db.results_db import ensure_result_indexes
+from .services.http_clients import close_clients, pool_stats
+from .services.cpu_pool import shutdown_pool
+from .services.jobs import job_queue
+from .services.result_cache import result_cache_stats
+from .services.fin_apis.scheduler import scheduler_stats
+from .services.fin_apis.providers import market_data
+from .services.metrics import REGISTRY, start_breakdown, stop_breakdown, server_timing
+
+REGISTRY.gauge("backtest_jobs_queued", "Backtest jobs waiting for a worker", lambda: job_queue.queue_depth)
+REGISTRY.gauge("backtest_result_cache_entries", "Per-stock results held in memory", lambda: result_cache_stats()["entries"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ensure_indexes()
+        await ensure_result_indexes()
+    except Exception as e:
+        print(f"❌ Could not create MongoDB indexes: {e}")
+    yield
+    await job_queue.shutdown()
+    await close_clients()
+    shutdown_pool()
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="AI Trader Backend", version="0.1.0")
+    app = FastAPI(title="AI Trader Backend", version="0.1.0", lifespan=lifespan)
 
     app.add_middleware(
         CORSMiddleware,
@@ -14,11 +42,26 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing"],
     )
 
+    if settings.DEBUG_TIMINGS:
+        # breakdown של זמני השלבים בכל בקשה (load_ohlc / indicators / provider... – סכום על כל המניות) ב-Server-Timing
+        @app.middleware("http")
+        async def timing_breakdown(request: Request, call_next):
+            breakdown, token = start_breakdown()
+            started = time.perf_counter()
+            try:
+                response = await call_next(request)
+            finally:
+                stop_breakdown(token)
+            response.headers["Server-Timing"] = server_timing(breakdown, time.perf_counter() - started)
+            return response
+
     # Routers
     app.include_router(strategies.router, prefix="/api")
     app.include_router(run.router, prefix="/api")
+    app.include_router(jobs.router, prefix="/api")
     # WebSocket endpoint (registered as route function)
     app.add_api_websocket_route("/ws/stream", stream.stream_endpoint)
 
@@ -26,4 +69,20 @@ def create_app() -> FastAPI:
     def health():
         return {"ok": True}
 
+    @app.get("/health/http")
+    def http_pools():
+        return pool_stats()
+
+    @app.get("/health/providers")
+    def providers():
+        return {**scheduler_stats(), "routing": market_data.stats()}
+
+    @app.get("/health/cache")
+    def result_cache():
+        return result_cache_stats()
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
     return app
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Any, List, Optional, Literal
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Any, Dict, List, Optional, Literal, Union
 from datetime import date
 
 class Strategy(BaseModel):
@@ -35,14 +35,21 @@ class IndicatorRule(BaseModel):
     params: dict = Field(default_factory=dict)  # לדוג' period, fast, slow וכו'
     operator: OperatorType
     value: float
-    value2: Optional[float] = None  # עבור טווח
-    compare_to: Optional[Literal["price","sma","ema","none"]] = "none"
-    compare_period: Optional[int] = None
+    value2: Optional[float] = None  # עבור טווח: בין value ל-value2 (crossesAbove = נכנס לטווח, crossesBelow = יוצא ממנו)
+    compare_to: Optional[Literal["price","sma","ema","none"]] = "none"  # price / sma / ema במקום value
+    compare_period: Optional[int] = None  # period של ה-sma / ema ב-compare_to
+
+class RuleGroup(BaseModel):
+    """קבוצת חוקים מקוננת: {"op": "or", "rules": [rule, {"op": "and", "rules": [...]}]}"""
+    op: Literal["and","or"] = "and"
+    rules: List[Union[IndicatorRule, "RuleGroup"]]
+
+RuleGroup.model_rebuild()
 
 class ExitCondition(BaseModel):
     type: Literal["take_profit","stop_loss","indicator"]
     value: Optional[float] = None
-    indicator_rule: Optional[IndicatorRule] = None
+    indicator_rule: Optional[Union[IndicatorRule, RuleGroup]] = None
 
 class StockStrategy(BaseModel):
     symbol: str
@@ -52,8 +59,66 @@ class StockStrategy(BaseModel):
     start_date: Optional[date] = None
     end_date: Optional[date] = None
     since_ipo: bool = False
-    entry_rules: List[IndicatorRule]
-    exit_conditions: List[ExitCondition]
+    entry_rules: List[Union[IndicatorRule, RuleGroup]]  # AND בין החוקים (RuleGroup לקבוצות OR / מקוננות)
+    exit_conditions: List[ExitCondition]  # OR בין תנאי היציאה
 
 class BacktestRequest(BaseModel):
     stocks: List[StockStrategy]
+
+class SweepRange(BaseModel):
+    start: float
+    stop: float  # כולל
+    step: float
+
+class SweepRequest(BaseModel):
+    stock: StockStrategy  # אסטרטגיית הבסיס
+    # נתיב לשדה באסטרטגיה -> ערכים, למשל:
+    # "entry_rules.0.params.period": [7, 14, 21]
+    # "entry_rules.0.value": {"start": 20, "stop": 40, "step": 5}
+    # "exit_conditions.1.value": [10, 20, 30]
+    grid: Dict[str, Union[List[Any], SweepRange]]
+    rank_by: str = "total_profit"
+    ascending: Optional[bool] = None  # None = לפי המדד (loss_rate / drawdown מהנמוך לגבוה, השאר מהגבוה לנמוך)
+    top: Optional[int] = None  # None = כל השילובים
+
+class WalkForwardRequest(BaseModel):
+    stock: StockStrategy
+    # אותו grid כמו ב-SweepRequest; ריק = בלי אופטימיזציה, רק בדיקה של האסטרטגיה כמו שהיא בכל חלון
+    grid: Dict[str, Union[List[Any], SweepRange]] = Field(default_factory=dict)
+    in_sample_bars: int = Field(gt=0)      # חלון האופטימיזציה
+    out_of_sample_bars: int = Field(gt=0)  # חלון הבדיקה שאחריו
+    step_bars: Optional[int] = Field(default=None, gt=0)  # None = out_of_sample_bars (חלונות בדיקה רצופים)
+    anchored: bool = False  # True = חלון האופטימיזציה תמיד מתחיל בבר הראשון
+    rank_by: str = "total_profit"
+    ascending: Optional[bool] = None  # כמו ב-SweepRequest
+
+    @model_validator(mode="after")
+    def _no_overlapping_oos(self):
+        # step קטן מחלון הבדיקה -> חלונות OOS חופפים, והעסקאות המחוברות סופרות את אותם ברים פעמיים
+        if self.step_bars is not None and self.step_bars < self.out_of_sample_bars:
+            raise ValueError("step_bars must be >= out_of_sample_bars (out-of-sample windows may not overlap)")
+        return self
+
+class PortfolioBacktestRequest(BaseModel):
+    stocks: List[StockStrategy]  # investment של כל מניה = גודל הפוזיציה המקסימלי שלה
+    capital: float = Field(gt=0)  # קופה אחת משותפת לכל המניות
+    max_position_pct: float = Field(default=1.0, gt=0, le=1)  # פוזיציה אחת לא יותר מ-% מה-equity
+    max_positions: Optional[int] = Field(default=None, gt=0)  # מקסימום פוזיציות פתוחות במקביל
+
+class RobustnessRequest(BaseModel):
+    # או אסטרטגיה (מריצים backtest ולוקחים את העסקאות), או trades מתוצאה קודמת (מספיק שיש pnl)
+    stock: Optional[StockStrategy] = None
+    trades: Optional[List[Dict[str, Any]]] = None
+    start_capital: Optional[float] = Field(default=None, gt=0)  # ברירת מחדל: investment של המניה
+    simulations: int = Field(default=10000, gt=0, le=200000)
+    method: Literal["bootstrap", "reshuffle"] = "bootstrap"  # דגימה עם החזרה / סדר אקראי של אותן עסקאות
+    percentiles: List[float] = Field(default_factory=lambda: [5, 25, 50, 75, 95])
+    seed: Optional[int] = None
+
+    @field_validator("percentiles")
+    @classmethod
+    def _percentiles_in_range(cls, v: List[float]) -> List[float]:
+        # np.percentile זורק על ערך מחוץ ל-[0, 100] – עדיף 422 על הבקשה מאשר 500 מה-worker
+        if any(p < 0 or p > 100 for p in v):
+            raise ValueError("percentiles must be between 0 and 100")
+        return v
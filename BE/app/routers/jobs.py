@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Request
+from ..models import BacktestRequest
+from ..services.jobs import job_queue, JobLimitExceeded, DONE
+from ..settings import settings
+
+router = APIRouter(tags=["jobs"])
+
+def _get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+def _client_id(request: Request) -> str:
+    """
+    מזהה הלקוח ל-JOB_MAX_PER_CLIENT. מאחורי proxy כל הבקשות מגיעות מה-IP של ה-proxy –
+    עם TRUST_PROXY_HEADERS לוקחים את הלקוח המקורי מה-headers שה-proxy מוסיף.
+    """
+    if settings.TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for") or request.headers.get("x-real-ip")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else ""
+
+@router.post("/strategies-test/jobs", status_code=202)
+async def submit_backtest(req: BacktestRequest, request: Request):
+    """
+    מכניס backtest לתור ומחזיר job_id מיד.
+    את ההתקדמות בודקים ב-GET /jobs/{job_id} ואת התוצאות ב-GET /jobs/{job_id}/results
+    """
+    owner = _client_id(request)
+    try:
+        job = job_queue.submit(req.stocks, owner)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.info()
+
+@router.get("/jobs")
+async def jobs_stats():
+    return job_queue.stats()
+
+@router.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return _get_job(job_id).info()
+
+@router.get("/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """התוצאות לפי סדר המניות בבקשה; כל עוד העבודה לא הסתיימה – 409"""
+    job = _get_job(job_id)
+    if job.status != DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return {**job.info(), "results": job.results}
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """מבטל עבודה שממתינה בתור או רצה"""
+    _get_job(job_id)
+    return job_queue.cancel(job_id).info()
@@ -1,7 +1,16 @@
-from fastapi import APIRouter
-from typing import Dict
-from ..models import Strategy, StrategyCreateResponse, BacktestRequest
-from ..services.backtest import run_backtest
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import Dict, Literal, Optional
+from ..models import Strategy, StrategyCreateResponse, BacktestRequest, SweepRequest, WalkForwardRequest, PortfolioBacktestRequest, RobustnessRequest
+from ..services.backtest import run_backtest, stream_backtest
+from ..services.sweep import run_sweep
+from ..services.walk_forward import run_walk_forward
+from ..services.portfolio import run_portfolio_backtest
+from ..services.robustness import monte_carlo
+from ..services.cpu_pool import run_cpu
+from ..services.serialization import (
+    dumps, columnar_result, arrow_results, pa, JSON_MEDIA_TYPE, COLUMNAR_MEDIA_TYPE, ARROW_MEDIA_TYPE,
+)
 
 router = APIRouter(tags=["strategies"])
 
@@ -18,10 +27,93 @@ def get_strategy(sid: str):
     return STRATS.get(sid) or {}
 
 @router.post("/strategies-test")
-async def backtest(req: BacktestRequest):
+async def backtest(req: BacktestRequest, request: Request, format: Optional[Literal["json", "columnar", "arrow"]] = None):
     """
     מקבל רשימת מניות עם אינדיקטורים ותנאי כניסה ויציאה
-    ומחזיר רשימת עסקאות JSON עם מחיר כניסה/יציאה, כמות ורווח
+    ומחזיר רשימת עסקאות JSON עם מחיר כניסה/יציאה, כמות ורווח.
+    פורמט: ?format=json|columnar|arrow, או לפי Accept (application/vnd.columnar+json / application/vnd.apache.arrow.stream)
     """
+    if format is None:
+        accept = request.headers.get("accept", "")
+        format = "arrow" if ARROW_MEDIA_TYPE in accept else "columnar" if COLUMNAR_MEDIA_TYPE in accept else "json"
+    if format == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow format requires pyarrow")
+
     results = await run_backtest(req.stocks)
-    return {"results": results}
+    headers = {"Vary": "Accept"}
+    if format == "arrow":
+        return Response(arrow_results(results), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    if format == "columnar":
+        body = dumps({"format": "columnar", "results": [columnar_result(r) for r in results]})
+        return Response(body, media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
+    return Response(dumps({"results": results}), media_type=JSON_MEDIA_TYPE, headers=headers)
+
+@router.post("/strategies-test/stream")
+async def backtest_stream(req: BacktestRequest, request: Request, format: Optional[Literal["ndjson", "sse"]] = None):
+    """
+    כמו /strategies-test, אבל מזרים את התוצאה של כל מניה ברגע שהיא מוכנה (+ אירועי progress).
+    NDJSON (שורת JSON לכל אירוע) כברירת מחדל; Server-Sent Events עם ?format=sse או Accept: text/event-stream
+    """
+    sse = format == "sse" or (format is None and "text/event-stream" in request.headers.get("accept", ""))
+
+    async def events():
+        async for event in stream_backtest(req.stocks):
+            data = dumps(event).decode()
+            yield f"event: {event['type']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/strategies-portfolio")
+async def portfolio_backtest(req: PortfolioBacktestRequest):
+    """
+    backtest על כל המניות עם קופה אחת משותפת (capital): כניסה רק כשיש כסף פנוי,
+    בגבולות max_position_pct / max_positions
+    """
+    return await run_portfolio_backtest(req)
+
+@router.post("/strategies-robustness")
+async def robustness(req: RobustnessRequest):
+    """
+    Monte Carlo (bootstrap / reshuffle) על העסקאות של backtest:
+    פיזור של הון סופי, max drawdown ו-win rate עם אחוזונים
+    """
+    trades = req.trades
+    if trades is None and req.stock is not None:
+        try:
+            trades = (await run_backtest([req.stock]))[0]["trades"]
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Backtest for {req.stock.symbol} failed: {e}")
+    if not trades:
+        raise HTTPException(status_code=400, detail="No trades to simulate (send stock or trades)")
+    start_capital = req.start_capital or (req.stock.investment if req.stock else None)
+    if start_capital is None:
+        raise HTTPException(status_code=400, detail="start_capital is required when sending trades")
+
+    pnl = [float(t["pnl"]) for t in trades]
+    return await run_cpu(monte_carlo, pnl, start_capital, req.simulations, req.method, req.percentiles, req.seed)
+
+@router.post("/strategies-sweep")
+async def sweep(req: SweepRequest):
+    """
+    מריץ את אותה אסטרטגיה על כל שילובי הפרמטרים ב-grid (period / value / TP / SL...)
+    ומחזיר טבלה מדורגת לפי rank_by
+    """
+    try:
+        return await run_sweep(req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/strategies-walk-forward")
+async def walk_forward(req: WalkForwardRequest):
+    """
+    אופטימיזציה על חלון in-sample, בדיקה על החלון שאחריו, וגלגול קדימה.
+    מחזיר תוצאה לכל חלון + סיכום של כל עסקאות ה-out-of-sample ברצף
+    """
+    try:
+        return await run_walk_forward(req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
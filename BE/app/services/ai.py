@@ -3,6 +3,8 @@ import re
 import httpx
 from typing import Dict, Any
 from ..settings import settings
+from .http_clients import get_client
+from .metrics import AI_SECONDS, AI_REQUESTS
 from groq import Groq  # Add this import for Groq SDK
 
 # מחלץ את ה-JSON מהתשובה גם אם המודל יספר "סיפור" מסביב
@@ -62,23 +64,23 @@ def _safe_parse_json(text: str) -> Dict[str, Any]:
         return {"action":"hold","confidence":0.1,"reason":"parse-failed","stop_loss":None,"take_profit":None}
 
 async def _call_groq(system: str, user: str) -> Dict[str, Any]:
-    async with httpx.AsyncClient(timeout=60) as c:
-        r = await c.post(
-            settings.AI_ENDPOINT,
-            headers={"Authorization": f"Bearer {settings.AI_API_KEY}"},
-            json={
-                "model": settings.AI_MODEL,
-                "messages": [
-                    {"role": "system", "content": system},
-                    {"role": "user", "content": user}
-                ],
-                "temperature": 0.2
-            }
-        )
-        r.raise_for_status()
-        data = r.json()
-        text = (data.get("choices") or [{}])[0].get("message",{}).get("content","")
-        return _safe_parse_json(text)
+    c = get_client(settings.AI_ENDPOINT, timeout=60)
+    r = await c.post(
+        settings.AI_ENDPOINT,
+        headers={"Authorization": f"Bearer {settings.AI_API_KEY}"},
+        json={
+            "model": settings.AI_MODEL,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": user}
+            ],
+            "temperature": 0.2
+        }
+    )
+    r.raise_for_status()
+    data = r.json()
+    text = (data.get("choices") or [{}])[0].get("message",{}).get("content","")
+    return _safe_parse_json(text)
     
 
 async def _call_openrouter(system: str, user: str) -> Dict[str, Any]:
@@ -92,10 +94,9 @@ async def _call_openrouter(system: str, user: str) -> Dict[str, Any]:
         "temperature": 0.2
     }
     endpoint = settings.AI_ENDPOINT  # למשל https://openrouter.ai/api/v1/chat/completions
-    async with httpx.AsyncClient(timeout=60) as c:
-        r = await c.post(endpoint, headers=headers, json=payload)
-        r.raise_for_status()
-        data = r.json()
+    r = await get_client(endpoint, timeout=60).post(endpoint, headers=headers, json=payload)
+    r.raise_for_status()
+    data = r.json()
     text = (data.get("choices") or [{}])[0].get("message",{}).get("content","")
     return _safe_parse_json(text)
 
@@ -105,10 +106,9 @@ async def _call_ollama(system: str, user: str) -> Dict[str, Any]:
         "prompt": system + "\n\n" + user,
         "stream": False
     }
-    async with httpx.AsyncClient(timeout=120) as c:
-        r = await c.post(settings.OLLAMA_ENDPOINT, json=payload)
-        r.raise_for_status()
-        data = r.json()
+    r = await get_client(settings.OLLAMA_ENDPOINT, timeout=120).post(settings.OLLAMA_ENDPOINT, json=payload)
+    r.raise_for_status()
+    data = r.json()
     # Ollama: השדה בד"כ "response"
     text = data.get("response","")
     return _safe_parse_json(text)
@@ -119,14 +119,19 @@ async def ask_ai_free(symbol: str, tf: str, o: float, h: float, l: float, c: flo
     """נקודת כניסה אחידה – בוחר ספק לפי settings.AI_PROVIDER"""
     user = build_user_prompt(symbol, tf, o,h,l,c, ind, closes, rules, amount, max_loss)
     provider = settings.AI_PROVIDER.lower()
-    try:
-        if provider == "groq":
-            return await _call_groq(SYSTEM_PROMPT, user)
-        elif provider == "openrouter":
-            return await _call_openrouter(SYSTEM_PROMPT, user)
-        elif provider == "ollama":
-            return await _call_ollama(SYSTEM_PROMPT, user)
-        else:
-            return {"action":"hold","confidence":0.1,"reason":f"unknown-provider:{provider}","stop_loss":None,"take_profit":None}
-    except Exception as e:
-        return {"action":"hold","confidence":0.1,"reason":f"ai-error:{e}","stop_loss":None,"take_profit":None}
+    with AI_SECONDS.time(provider=provider):
+        try:
+            if provider == "groq":
+                decision = await _call_groq(SYSTEM_PROMPT, user)
+            elif provider == "openrouter":
+                decision = await _call_openrouter(SYSTEM_PROMPT, user)
+            elif provider == "ollama":
+                decision = await _call_ollama(SYSTEM_PROMPT, user)
+            else:
+                AI_REQUESTS.inc(provider=provider, outcome="error")
+                return {"action":"hold","confidence":0.1,"reason":f"unknown-provider:{provider}","stop_loss":None,"take_profit":None}
+        except Exception as e:
+            AI_REQUESTS.inc(provider=provider, outcome="error")
+            return {"action":"hold","confidence":0.1,"reason":f"ai-error:{e}","stop_loss":None,"take_profit":None}
+    AI_REQUESTS.inc(provider=provider, outcome="ok")
+    return decision
@@ -1,56 +1,234 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Dict
+from datetime import datetime, timedelta, date, timezone
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 import httpx
+import numpy as np
 import pandas as pd
 import time
 
 from .fin_apis.twelve_data import fetch_ohlc_twelve_data, fetch_ohlc_twelve_data_5000, json_file_to_df
-from .indicators.calc_indicators import calculate_indicators, calculate_exit_indicators
-from .check_entry import check_entry_conditions, check_exit_conditions
-from .process_trades import process_trades, summarize_trades
+from .compute import compute_signals, backtest_stock  # noqa: F401 (compute_signals re-export)
+from .metrics import (
+    BACKTEST_STAGE_SECONDS, BACKTEST_BARS, BACKTEST_STOCKS, OHLC_LOADS, RESULT_CACHE_LOOKUPS, record_stages,
+)
+from .cpu_pool import run_cpu
+from .result_cache import result_key, get_cached_result, put_cached_result, invalidate_results
 from ..models import StockStrategy, BacktestRequest
 from ..settings import settings
-from ..db.ohlc_db import test_db, get_ohlc_from_db, save_ohlc_to_db
+from ..db.ohlc_db import test_db, get_ohlc_from_db, save_ohlc_to_db, get_missing_ranges, read_ohlc_range
+from ..db.ohlc_cache import get_ohlc_from_cache, save_ohlc_to_cache, invalidate_cache
+from ..db.ohlc_resample import resample_ohlc, source_timeframes
+from .fin_apis.scheduler import single_flight, PRIORITY_INTERACTIVE
+from .fin_apis.providers import market_data
 
 ALPHA_VANTAGE_API = settings.FINNHUB_API_KEY  # או API Key שלך ל-Alpha Vantage
 
 
-async def run_backtest(stocks: List[StockStrategy]):
-    results = []
-
-    for stock in stocks:
-        start_date = stock.start_date.isoformat() if stock.start_date else "1900-01-01"
-        end_date = stock.end_date.isoformat() if stock.end_date else datetime.now().isoformat()
-        ohlc = await get_ohlc_from_db(stock.symbol, stock.timeframe, start_date, end_date)
-        if ohlc is None or ohlc.empty:
-            ohlc = await fetch_ohlc_twelve_data_5000(stock.symbol, stock.timeframe, start_date)
-            await save_ohlc_to_db(stock.symbol, stock.timeframe, start_date, end_date, ohlc)
-        # ohlc = json_file_to_df()
-        # candles = ohlc.to_json()
-        ohlc = calculate_indicators(ohlc, stock.entry_rules, stock.timeframe)
-        ohlc = calculate_exit_indicators(ohlc, stock.exit_conditions, stock.timeframe)
-        ohlc = check_entry_conditions(ohlc, stock.entry_rules)
-        ohlc = check_exit_conditions(ohlc, stock.exit_conditions)
-        ohlc, trades = await process_trades(ohlc, stock)
-        
-        # TODO: אם נכנס -> צור עסקה buy
-        # TODO: בדוק תנאי יציאה -> צור עסקה sell
-        # TODO: שמור רווח/הפסד
-
-        summary = summarize_trades(trades, stock.investment)
-
-        results.append({
-            "symbol": stock.symbol,
-            "trades": trades,
-            "summary": summary,
-            # "data": candles,  # TODO: remove this line if makes this heavy
-        })
-
-        # break # TODO: delete it. the json file has NVDA info and it make fail
+async def load_ohlc(
+    symbol: str, timeframe: str, start_date: str, end_date: str, priority: int = PRIORITY_INTERACTIVE,
+) -> pd.DataFrame:
+    """
+    כמו _load_ohlc, אבל קריאות מקבילות לאותו symbol/timeframe/טווח חולקות טעינה אחת.
+    כל קורא מקבל עותק משלו של ה-DataFrame.
+    priority: עדיפות המשיכות מהספק (PRIORITY_BACKGROUND לעבודות רקע – הן מחכות לבקשות אינטראקטיביות).
+    """
+    ohlc = await single_flight(
+        ("load_ohlc", symbol, timeframe, start_date[:10], end_date[:10]),
+        lambda: _load_ohlc(symbol, timeframe, start_date, end_date, priority),
+    )
+    return ohlc.copy()
+
+
+async def _load_ohlc(
+    symbol: str, timeframe: str, start_date: str, end_date: str, priority: int = PRIORITY_INTERACTIVE,
+) -> pd.DataFrame:
+    """
+    מחזיר OHLC לטווח המבוקש: קודם מה-cache המקומי, אחר כך מה-DB אם ה-timeframe כבר שמור לכל הטווח,
+    אחר כך גזירה מ-timeframe עדין יותר שכבר שמור, ואחרת מה-DB אחרי שמשלים מהספק רק את הפערים
+    שעוד לא נשמרו (head / tail / חורים באמצע) – במקום להוריד מחדש את כל ההיסטוריה.
+    """
+    # קבצי ה-cache ו-index.json נקראים/נכתבים ב-thread – לא חוסמים את ה-event loop
+    cached = await asyncio.to_thread(get_ohlc_from_cache, symbol, timeframe, start_date, end_date)
+    if cached is not None:
+        OHLC_LOADS.inc(source="cache")
+        return cached
+
+    gaps = _trading_gaps(await get_missing_ranges(symbol, timeframe, start_date, end_date))
+    # גזירה רק כשה-timeframe עצמו לא שמור – נרות שכבר נשמרו מהספק עדיפים (ומהירים יותר) מ-resampling
+    ohlc = await _load_derived(symbol, timeframe, start_date, end_date, priority) if _closed_gaps(gaps) else None
+    if ohlc is None:
+        await _fill_gaps(symbol, timeframe, gaps, priority)
+        with BACKTEST_STAGE_SECONDS.time(stage="mongo_read"):
+            ohlc = await read_ohlc_range(symbol, timeframe, start_date, end_date)
+        OHLC_LOADS.inc(source="db")
+        # משיכה מהספק נכשלה / חזרה ריקה -> הטווח לא שלם; לא שומרים ל-cache (היסטוריה סגורה בו נחשבת טרייה לתמיד)
+        remaining = _trading_gaps(await get_missing_ranges(symbol, timeframe, start_date, end_date))
+        if _closed_gaps(remaining):
+            return ohlc
+    else:
+        OHLC_LOADS.inc(source="derived")
+
+    await asyncio.to_thread(save_ohlc_to_cache, symbol, timeframe, start_date, end_date, ohlc)
+    return ohlc
+
+
+def _trading_gaps(gaps):
+    # פער של סופ"ש/ימים בלי מסחר בכלל – אין מה למשוך
+    return [
+        (gap_start, gap_end) for gap_start, gap_end in gaps
+        if np.busday_count(gap_start, (date.fromisoformat(gap_end) + timedelta(days=1)).isoformat()) > 0
+    ]
+
+
+def _utc_today() -> date:
+    # אותו שעון כמו fetched_at / ohlc_coverage ב-DB (UTC), לא השעון המקומי של השרת
+    return datetime.now(timezone.utc).date()
+
+
+def _closed_gaps(gaps):
+    # יום המסחר הפתוח אף פעם לא מסומן ככיסוי – רק פער שמתחיל לפני היום הוא חוסר אמיתי
+    today = _utc_today().isoformat()
+    return [(gap_start, gap_end) for gap_start, gap_end in gaps if gap_start < today]
+
+
+async def _fill_gaps(symbol: str, timeframe: str, gaps, priority: int = PRIORITY_INTERACTIVE) -> None:
+    """
+    מושך את הפערים מהספק המהיר והתקין ביותר (עם failover) ושומר אותם ל-DB.
+    פער סגור שהספק ענה עליו בלי נרות (חג, עצירת מסחר) מסומן ככיסוי – כדי לא למשוך אותו שוב בכל backtest.
+    """
+    for gap_start, gap_end in gaps:
+        with BACKTEST_STAGE_SECONDS.time(stage="provider_fetch"):
+            fetched, provider = await market_data.fetch_ohlc(symbol, timeframe, gap_start, gap_end, priority)
+        if provider is None:  # כל הספקים נכשלו – אין מה לשמור
+            continue
+        # היום הנוכחי עוד לא נסגר – שומרים את הנרות אבל לא מסמנים אותו ככיסוי
+        covered_end = min(gap_end, (_utc_today() - timedelta(days=1)).isoformat())
+        if fetched.empty and covered_end < gap_start:
+            continue
+        await save_ohlc_to_db(
+            symbol, timeframe, gap_start, covered_end, fetched,
+            mark_covered=covered_end >= gap_start,
+        )
+        if fetched.empty:
+            continue
+        # נרות חדשים – ה-cache המקומי ותוצאות backtest שמורות של ה-symbol כבר לא עדכניים
+        await asyncio.to_thread(invalidate_cache, symbol, timeframe)
+        await invalidate_results(symbol)
+
 
+async def _load_derived(symbol: str, timeframe: str, start_date: str, end_date: str, priority: int = PRIORITY_INTERACTIVE):
+    """
+    אם timeframe עדין יותר (שממנו אפשר לגזור את timeframe) כבר שמור לכל הטווח, והנרות שלו מתחילים ב-start –
+    בונה ממנו את הנרות ב-resampling מקומי במקום להוריד את timeframe מהספק. אחרת None.
+    """
+    for source_tf in source_timeframes(timeframe):
+        gaps = _trading_gaps(await get_missing_ranges(symbol, source_tf, start_date, end_date))
+        # מותר שרק הזנב של יום המסחר הפתוח חסר – משלימים אותו ב-source_tf
+        if _closed_gaps(gaps):
+            continue
+        await _fill_gaps(symbol, source_tf, gaps, priority)
+
+        source = await asyncio.to_thread(get_ohlc_from_cache, symbol, source_tf, start_date, end_date)
+        if source is None:
+            with BACKTEST_STAGE_SECONDS.time(stage="mongo_read"):
+                source = await read_ohlc_range(symbol, source_tf, start_date, end_date)
+        if source.empty:
+            continue
+        # כיסוי נרשם מה-start המבוקש (למשל 1900-01-01), אבל ספקים נותנים רק כמה שנים של נרות תוך-יומיים –
+        # גוזרים רק אם הנר הראשון באמת מגיע ל-start, אחרת ה-timeframe עצמו מהספק ייתן יותר היסטוריה
+        before_first = (pd.Timestamp(source["datetime"].iloc[0]).date() - timedelta(days=1)).isoformat()
+        if start_date[:10] <= before_first and _trading_gaps([(start_date[:10], before_first)]):
+            continue
+        with BACKTEST_STAGE_SECONDS.time(stage="resample"):
+            return resample_ohlc(source, timeframe)
+    return None
+
+
+def _date_range(stock: StockStrategy):
+    start_date = stock.start_date.isoformat() if stock.start_date else "1900-01-01"
+    end_date = stock.end_date.isoformat() if stock.end_date else datetime.now().isoformat()
+    return start_date, end_date
+
+
+async def iter_backtest(
+    stocks: List[StockStrategy],
+    return_exceptions: bool = False,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> AsyncIterator[Tuple[int, Dict]]:
+    """
+    כל המניות רצות במקביל: טעינת ה-OHLC (DB / ספק) מוגבלת ל-BACKTEST_MAX_CONCURRENT_LOADS,
+    והחישוב של כל מניה נשלח ל-process pool ברגע שהנתונים שלה מוכנים – כך I/O ו-CPU חופפים.
+    מחזיר (index בבקשה, תוצאה) לפי סדר הסיום.
+    return_exceptions=True: מניה שנכשלה מחזירה (index, exception) במקום לעצור את כל הריצה.
+    priority: עדיפות המשיכות מהספק (ראו load_ohlc).
+    אם הצרכן מפסיק לקרוא (למשל הלקוח התנתק) – המניות שעוד רצות מבוטלות.
+    """
+    load_slots = asyncio.Semaphore(max(1, settings.BACKTEST_MAX_CONCURRENT_LOADS))
+
+    async def run_one(index: int, stock: StockStrategy):
+        try:
+            start_date, end_date = _date_range(stock)
+            async with load_slots:
+                with BACKTEST_STAGE_SECONDS.time(stage="load_ohlc"):
+                    ohlc = await load_ohlc(stock.symbol, stock.timeframe, start_date, end_date, priority)
+            # ohlc = json_file_to_df()
+            with BACKTEST_STAGE_SECONDS.time(stage="result_key"):
+                key = result_key(stock, ohlc)
+            result = await get_cached_result(key)
+            RESULT_CACHE_LOOKUPS.inc(result="miss" if result is None else "hit")
+            if result is None:
+                # compute = זמן הקיר כולל המעבר ל-worker וחזרה; השלבים עצמם נמדדים בתוך backtest_stock
+                with BACKTEST_STAGE_SECONDS.time(stage="compute"):
+                    result = await run_cpu(backtest_stock, ohlc, stock)
+                record_stages(result.pop("timings", {}))
+                BACKTEST_BARS.inc(len(ohlc))
+                BACKTEST_STOCKS.inc(outcome="computed")
+                await put_cached_result(key, stock, result)
+            else:
+                BACKTEST_STOCKS.inc(outcome="cached")
+            return index, result
+        except Exception as e:
+            BACKTEST_STOCKS.inc(outcome="error")
+            if not return_exceptions:
+                raise
+            return index, e
+
+    tasks = [asyncio.create_task(run_one(i, stock)) for i, stock in enumerate(stocks)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def run_backtest(stocks: List[StockStrategy]):
+    """כמו iter_backtest, אבל מחכה לכולן ומחזיר את התוצאות בסדר של הבקשה."""
+    results: List[Optional[Dict]] = [None] * len(stocks)
+    async for index, result in iter_backtest(stocks):
+        results[index] = result
     return results
 
+
+async def stream_backtest(stocks: List[StockStrategy]) -> AsyncIterator[Dict]:
+    """
+    אירועים לתגובה מוזרמת: start, ואז result (או error) לכל מניה ברגע שהיא מסתיימת + progress, ובסוף done.
+    כל תוצאה נשלחת ומשתחררת מיד – השרת לא מחזיק את כל רשימות העסקאות בבת אחת.
+    """
+    started = time.perf_counter()
+    total = len(stocks)
+    yield {"type": "start", "total": total}
+    completed = failed = 0
+    async for index, result in iter_backtest(stocks, return_exceptions=True):
+        completed += 1
+        if isinstance(result, Exception):
+            failed += 1
+            yield {"type": "error", "index": index, "symbol": stocks[index].symbol, "error": str(result)}
+        else:
+            yield {"type": "result", "index": index, **result}
+        yield {"type": "progress", "completed": completed, "total": total}
+    yield {"type": "done", "completed": completed, "failed": failed, "elapsed_seconds": time.perf_counter() - started}
+
 # async def run_backtest(stocks: List[StockStrategy]):
 #     results = []
 
@@ -76,4 +254,3 @@ async def run_backtest(stocks: List[StockStrategy]):
 #     return results
 
 
-
@@ -1,6 +1,7 @@
 # app/services/broker/alpaca.py
 import httpx, os
 from .base import BrokerBase
+from ..http_clients import get_client
 
 class AlpacaBroker(BrokerBase):
     def __init__(self):
@@ -10,18 +11,15 @@ class AlpacaBroker(BrokerBase):
         self.h = {"APCA-API-KEY-ID": self.key, "APCA-API-SECRET-KEY": self.secret}
 
     async def get_account(self):
-        async with httpx.AsyncClient() as c:
-            r = await c.get(f"{self.base}/v2/account", headers=self.h)
-            r.raise_for_status(); return r.json()
+        r = await get_client(self.base).get(f"{self.base}/v2/account", headers=self.h)
+        r.raise_for_status(); return r.json()
 
     async def get_positions(self):
-        async with httpx.AsyncClient() as c:
-            r = await c.get(f"{self.base}/v2/positions", headers=self.h)
-            r.raise_for_status(); return r.json()
+        r = await get_client(self.base).get(f"{self.base}/v2/positions", headers=self.h)
+        r.raise_for_status(); return r.json()
 
     async def place_order(self, symbol, qty, side, tif="day", type="market", limit_price=None):
         payload = {"symbol":symbol,"qty":qty,"side":side,"time_in_force":tif,"type":type}
         if limit_price: payload["limit_price"]=limit_price
-        async with httpx.AsyncClient() as c:
-            r = await c.post(f"{self.base}/v2/orders", headers=self.h, json=payload)
-            r.raise_for_status(); return r.json()
+        r = await get_client(self.base).post(f"{self.base}/v2/orders", headers=self.h, json=payload)
+        r.raise_for_status(); return r.json()
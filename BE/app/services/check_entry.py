@@ -1,88 +1,20 @@
 import pandas as pd
-from typing import List
-from ..models import IndicatorRule  # הנח שיש לך את המודל הזה
+from typing import List, Union
+from ..models import IndicatorRule, RuleGroup, ExitCondition
+from .rules import compile_rules, compile_exit_conditions
 
-def check_entry_conditions(df: pd.DataFrame, entry_rules: List[IndicatorRule]) -> pd.Series:
+def check_entry_conditions(df: pd.DataFrame, entry_rules: List[Union[IndicatorRule, RuleGroup]]) -> pd.DataFrame:
     """
-    עבור כל נר ב-DataFrame, בודק אם מתקיימים תנאי הכניסה.
-    מחזיר pd.Series של True/False.
+    עבור כל נר ב-DataFrame, בודק אם מתקיימים תנאי הכניסה (AND בין החוקים, RuleGroup לקבוצות מקוננות).
+    מוסיף עמודת entry_signal (True/False) ומחזיר את ה-DF.
     """
-    if df.empty or not entry_rules:
-        return pd.Series([False] * len(df), index=df.index)
-
-    result = pd.Series(True, index=df.index)  # נניח שכל החוקים צריכים להתקיים (AND)
-
-    for rule in entry_rules:
-        ind_name = rule.indicator.upper()
-        op = rule.operator
-        value = rule.value
-
-        # סדרת השוואה – אם value לא מוגדר משווים ל-close
-        series = df[ind_name]
-        comp_series = df["close"] if (value is None or value is False or (isinstance(value, (int, float)) and value <= 0)) else pd.Series([value]*len(df), index=df.index)
-
-        if op == ">":
-            mask = series > comp_series
-        elif op == "<":
-            mask = series < comp_series
-        elif op == ">=":
-            mask = series >= comp_series
-        elif op == "<=":
-            mask = series <= comp_series
-        elif op == "crossesAbove":
-            mask = series.shift(1) <= comp_series.shift(1)
-            mask &= series > comp_series
-        elif op == "crossesBelow":
-            mask = series.shift(1) >= comp_series.shift(1)
-            mask &= series < comp_series
-        else:
-            mask = pd.Series([False] * len(df), index=df.index)
-
-        result &= mask
-
-    df["entry_signal"] = result
-
+    df["entry_signal"] = compile_rules(entry_rules, "and", df.columns).evaluate(df)
     return df
 
-def check_exit_conditions(df: pd.DataFrame, exit_rules: List[IndicatorRule]) -> pd.Series:
+def check_exit_conditions(df: pd.DataFrame, exit_rules: List[ExitCondition]) -> pd.DataFrame:
     """
-    עבור כל נר ב-DataFrame, בודק אם מתקיימים תנאי היציאה.
-    מחזיר pd.Series של True/False.
+    עבור כל נר ב-DataFrame, בודק אם מתקיימים תנאי היציאה מסוג indicator (OR – מספיק שאחד יתפוס).
+    מוסיף עמודת exit_signal (True/False) ומחזיר את ה-DF. TP / SL נבדקים בסימולציית העסקאות.
     """
-    if df.empty or not exit_rules:
-        return pd.Series([False] * len(df), index=df.index)
-
-    result = pd.Series(False, index=df.index)  # כאן נניח OR – מספיק שחוק אחד יתקיים
-
-    for rule in exit_rules:
-        if rule.indicator_rule is not None:
-            ind_name = rule.indicator_rule.indicator.upper()
-            op = rule.indicator_rule.operator
-            value = rule.indicator_rule.value
-
-            series = df[ind_name]
-            comp_series = df["close"] if (value is None or value is False or (isinstance(value, (int, float)) and value <= 0)) else pd.Series([value]*len(df), index=df.index)
-
-            if op == ">":
-                mask = series > comp_series
-            elif op == "<":
-                mask = series < comp_series
-            elif op == ">=":
-                mask = series >= comp_series
-            elif op == "<=":
-                mask = series <= comp_series
-            elif op == "crossesAbove":
-                mask = series.shift(1) <= comp_series.shift(1)
-                mask &= series > comp_series
-            elif op == "crossesBelow":
-                mask = series.shift(1) >= comp_series.shift(1)
-                mask &= series < comp_series
-            else:
-                mask = pd.Series([False] * len(df), index=df.index)
-
-            # ביציאה מספיק שאחד יתפוס → OR
-            result |= mask
-
-    df["exit_signal"] = result
-
-    return df
\ No newline at end of file
+    df["exit_signal"] = compile_exit_conditions(exit_rules, df.columns).evaluate(df)
+    return df
@@ -0,0 +1,172 @@
+# app/services/compute.py
+"""
+ה-entrypoints שרצים ב-process pool (run_cpu): backtest של מניה, שילובי sweep, חלון walk-forward,
+הסיגנלים של מניה בתיק.
+המודול לא מייבא DB / HTTP (ohlc_db, ספקים) – ב-spawn כל worker מייבא את המודול של הפונקציה,
+ואסור שזה ייצור client ל-Mongo או ידפיס בכל worker. הטעינה וה-I/O נשארים ב-backtest / sweep / portfolio.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .check_entry import check_entry_conditions, check_exit_conditions
+from .equity import equity_report
+from .indicators.calc_indicators import calculate_indicators, calculate_exit_indicators
+from .metrics import stage_timer
+from .process_trades import simulate_trades, summarize_trades
+from ..models import StockStrategy
+from ..settings import settings
+
+
+# ---------- backtest ----------
+def compute_signals(ohlc: pd.DataFrame, stock: StockStrategy, timings: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """אינדיקטורים + עמודות entry_signal / exit_signal. timings: dict שמקבל את זמני השלבים (אופציונלי)."""
+    timings = {} if timings is None else timings
+    with stage_timer(timings, "indicators"):
+        ohlc = calculate_indicators(ohlc, stock.entry_rules, stock.timeframe)
+        ohlc = calculate_exit_indicators(ohlc, stock.exit_conditions, stock.timeframe)
+    with stage_timer(timings, "signals"):
+        ohlc = check_entry_conditions(ohlc, stock.entry_rules)
+        ohlc = check_exit_conditions(ohlc, stock.exit_conditions)
+    return ohlc
+
+
+def backtest_stock(ohlc: pd.DataFrame, stock: StockStrategy) -> Dict:
+    """
+    השלבים ה-CPU-bound של מניה אחת: אינדיקטורים -> סיגנלים -> סימולציית עסקאות -> סיכום.
+    פונקציה top-level ו-sync כדי שאפשר יהיה להריץ אותה ב-process pool (run_cpu).
+    זמני השלבים חוזרים ב-"timings" (נמדדים ב-worker), ו-iter_backtest מעביר אותם ל-metrics.
+    """
+    timings: Dict[str, float] = {}
+    ohlc = compute_signals(ohlc, stock, timings)
+    with stage_timer(timings, "trades"):
+        ohlc, trades = simulate_trades(ohlc, stock)
+
+    # TODO: אם נכנס -> צור עסקה buy
+    # TODO: בדוק תנאי יציאה -> צור עסקה sell
+    # TODO: שמור רווח/הפסד
+
+    summary = summarize_trades(trades, stock.investment)
+    # עקומת equity לכל נר (וקטורי מעמודת ה-pnl) – מדדי הסיכון נכנסים ל-summary, והעקומה מקוצרת ל-frontend
+    with stage_timer(timings, "equity"):
+        equity = equity_report(ohlc, stock.investment, stock.timeframe, settings.EQUITY_CURVE_POINTS)
+
+    return {
+        "symbol": stock.symbol,
+        "trades": trades,
+        "summary": {**summary, **equity["metrics"]},
+        "equity_curve": equity["curve"],
+        "timings": timings,
+        # "data": candles,  # TODO: remove this line if makes this heavy
+    }
+
+
+# ---------- sweep / walk-forward ----------
+def strategy_trades(df: pd.DataFrame, stock: StockStrategy, warmup: int = 0, close_at_end: bool = False) -> List[Dict]:
+    """
+    סיגנלים + סימולציה על DF שכבר מכיל את עמודות האינדיקטורים.
+    warmup: שורות בתחילת df שמשמשות רק כהיסטוריה לסיגנלים (crossesAbove צריך את הבר הקודם) ולא נסחרות.
+    close_at_end: פוזיציה פתוחה בבר האחרון נסגרת בו (ראו simulate_trades).
+    """
+    df = check_entry_conditions(df, stock.entry_rules)
+    df = check_exit_conditions(df, stock.exit_conditions)
+    _, trades = simulate_trades(df.iloc[warmup:] if warmup else df, stock, with_columns=False, close_at_end=close_at_end)
+    return trades
+
+
+def evaluate_combinations(
+    ohlc: pd.DataFrame,
+    combos: List[Tuple[Dict[str, Any], StockStrategy]],
+    warmup: int = 0,
+) -> List[Dict]:
+    """רץ ב-worker: סיגנלים + סימולציה לכל שילוב, על ה-DF שכבר מכיל את כל עמודות האינדיקטורים."""
+    df = ohlc.copy(deep=False)
+    rows = []
+    for params, stock in combos:
+        trades = strategy_trades(df, stock, warmup)
+        rows.append({"params": params, **summarize_trades(trades, stock.investment)})
+    return rows
+
+
+
+# מדדים שבהם נמוך יותר = טוב יותר (כל השאר מדורגים מהגבוה לנמוך)
+LOWER_IS_BETTER = {"loss_rate", "max_drawdown", "max_drawdown_pct"}
+
+
+def rank_rows(rows: List[Dict], rank_by: str, ascending: Optional[bool] = None) -> List[Dict]:
+    """
+    ממיין לפי rank_by, הטוב ביותר ראשון. ascending=None -> הכיוון לפי המדד (LOWER_IS_BETTER).
+    ערך חסר / None / NaN תמיד בסוף, ולא "שווה" ל-0 אמיתי.
+    """
+    if rows and rank_by not in rows[0]:
+        raise ValueError(f"Unknown rank_by: {rank_by}")
+    if ascending is None:
+        ascending = rank_by in LOWER_IS_BETTER
+
+    def key(row: Dict):
+        value = row.get(rank_by)
+        if value is None or value != value:
+            return (1, 0.0)
+        return (0, value if ascending else -value)
+
+    return sorted(rows, key=key)
+
+
+def _bar_date(frame: pd.DataFrame, pos: int):
+    return frame["datetime"].iloc[pos] if "datetime" in frame.columns else frame.index[pos]
+
+
+def run_window(
+    frame: pd.DataFrame,
+    warmup: int,
+    oos_offset: int,
+    combos: List[Tuple[Dict[str, Any], StockStrategy]],
+    rank_by: str,
+    ascending: Optional[bool] = None,
+) -> Dict:
+    """
+    רץ ב-worker על חלון אחד. frame = [warm-up][in-sample][out-of-sample], oos_offset = תחילת ה-OOS ב-frame.
+    בוחר את השילוב הטוב ביותר ב-in-sample ומריץ אותו על ה-out-of-sample.
+    """
+    in_sample = frame.iloc[:oos_offset]
+    best = rank_rows(evaluate_combinations(in_sample, combos, warmup), rank_by, ascending)[0]
+    stock = next(stock for params, stock in combos if params == best["params"])
+
+    # bar אחד לפני ה-OOS נשאר כהיסטוריה לסיגנלים; פוזיציה שפתוחה בסוף החלון נסגרת בבר האחרון שלו
+    # (החלון הבא בוחר פרמטרים מחדש, כך שהיא לא ממשיכה – ובלי זה הרווח/הפסד שלה פשוט נעלם)
+    oos_trades = strategy_trades(frame.iloc[oos_offset - 1:], stock, warmup=1, close_at_end=True)
+    return {
+        "in_sample": {
+            "start": _bar_date(frame, warmup),
+            "end": _bar_date(frame, oos_offset - 1),
+            "bars": oos_offset - warmup,
+            "best_params": best["params"],
+            "summary": {k: v for k, v in best.items() if k != "params"},
+        },
+        "out_of_sample": {
+            "start": _bar_date(frame, oos_offset),
+            "end": _bar_date(frame, len(frame) - 1),
+            "bars": len(frame) - oos_offset,
+            "trades": oos_trades,
+            "summary": summarize_trades(oos_trades, stock.investment),
+        },
+    }
+
+
+# ---------- portfolio ----------
+def portfolio_inputs(ohlc: pd.DataFrame, stock: StockStrategy) -> Dict[str, np.ndarray]:
+    """רץ ב-worker: הסיגנלים של מניה אחת כמערכים ממויינים לפי זמן."""
+    if ohlc.empty:
+        empty = np.array([], dtype=np.int64)
+        return {"times": empty, "dates": np.array([], dtype="datetime64[ns]"), "close": np.array([]),
+                "entries": empty, "exit_signal": np.array([], dtype=bool)}
+    df = compute_signals(ohlc, stock)
+    dates = pd.to_datetime(df["datetime"]).to_numpy(dtype="datetime64[ns]")
+    return {
+        "times": dates.view(np.int64),
+        "dates": dates,
+        "close": df["close"].to_numpy(dtype=np.float64),
+        "entries": np.flatnonzero(df["entry_signal"].to_numpy(dtype=bool)),
+        "exit_signal": df["exit_signal"].to_numpy(dtype=bool) if "exit_signal" in df.columns else np.zeros(len(df), dtype=bool),
+    }
@@ -0,0 +1,50 @@
+# app/services/cpu_pool.py
+"""
+Process pool for the CPU-bound backtest stages (indicators, signals, trade simulation),
+so they run on all cores and don't block the event loop. Created on first use, shut down in factory.lifespan.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+
+from ..settings import settings
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """None when BACKTEST_WORKERS <= 0 – the work then runs inline."""
+    global _pool
+    if settings.BACKTEST_WORKERS <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.BACKTEST_WORKERS)
+    return _pool
+
+
+async def run_cpu(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Runs fn(*args, **kwargs) in a worker process. fn and its arguments must be picklable
+    (top-level function, DataFrames, pydantic models).
+    אם ה-pool קרס (worker נהרג) – יוצרים אותו מחדש בקריאה הבאה, והפעם מריצים ב-thread (לא על ה-event loop).
+    ה-entrypoints עצמם נמצאים ב-services/compute – מודול בלי imports של DB, כי כל worker מייבא אותו.
+    """
+    global _pool
+    pool = get_process_pool()
+    if pool is None:
+        return fn(*args, **kwargs)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, partial(fn, *args, **kwargs))
+    except BrokenProcessPool as e:
+        print(f"❌ CPU worker pool broke ({e}), running in a thread")
+        _pool = None
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
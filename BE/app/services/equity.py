@@ -0,0 +1,109 @@
+"""
+עקומת equity ומדדי סיכון ל-backtest של מניה אחת, וקטורי מתוך עמודות ה-per-bar של simulate_trades
+(in_position / position_type / pnl), ו-downsampling של העקומה ל-frontend עם LTTB.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..db.ohlc_resample import TIMEFRAME_SECONDS, INTRADAY
+
+# ימי מסחר בשנה ושעות מסחר ביום (NYSE) – לחישוב annualization של Sharpe / Sortino
+TRADING_DAYS = 252
+SESSION_HOURS = 6.5
+
+
+def bars_per_year(timeframe: str) -> float:
+    if timeframe in INTRADAY:
+        return TRADING_DAYS * SESSION_HOURS * 3600 / TIMEFRAME_SECONDS[timeframe]
+    return {"1d": TRADING_DAYS, "1w": 52, "1M": 12}.get(timeframe, TRADING_DAYS)
+
+
+def equity_curve(ohlc: pd.DataFrame, start_capital: float) -> np.ndarray:
+    """
+    equity לכל בר = הון התחלתי + רווח ממומש מעסקאות שנסגרו + רווח לא ממומש של הפוזיציה הפתוחה.
+    ב-bar של SELL ה-pnl עובר מ"לא ממומש" ל"ממומש".
+    """
+    pnl = ohlc["pnl"].to_numpy(dtype=np.float64)
+    sell = (ohlc["position_type"] == "SELL").to_numpy()
+    realized = np.cumsum(np.where(sell, pnl, 0.0))
+    unrealized = np.where(ohlc["in_position"].to_numpy(dtype=bool) & ~sell, pnl, 0.0)
+    return start_capital + realized + unrealized
+
+
+def risk_metrics(equity: np.ndarray, in_position: np.ndarray, timeframe: str) -> Dict[str, Optional[float]]:
+    if len(equity) == 0:
+        return {"max_drawdown": 0.0, "max_drawdown_pct": 0.0, "sharpe": None, "sortino": None, "exposure_pct": 0.0}
+    peak = np.maximum.accumulate(equity)
+    drawdown = peak - equity
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.array([])
+    annualize = np.sqrt(bars_per_year(timeframe))
+
+    sharpe = sortino = None
+    if len(returns) > 1:
+        std = returns.std(ddof=1)
+        downside = np.sqrt(np.mean(np.minimum(returns, 0.0) ** 2))
+        sharpe = float(returns.mean() / std * annualize) if std > 0 else None
+        sortino = float(returns.mean() / downside * annualize) if downside > 0 else None
+
+    return {
+        "max_drawdown": float(drawdown.max()),
+        "max_drawdown_pct": float((drawdown / peak).max() * 100),
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "exposure_pct": float(in_position.mean() * 100),
+    }
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: אינדקסים של n_out נקודות ששומרות על הצורה של העקומה
+    (שיאים ושפלים נשארים, בניגוד לדגימה כל k נקודות). הנקודה הראשונה והאחרונה תמיד נשמרות.
+    הלולאה היא על ה-buckets (n_out), והבחירה בתוך bucket וקטורית.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 buckets בין הראשונה לאחרונה
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        start, stop = edges[b], max(edges[b + 1], edges[b] + 1)
+        # הנקודה השלישית של המשולש: הממוצע של ה-bucket הבא (או הנקודה האחרונה)
+        if b + 2 < len(edges):
+            nxt_stop = max(edges[b + 2], edges[b + 1] + 1)
+            cx, cy = x[edges[b + 1]:nxt_stop].mean(), y[edges[b + 1]:nxt_stop].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        ax, ay = x[prev], y[prev]
+        bx, by = x[start:stop], y[start:stop]
+        area = np.abs((ax - cx) * (by - ay) - (ax - bx) * (cy - ay))
+        prev = start + int(np.argmax(area))
+        selected[b + 1] = prev
+    return selected
+
+
+def equity_report(ohlc: pd.DataFrame, start_capital: float, timeframe: str, points: int) -> Dict:
+    """מדדי סיכון + עקומת equity ו-drawdown מקוצרות ל-points נקודות (עמודות, לא רשימת dicts)."""
+    if ohlc.empty or "pnl" not in ohlc.columns:
+        return {"metrics": risk_metrics(np.array([]), np.array([]), timeframe),
+                "curve": {"datetime": [], "equity": [], "drawdown_pct": []}}
+
+    equity = equity_curve(ohlc, start_capital)
+    in_position = ohlc["in_position"].to_numpy(dtype=bool)
+    peak = np.maximum.accumulate(equity)
+    dates = pd.to_datetime(ohlc["datetime"]) if "datetime" in ohlc.columns else pd.Series(ohlc.index)
+    x = dates.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    idx = lttb(x, equity, points)
+
+    return {
+        "metrics": risk_metrics(equity, in_position, timeframe),
+        "curve": {
+            "datetime": dates.iloc[idx].tolist(),
+            "equity": equity[idx].tolist(),
+            "drawdown_pct": ((peak[idx] - equity[idx]) / peak[idx] * 100).tolist(),
+        },
+    }
@@ -1,19 +1,21 @@
 import asyncio
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional
 import httpx
 import pandas as pd
 import time
 
 from app.settings import settings
+from app.services.fin_apis.scheduler import get_json
 
 ALPHA_VANTAGE_API = settings.ALPHA_API_KEY  # API Key שלך ל-Alpha Vantage
 
-async def fetch_ohlc_alpha_vantage(symbol: str, interval: str, start_date: str):
+async def fetch_ohlc_alpha_vantage(symbol: str, interval: str, start_date: str, end_date: Optional[str] = None):
     """
     מושך נתוני OHLC מ-Alpha Vantage.
     interval: '1min', '5min', '15min', '60min', 'daily'
-    start_date: YYYY-MM-DD
+    start_date / end_date: YYYY-MM-DD (end כולל, ברירת מחדל: עכשיו)
+    מחזיר DataFrame ריק כשאין נרות בטווח, ו-None כשהבקשה נכשלה.
     """
     url = f"https://www.alphavantage.co/query"
     params = {
@@ -23,15 +25,21 @@ async def fetch_ohlc_alpha_vantage(symbol: str, interval: str, start_date: str):
         "apikey": ALPHA_VANTAGE_API,
         "outputsize": "full"
     }
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(url, params=params)
-        r.raise_for_status()
-        data = r.json()
-    # נניח שמחזיר מילון {'timestamp': {open, high, low, close}}
-    if "Time Series" in data:
-        series = list(data.values())[1]  # תלוי בפורמט של Alpha Vantage
-        df = pd.DataFrame(series).T.astype(float)
+    data = await get_json("alpha_vantage", url, params, api_key=ALPHA_VANTAGE_API)
+    # מחזיר {"Meta Data": ..., "Time Series (5min)": {timestamp: {"1. open": ..., ...}}}
+    series_key = next((k for k in data if k.startswith("Time Series")), None)
+    if series_key:
+        df = pd.DataFrame(data[series_key]).T
+        # "1. open" -> "open"
+        df.columns = [c.split(". ", 1)[-1] for c in df.columns]
+        df = df[["open", "high", "low", "close", "volume"]].astype(float)
         df.index = pd.to_datetime(df.index)
+        df.index.name = "datetime"
+        df = df.sort_index()
         df = df[df.index >= pd.to_datetime(start_date)]
+        if end_date:
+            df = df[df.index < pd.to_datetime(end_date[:10]) + timedelta(days=1)]
         return df
-    return pd.DataFrame()
\ No newline at end of file
+    # בלי "Time Series" = שגיאה / חריגה ממכסה ("Error Message" / "Note" / "Information")
+    print(f"Bad response for {symbol}: {data}")
+    return None
\ No newline at end of file
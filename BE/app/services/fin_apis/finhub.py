@@ -1,19 +1,23 @@
 import asyncio
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional
 import httpx
 import pandas as pd
 import time
 
 from app.settings import settings
+from app.services.fin_apis.scheduler import get_json
 
 FINNHUB_API = settings.FINNHUB_API_KEY  # API Key שלך ל-Finnhub
 
-async def fetch_ohlc_finnhub(symbol: str, interval: str, start_date: str):
+async def fetch_ohlc_finnhub(symbol: str, interval: str, start_date: str, end_date: Optional[str] = None):
     """
     Fetch OHLC data from Finnhub.
     interval: '1m', '5m', '15m', '60m', '1h', '1d', '1w', '1M'
-    start_date: YYYY-MM-DD
+    start_date / end_date: YYYY-MM-DD (end inclusive, default: now)
+    Returns an empty DataFrame when there are no candles in the range, None when the request failed.
+    Finnhub returns UTC unix times; intraday bars are converted to exchange time (America/New_York)
+    so they line up with the other providers, daily+ bars keep their date.
     """
     resolution_map = {
         "1m": "1", "5m": "5", "15m": "15", "60m": "60",
@@ -22,27 +26,26 @@ async def fetch_ohlc_finnhub(symbol: str, interval: str, start_date: str):
     resolution = resolution_map.get(interval, "1")
     start_ts = int(pd.Timestamp(start_date).timestamp())
     end_ts = int(datetime.utcnow().timestamp())
+    if end_date:
+        end_ts = min(end_ts, int((pd.Timestamp(end_date[:10]) + timedelta(days=1)).timestamp()) - 1)
 
     url = "https://finnhub.io/api/v1/stock/candle"
     params = {
         "symbol": symbol,
         "resolution": resolution,
-        # "from": start_ts,
-        # "to": end_ts,
-        "from": int((datetime.utcnow() - timedelta(days=10)).timestamp()),  # 10 ימים אחורה
+        "from": start_ts,
         "to": end_ts,
         "token": FINNHUB_API
     }
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
+        data = await get_json("finnhub", url, params, api_key=FINNHUB_API)
 
-        if data.get("s") != "ok":
-            print(f"No data for {symbol}, status: {data.get('s')}")
+        if data.get("s") == "no_data":
             return pd.DataFrame()
+        if data.get("s") != "ok":
+            print(f"Bad response for {symbol}, status: {data.get('s')}")
+            return None
 
         df = pd.DataFrame({
             "open": data["o"],
@@ -52,8 +55,12 @@ async def fetch_ohlc_finnhub(symbol: str, interval: str, start_date: str):
             "volume": data["v"]
         }, index=pd.to_datetime(data["t"], unit='s'))
 
+        if resolution in ("D", "W", "M"):
+            df.index = df.index.normalize()
+        else:
+            df.index = df.index.tz_localize("UTC").tz_convert("America/New_York").tz_localize(None)
         df.index.name = "datetime"
-        return df
+        return df.astype(float).sort_index()
 
     except httpx.HTTPStatusError as e:
         print(f"HTTP error fetching {symbol}: {e}")
@@ -62,4 +69,4 @@ async def fetch_ohlc_finnhub(symbol: str, interval: str, start_date: str):
     except Exception as e:
         print(f"Unexpected error fetching {symbol}: {e}")
 
-    return pd.DataFrame()
\ No newline at end of file
+    return None
\ No newline at end of file
@@ -0,0 +1,236 @@
+# app/services/fin_apis/providers.py
+"""
+Market-data federation: one interface over the Twelve Data / Finnhub / Alpha Vantage adapters,
+and a router that picks the fastest healthy provider for each request and fails over to the next.
+"""
+import asyncio
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.settings import settings
+from app.services.fin_apis.scheduler import get_bucket, PRIORITY_INTERACTIVE
+from app.services.fin_apis.twelve_data import fetch_ohlc_twelve_data_5000, history_request_count, TWELVE_DATA_API_KEY
+from app.services.fin_apis.finhub import fetch_ohlc_finnhub, FINNHUB_API
+from app.services.fin_apis.alpha_ventage import fetch_ohlc_alpha_vantage, ALPHA_VANTAGE_API
+from app.services.metrics import PROVIDER_SECONDS, PROVIDER_CALLS, record_timing
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# משקל של מדידה חדשה בממוצע הנע (EWMA) של latency / error rate
+EWMA_ALPHA = 0.3
+
+
+class ProviderError(Exception):
+    """The provider request failed (as opposed to succeeding with no candles in the range)."""
+
+
+def normalize_ohlc(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Normalized OHLCV frame: DatetimeIndex named 'datetime', float columns, sorted, no duplicate bars."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=OHLCV_COLUMNS, index=pd.DatetimeIndex([], name="datetime"))
+    out = df.copy()
+    if "datetime" in out.columns:
+        out = out.set_index("datetime")
+    out.index = pd.to_datetime(out.index)
+    out.index.name = "datetime"
+    for col in OHLCV_COLUMNS:
+        if col not in out.columns:
+            out[col] = float("nan")
+    out = out[OHLCV_COLUMNS].astype(float).sort_index()
+    return out[~out.index.duplicated(keep="last")]
+
+
+class MarketDataProvider:
+    """
+    Common provider interface. `fetch_ohlc` returns a normalize_ohlc() frame – empty when the provider has
+    no candles in the range – and raises (ProviderError) when the request failed.
+    """
+    name: str = ""
+    api_key: Optional[str] = None
+    timeframes: Tuple[str, ...] = ()
+    # כמה ימים אחורה יש לספק נתונים תוך-יומיים (None = אין מגבלה ידועה)
+    intraday_history_days: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def supports(self, timeframe: str, start_date: str) -> bool:
+        if timeframe not in self.timeframes:
+            return False
+        if self.intraday_history_days is not None and timeframe not in ("1d", "1w", "1M"):
+            oldest = (date.today() - timedelta(days=self.intraday_history_days)).isoformat()
+            return start_date[:10] >= oldest
+        return True
+
+    def timeout(self, timeframe: str, start_date: str, end_date: Optional[str] = None) -> float:
+        """Seconds the router gives one fetch_ohlc call."""
+        return settings.PROVIDER_TIMEOUT_SECONDS
+
+    def _checked(self, df: Optional[pd.DataFrame]) -> pd.DataFrame:
+        # ה-adapters מחזירים None על כשל ו-DataFrame ריק כשאין נרות
+        if df is None:
+            raise ProviderError(f"{self.name} request failed")
+        return normalize_ohlc(df)
+
+    async def fetch_ohlc(self, symbol: str, timeframe: str, start_date: str,
+                         end_date: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE) -> pd.DataFrame: ...
+
+
+class TwelveDataProvider(MarketDataProvider):
+    name = "twelve_data"
+    api_key = TWELVE_DATA_API_KEY
+    timeframes = ("1m", "5m", "15m", "60m", "1h", "1d", "1w", "1M")
+
+    def timeout(self, timeframe, start_date, end_date=None):
+        # היסטוריה ארוכה = הרבה חלונות, וכל אחד מחכה לקרדיט (TWELVE_DATA_CREDITS_PER_MINUTE) – הזמן גדל עם מספר החלונות
+        windows = history_request_count(timeframe, start_date, end_date)
+        return settings.PROVIDER_TIMEOUT_SECONDS + windows * 60 / max(1e-6, settings.TWELVE_DATA_CREDITS_PER_MINUTE)
+
+    async def fetch_ohlc(self, symbol, timeframe, start_date, end_date=None, priority=PRIORITY_INTERACTIVE):
+        return self._checked(await fetch_ohlc_twelve_data_5000(symbol, timeframe, start_date, end_date, priority))
+
+
+class FinnhubProvider(MarketDataProvider):
+    name = "finnhub"
+    api_key = FINNHUB_API
+    timeframes = ("1m", "5m", "15m", "60m", "1h", "1d", "1w", "1M")
+
+    async def fetch_ohlc(self, symbol, timeframe, start_date, end_date=None, priority=PRIORITY_INTERACTIVE):
+        return self._checked(await fetch_ohlc_finnhub(symbol, timeframe, start_date, end_date))
+
+
+class AlphaVantageProvider(MarketDataProvider):
+    name = "alpha_vantage"
+    api_key = ALPHA_VANTAGE_API
+    timeframes = ("1m", "5m", "15m", "60m", "1h", "1d")
+    # TIME_SERIES_INTRADAY עם outputsize=full מחזיר רק את החודש האחרון
+    intraday_history_days = 30
+    interval_map = {"1m": "1min", "5m": "5min", "15m": "15min", "60m": "60min", "1h": "60min", "1d": "daily"}
+
+    async def fetch_ohlc(self, symbol, timeframe, start_date, end_date=None, priority=PRIORITY_INTERACTIVE):
+        return self._checked(await fetch_ohlc_alpha_vantage(symbol, self.interval_map[timeframe], start_date, end_date))
+
+
+class ProviderHealth:
+    def __init__(self):
+        self.latency: Optional[float] = None  # EWMA, seconds
+        self.error_rate = 0.0                 # EWMA of failed calls (errors / timeouts)
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def record(self, latency: float, ok: bool, error: Optional[str] = None) -> None:
+        self.calls += 1
+        self.latency = latency if self.latency is None else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency
+        self.error_rate = EWMA_ALPHA * (0.0 if ok else 1.0) + (1 - EWMA_ALPHA) * self.error_rate
+        if ok:
+            self.consecutive_errors = 0
+            return
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error = error
+        if self.consecutive_errors >= settings.PROVIDER_MAX_CONSECUTIVE_ERRORS:
+            self.cooldown_until = time.monotonic() + settings.PROVIDER_COOLDOWN_SECONDS
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+class ProviderRouter:
+    """
+    Picks a provider per request: healthy (not cooling down, quota left) first, then by expected cost =
+    EWMA latency inflated by the error rate; the configured order breaks ties / covers unmeasured providers.
+    On an error or timeout it fails over to the next candidate. An empty result is an answer ("no candles in
+    this range", e.g. a holiday) – it is returned as is, without burning the other providers' credits.
+    """
+
+    def __init__(self, providers: List[MarketDataProvider]):
+        self.providers = providers
+        self.health: Dict[str, ProviderHealth] = {p.name: ProviderHealth() for p in providers}
+
+    def _quota_left(self, provider: MarketDataProvider) -> float:
+        return get_bucket(provider.name, provider.api_key).remaining
+
+    def ranked(self, timeframe: str, start_date: str) -> List[MarketDataProvider]:
+        candidates = [p for p in self.providers if p.enabled and p.supports(timeframe, start_date)]
+
+        def sort_key(item):
+            order, p = item
+            h = self.health[p.name]
+            unhealthy = h.cooling_down or self._quota_left(p) < 1
+            # ספק שעוד לא נמדד נחשב מהיר – כך כל ספק נמדד לפחות פעם אחת
+            cost = (h.latency or 0.0) / max(1e-6, 1.0 - h.error_rate)
+            return (unhealthy, cost, order)
+
+        return [p for _, p in sorted(enumerate(candidates), key=sort_key)]
+
+    def _record(self, provider: MarketDataProvider, started: float, outcome: str, error: Optional[str] = None) -> None:
+        """health (לניתוב) + metrics (ל-/metrics ול-breakdown של הבקשה)."""
+        elapsed = time.monotonic() - started
+        self.health[provider.name].record(elapsed, ok=outcome in ("ok", "empty"), error=error)
+        PROVIDER_SECONDS.observe(elapsed, provider=provider.name, outcome=outcome)
+        PROVIDER_CALLS.inc(provider=provider.name, outcome=outcome)
+        record_timing(f"provider.{provider.name}", elapsed)
+
+    async def fetch_ohlc(
+        self,
+        symbol: str,
+        timeframe: str,
+        start_date: str,
+        end_date: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> Tuple[pd.DataFrame, Optional[str]]:
+        """
+        Returns (normalized frame, provider name). The frame is empty when the provider that answered has no
+        candles in the range; (empty frame, None) when every provider failed.
+        """
+        for provider in self.ranked(timeframe, start_date):
+            started = time.monotonic()
+            try:
+                df = await asyncio.wait_for(
+                    provider.fetch_ohlc(symbol, timeframe, start_date, end_date, priority),
+                    timeout=provider.timeout(timeframe, start_date, end_date),
+                )
+            except asyncio.TimeoutError:
+                self._record(provider, started, "timeout", error="timeout")
+                print(f"{provider.name} timed out fetching {symbol} {timeframe}, failing over")
+                continue
+            except Exception as e:
+                self._record(provider, started, "error", error=str(e))
+                print(f"{provider.name} failed fetching {symbol} {timeframe}: {e}, failing over")
+                continue
+
+            self._record(provider, started, "empty" if df.empty else "ok")
+            return df, provider.name
+        return normalize_ohlc(None), None
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            p.name: {
+                "enabled": p.enabled,
+                "latency_seconds": self.health[p.name].latency,
+                "error_rate": self.health[p.name].error_rate,
+                "calls": self.health[p.name].calls,
+                "errors": self.health[p.name].errors,
+                "cooling_down": self.health[p.name].cooling_down,
+                "quota_left": self._quota_left(p),
+                "last_error": self.health[p.name].last_error,
+            }
+            for p in self.providers
+        }
+
+
+_ALL_PROVIDERS = {p.name: p for p in (TwelveDataProvider(), FinnhubProvider(), AlphaVantageProvider())}
+
+market_data = ProviderRouter([
+    _ALL_PROVIDERS[name.strip()]
+    for name in settings.MARKET_DATA_PROVIDERS.split(",")
+    if name.strip() in _ALL_PROVIDERS
+])
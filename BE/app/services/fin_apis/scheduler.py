@@ -0,0 +1,217 @@
+# app/services/fin_apis/scheduler.py
+"""
+Provider-side request scheduler:
+- a token bucket per (provider, API key) so we stay inside the per-minute credit budget,
+- waiters are served by priority (interactive backtests before background work),
+- identical in-flight requests are coalesced (single-flight) so concurrent callers share one fetch.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.settings import settings
+from app.services.http_clients import get_client
+from app.services.metrics import PROVIDER_THROTTLE_SECONDS
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# כמה פעמים לנסות שוב אחרי "out of API credits" (429) מהספק
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class RateLimitExceeded(Exception):
+    """The provider kept answering 429 after MAX_RATE_LIMIT_RETRIES retries."""
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` tokens per minute, up to `capacity`. Waiters are served lowest priority first."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._waiters: list = []  # heap of (priority, seq, cost, future)
+        self._seq = itertools.count()
+        self._pump_task: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def remaining(self) -> float:
+        self._refill()
+        return self.tokens
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for w in self._waiters if not w[3].done())
+
+    def drain(self) -> None:
+        """The provider told us we're out of credits – nothing left until the bucket refills."""
+        self._refill()
+        self.tokens = 0.0
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE, cost: float = 1.0) -> float:
+        """Wait for `cost` tokens. Returns the seconds spent waiting."""
+        start = time.monotonic()
+        self._refill()
+        if not self._waiters and self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), cost, fut))
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+        await fut
+        return time.monotonic() - start
+
+    async def _pump(self) -> None:
+        while self._waiters:
+            priority, seq, cost, fut = self._waiters[0]
+            if fut.done():  # waiter was cancelled
+                heapq.heappop(self._waiters)
+                continue
+            self._refill()
+            if self.tokens >= cost:
+                heapq.heappop(self._waiters)
+                self.tokens -= cost
+                fut.set_result(None)
+                continue
+            await asyncio.sleep((cost - self.tokens) / self.rate)
+
+
+class SingleFlight:
+    """Runs one coroutine per key at a time; concurrent callers with the same key await the same result."""
+
+    def __init__(self):
+        self._inflight: Dict[Any, asyncio.Task] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Any, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: אם קורא אחד מבוטל, השאר עדיין מקבלים את התוצאה
+        return await asyncio.shield(task)
+
+    def is_inflight(self, key: Any) -> bool:
+        return key in self._inflight
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+
+# קרדיטים לדקה לכל ספק (ברירת מחדל = התוכנית החינמית)
+PROVIDER_RATES = {
+    "twelve_data": settings.TWELVE_DATA_CREDITS_PER_MINUTE,
+    "finnhub": settings.FINNHUB_CALLS_PER_MINUTE,
+    "alpha_vantage": settings.ALPHA_CALLS_PER_MINUTE,
+}
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_flights = SingleFlight()
+_stats: Dict[str, Dict[str, float]] = {}
+
+
+def get_bucket(provider: str, api_key: Optional[str]) -> TokenBucket:
+    key = (provider, api_key or "")
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = _buckets[key] = TokenBucket(PROVIDER_RATES.get(provider, 60))
+    return bucket
+
+
+def _provider_stats(provider: str) -> Dict[str, float]:
+    return _stats.setdefault(provider, {
+        "requests": 0,
+        "coalesced": 0,
+        "throttled": 0,
+        "throttle_wait_seconds": 0.0,
+        "max_throttle_wait_seconds": 0.0,
+        "rate_limit_retries": 0,
+    })
+
+
+def _is_rate_limited(data: Any) -> bool:
+    # Twelve Data מחזיר 200 עם {"code": 429, "status": "error"} כשנגמרו הקרדיטים לדקה
+    return isinstance(data, dict) and data.get("code") == 429
+
+
+async def _request_json(
+    provider: str,
+    url: str,
+    params: Dict[str, Any],
+    api_key: Optional[str],
+    priority: int,
+    cost: float,
+) -> Any:
+    stats = _provider_stats(provider)
+    bucket = get_bucket(provider, api_key)
+    client = get_client(url, timeout=30)
+
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        waited = await bucket.acquire(priority, cost)
+        PROVIDER_THROTTLE_SECONDS.observe(waited, provider=provider)
+        if waited > 0:
+            stats["throttled"] += 1
+            stats["throttle_wait_seconds"] += waited
+            stats["max_throttle_wait_seconds"] = max(stats["max_throttle_wait_seconds"], waited)
+
+        stats["requests"] += 1
+        r = await client.get(url, params=params)
+        if r.status_code != 429:
+            r.raise_for_status()
+            data = r.json()
+            if not _is_rate_limited(data):
+                return data
+        if attempt < MAX_RATE_LIMIT_RETRIES:
+            stats["rate_limit_retries"] += 1
+            bucket.drain()
+    raise RateLimitExceeded(f"{provider}: still rate limited after {MAX_RATE_LIMIT_RETRIES} retries")
+
+
+async def get_json(
+    provider: str,
+    url: str,
+    params: Dict[str, Any],
+    api_key: Optional[str] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    cost: float = 1.0,
+) -> Any:
+    """
+    GET `url` through the provider's token bucket. Identical concurrent requests
+    (same provider, url and params) share a single upstream call.
+    The returned JSON may be shared between callers – treat it as read-only.
+    """
+    key = (provider, url, json.dumps(params, sort_keys=True, default=str))
+    if _flights.is_inflight(key):
+        _provider_stats(provider)["coalesced"] += 1
+    return await _flights.do(key, lambda: _request_json(provider, url, params, api_key, priority, cost))
+
+
+async def single_flight(key: Any, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """Coalesce any identical in-flight work (e.g. loading the same symbol/timeframe/range)."""
+    return await _flights.do(key, factory)
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    """Per-provider counters, throttle wait times, remaining tokens and queue depth."""
+    out: Dict[str, Any] = {}
+    for (provider, _), bucket in _buckets.items():
+        entry = out.setdefault(provider, {**_provider_stats(provider), "tokens_remaining": 0.0, "queue_depth": 0})
+        entry["tokens_remaining"] += bucket.remaining
+        entry["queue_depth"] += bucket.queue_depth
+    return {"providers": out, "inflight": _flights.inflight, "coalesced": _flights.coalesced}
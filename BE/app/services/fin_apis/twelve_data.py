@@ -1,13 +1,15 @@
 import asyncio
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import httpx
+import numpy as np
 import pandas as pd
 import time
 import json
 from pathlib import Path
 
 from app.settings import settings
+from app.services.fin_apis.scheduler import get_json, PRIORITY_INTERACTIVE
 
 TWELVE_DATA_API_KEY = settings.TWELVE_DATA_API_KEY  # או API Key שלך ל-Twelve Data
 
@@ -35,10 +37,7 @@ async def fetch_ohlc_twelve_data(symbol: str, interval: str, start_date: str):
     }
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.get(url, params=params)
-            r.raise_for_status()
-            data = r.json()
+        data = await get_json("twelve_data", url, params, api_key=TWELVE_DATA_API_KEY)
 
         if "values" not in data:
             print(f"No data for {symbol}, response: {data}")
@@ -123,94 +122,237 @@ def json_file_to_df(file_path: str = "data/ohlc.json") -> pd.DataFrame:
     return df
 
 
-async def fetch_ohlc_twelve_data_5000(symbol: str, interval: str, start_date: str):
+# אורך נר בשניות – לחישוב מראש של חלונות שכל אחד מחזיק עד 5000 נרות
+INTERVAL_SECONDS = {
+    "1m": 60, "5m": 300, "15m": 900, "60m": 3600,
+    "1h": 3600, "1d": 86400, "1w": 604800, "1M": 2592000
+}
+TD_OUTPUTSIZE = 5000
+# נרות תוך-יומיים קיימים רק בשעות המסחר (6.5 שעות בימי חול) – החלונות שלהם נמדדים בימי מסחר
+TD_SESSION_SECONDS = int(6.5 * 3600)
+TD_TIME_SERIES_URL = "https://api.twelvedata.com/time_series"
+TD_EARLIEST_URL = "https://api.twelvedata.com/earliest_timestamp"
+_EPOCH_DAY = np.datetime64("1970-01-01", "D")
+
+
+def _history_windows(start_dt: datetime, end_dt: datetime, interval: str) -> List[Tuple[datetime, datetime]]:
+    """
+    Split [start_dt, end_dt] into fixed windows of up to TD_OUTPUTSIZE bars.
+    Intraday intervals are sized in trading-session time (business days of TD_SESSION_SECONDS),
+    so each window comes close to a full 5000 bars; 1day and coarser use wall-clock time.
+    Windows are aligned to a grid from the epoch, so the same window is requested
+    identically by different callers; consecutive windows share their edge timestamp.
+    """
+    bar_seconds = INTERVAL_SECONDS.get(interval, 60)
+    if bar_seconds < INTERVAL_SECONDS["1d"]:
+        return _session_windows(start_dt, end_dt, bar_seconds)
+
+    span = bar_seconds * TD_OUTPUTSIZE
+    start_ts = int(pd.Timestamp(start_dt).timestamp())
+    end_ts = int(pd.Timestamp(end_dt).timestamp())
+
+    windows = []
+    t = start_ts - start_ts % span
+    while t < end_ts:
+        w_start = max(t, start_ts)
+        w_end = min(t + span, end_ts)
+        windows.append((
+            datetime.utcfromtimestamp(w_start),
+            datetime.utcfromtimestamp(w_end),
+        ))
+        t += span
+    return windows
+
+
+def _history_range(start_date: str, end_date: Optional[str]) -> Tuple[datetime, datetime]:
+    """[start, end] of a history request; a date-only end_date covers the whole day, and nothing past now."""
+    start_dt = pd.to_datetime(start_date).to_pydatetime()
+    end_dt = datetime.utcnow()  # לא יותר מהתאריך הכי עדכני
+    if end_date:
+        # תאריך בלבד -> כולל את כל היום
+        requested_end = pd.to_datetime(end_date)
+        if len(str(end_date)) <= 10:
+            requested_end += timedelta(days=1) - timedelta(seconds=1)
+        end_dt = min(end_dt, requested_end.to_pydatetime())
+    return start_dt, end_dt
+
+
+def history_request_count(interval: str, start_date: str, end_date: Optional[str] = None) -> int:
+    """How many window requests fetch_ohlc_twelve_data_5000 makes for the range (upper bound)."""
+    start_dt, end_dt = _history_range(start_date, end_date)
+    return len(_history_windows(start_dt, end_dt, interval)) if end_dt > start_dt else 0
+
+
+def _session_windows(start_dt: datetime, end_dt: datetime, bar_seconds: int) -> List[Tuple[datetime, datetime]]:
+    """Windows of whole business days, as many as fit TD_OUTPUTSIZE bars of TD_SESSION_SECONDS each."""
+    bars_per_day = -(-TD_SESSION_SECONDS // bar_seconds)  # ceil: נר חלקי בסוף הסשן הוא עדיין נר
+    days = max(1, TD_OUTPUTSIZE // bars_per_day)
+    start_day = np.datetime64(pd.Timestamp(start_dt).date(), "D")
+    end_day = np.datetime64(pd.Timestamp(end_dt).date(), "D")
+
+    windows = []
+    day = np.busday_offset(_EPOCH_DAY, np.busday_count(_EPOCH_DAY, start_day) // days * days, roll="forward")
+    while day <= end_day:
+        next_day = np.busday_offset(day, days, roll="forward")
+        w_start = max(pd.Timestamp(day).to_pydatetime(), start_dt)
+        w_end = min(pd.Timestamp(next_day).to_pydatetime(), end_dt)
+        if w_start < w_end:
+            windows.append((w_start, w_end))
+        day = next_day
+    return windows
+
+
+def _values_to_df(values: List[Dict]) -> pd.DataFrame:
+    df = pd.DataFrame(values)
+    df = df.astype({
+        "open": float, "high": float, "low": float,
+        "close": float, "volume": float
+    })
+    df["datetime"] = pd.to_datetime(df["datetime"])
+    return df.set_index("datetime").sort_index()
+
+
+async def _fetch_earliest_timestamp(symbol: str, td_interval: str, priority: int) -> Optional[datetime]:
+    """The first bar Twelve Data has for symbol/interval, so we don't request windows before the IPO."""
+    try:
+        data = await get_json("twelve_data", TD_EARLIEST_URL, {
+            "symbol": symbol,
+            "interval": td_interval,
+            "apikey": TWELVE_DATA_API_KEY,
+        }, api_key=TWELVE_DATA_API_KEY, priority=priority)
+        return pd.to_datetime(data["datetime"]).to_pydatetime() if "datetime" in data else None
+    except Exception as e:
+        print(f"Could not get earliest timestamp for {symbol}: {e}")
+        return None
+
+
+async def _fetch_window(
+    semaphore: asyncio.Semaphore,
+    symbol: str,
+    td_interval: str,
+    w_start: datetime,
+    w_end: datetime,
+    priority: int,
+) -> Optional[pd.DataFrame]:
     """
-    Fetch OHLC data from Twelve Data API in batches of 5000 candles each,
-    from 'now' backwards to 'start_date', with try-except for error handling.
+    Fetch one window. Returns a DataFrame (possibly empty when the provider has no bars there),
+    or None on a request/processing error.
+    The windows are sized for a 6.5h session; a symbol that trades longer (24/7 crypto, forex) can have
+    more than TD_OUTPUTSIZE bars in one. Twelve Data then silently returns only the latest TD_OUTPUTSIZE,
+    so a full page is followed by another request for the part of the window before its first bar.
+    """
+    pages = []
+    page_end = w_end
+    while True:
+        page = await _fetch_page(semaphore, symbol, td_interval, w_start, page_end, priority)
+        if page is None:
+            return None
+        pages.append(page)
+        if len(page) < TD_OUTPUTSIZE or page.index[0] <= w_start or page.index[0] >= page_end:
+            break
+        page_end = page.index[0].to_pydatetime()  # הנר הראשון חוזר שוב – הכפילות נזרקת ב-stitching
+    return pages[0] if len(pages) == 1 else pd.concat(pages).sort_index()
+
+
+async def _fetch_page(
+    semaphore: asyncio.Semaphore,
+    symbol: str,
+    td_interval: str,
+    w_start: datetime,
+    w_end: datetime,
+    priority: int,
+) -> Optional[pd.DataFrame]:
+    """One time_series request for [w_start, w_end] (up to TD_OUTPUTSIZE of its latest bars)."""
+    params = {
+        "symbol": symbol,
+        "interval": td_interval,
+        "apikey": TWELVE_DATA_API_KEY,
+        "start_date": w_start.isoformat(),
+        "end_date": w_end.isoformat(),
+        "outputsize": TD_OUTPUTSIZE,
+        "format": "JSON"
+    }
+
+    async with semaphore:
+        try:
+            data = await get_json("twelve_data", TD_TIME_SERIES_URL, params,
+                                  api_key=TWELVE_DATA_API_KEY, priority=priority)
+        except httpx.HTTPStatusError as e:
+            print(f"HTTP error fetching {symbol} [{w_start} - {w_end}]: {e}")
+            return None
+        except httpx.RequestError as e:
+            print(f"Request error fetching {symbol} [{w_start} - {w_end}]: {e}")
+            return None
+        except Exception as e:
+            print(f"Unexpected error fetching {symbol} [{w_start} - {w_end}]: {e}")
+            return None
+
+    if data.get("status") == "error":
+        # "No data is available on the specified dates" = חלון בלי נרות (חג, לפני ההנפקה) – לא כשל
+        if "no data" in str(data.get("message", "")).lower():
+            return pd.DataFrame()
+        print(f"Error fetching {symbol} [{w_start} - {w_end}]: {data.get('message')}")
+        return None
+    if "values" not in data or not data["values"]:
+        return pd.DataFrame()
+
+    try:
+        return _values_to_df(data["values"])
+    except Exception as e:
+        print(f"Error processing batch data for {symbol}: {e}")
+        return None
+
+
+async def fetch_ohlc_twelve_data_5000(
+    symbol: str,
+    interval: str,
+    start_date: str,
+    end_date: Optional[str] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+):
+    """
+    Fetch OHLC data from Twelve Data API for [start_date, end_date] (default: now).
+    The range is split up front into fixed windows of up to 5000 candles, which are fetched
+    concurrently (at most settings.TWELVE_DATA_MAX_CONCURRENCY at a time) through the provider scheduler
+    (credit budget + coalescing of identical windows), then stitched together with duplicates
+    at the window edges dropped.
+    end_date: YYYY-MM-DD (inclusive) or full ISO datetime
+    Returns an empty DataFrame when the provider has no bars in the range, and None when any window
+    failed, so a partial history is never stored as complete.
     """
     interval_map = {
         "1m": "1min", "5m": "5min", "15m": "15min", "60m": "1h",
         "1h": "1h", "1d": "1day", "1w": "1W", "1M": "1M"
     }
     td_interval = interval_map.get(interval, "1min")
-    start_dt = pd.to_datetime(start_date)
-    end_dt = datetime.utcnow()  # נתחיל מהתאריך הכי עדכני
-
-    all_data = []
-
-    async with httpx.AsyncClient(timeout=30) as client:
-        while end_dt > start_dt:
-            params = {
-                "symbol": symbol,
-                "interval": td_interval,
-                "apikey": TWELVE_DATA_API_KEY,
-                "start_date": start_dt.isoformat(),   # <-- מגביל את תחילת המשיכה
-                "end_date": end_dt.isoformat(),
-                "outputsize": 5000,
-                "format": "JSON"
-            }
-
-            try:
-                r = await client.get("https://api.twelvedata.com/time_series", params=params)
-                r.raise_for_status()
-                data = r.json()
-            except httpx.HTTPStatusError as e:
-                print(f"HTTP error fetching {symbol}: {e}")
-                break
-            except httpx.RequestError as e:
-                print(f"Request error fetching {symbol}: {e}")
-                break
-            except Exception as e:
-                print(f"Unexpected error fetching {symbol}: {e}")
-                break
-
-            if "values" not in data or not data["values"]:
-                print(f"No more data returned for {symbol}")
-                break
-
-            try:
-                batch_df = pd.DataFrame(data["values"])
-                batch_df = batch_df.rename(columns={
-                    "datetime": "datetime",
-                    "open": "open",
-                    "high": "high",
-                    "low": "low",
-                    "close": "close",
-                    "volume": "volume"
-                })
-                batch_df = batch_df.astype({
-                    "open": float, "high": float, "low": float,
-                    "close": float, "volume": float
-                })
-                batch_df["datetime"] = pd.to_datetime(batch_df["datetime"])
-                batch_df = batch_df.set_index("datetime").sort_index()
-            except Exception as e:
-                print(f"Error processing batch data for {symbol}: {e}")
-                break
-
-            all_data.append(batch_df)
-
-            # עדכן את end_dt לפי הנר הכי קדום שהוחזר פחות יחידת זמן אחת
-            first_candle_dt = batch_df.index.min()
-            if first_candle_dt <= start_dt:
-                break
-            delta_map = {
-                "1min": timedelta(minutes=1),
-                "5m": timedelta(minutes=5),
-                "15m": timedelta(minutes=15),
-                "60m": timedelta(hours=1),
-                "1h": timedelta(hours=1),
-                "1d": timedelta(days=1),
-                "1w": timedelta(weeks=1),
-                "1M": timedelta(days=30)  # בערך חודש
-            }
-            delta = delta_map.get(interval, timedelta(minutes=1))
-            end_dt = first_candle_dt - delta
-
-    if all_data:
-        full_df = pd.concat(all_data).sort_index()
-        full_df = full_df[full_df.index >= start_dt]
-        # df_to_json_file(full_df)
-        return full_df
-    else:
-        return pd.DataFrame()
\ No newline at end of file
+    start_dt, end_dt = _history_range(start_date, end_date)
+    if end_dt <= start_dt:
+        return pd.DataFrame()
+
+    semaphore = asyncio.Semaphore(settings.TWELVE_DATA_MAX_CONCURRENCY)
+    windows = _history_windows(start_dt, end_dt, interval)
+    if len(windows) > 2:
+        # טווח ארוך (למשל since IPO) – לא מבקשים חלונות לפני הנר הראשון שקיים
+        earliest = await _fetch_earliest_timestamp(symbol, td_interval, priority)
+        if earliest and earliest > start_dt:
+            windows = _history_windows(earliest, end_dt, interval)
+
+    batches = await asyncio.gather(*[
+        _fetch_window(semaphore, symbol, td_interval, w_start, w_end, priority)
+        for w_start, w_end in windows
+    ])
+
+    if any(b is None for b in batches):
+        print(f"Failed to fetch part of the history for {symbol}, dropping the partial result")
+        return None
+
+    all_data = [b for b in batches if not b.empty]
+    if not all_data:
+        print(f"No data returned for {symbol}")
+        return pd.DataFrame()
+
+    full_df = pd.concat(all_data).sort_index()
+    full_df = full_df[~full_df.index.duplicated(keep="last")]
+    full_df = full_df[(full_df.index >= start_dt) & (full_df.index <= end_dt)]
+    # df_to_json_file(full_df)
+    return full_df
@@ -0,0 +1,91 @@
+# app/services/http_clients.py
+"""
+Process-wide pooled HTTP clients: one httpx.AsyncClient per upstream host,
+created on first use and closed in the app lifespan (factory.lifespan).
+Connections are kept alive between requests, so only the first call to a host pays for TCP+TLS.
+"""
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+
+from ..settings import settings
+
+try:
+    import h2  # noqa: F401 – httpx needs it for HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_TIMEOUT = 30.0
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _make_hooks(host: str):
+    stats = _stats.setdefault(host, {"requests": 0, "responses": 0, "errors": 0})
+
+    async def on_request(request: httpx.Request):
+        stats["requests"] += 1
+
+    async def on_response(response: httpx.Response):
+        stats["responses"] += 1
+        if response.status_code >= 400:
+            stats["errors"] += 1
+
+    return {"request": [on_request], "response": [on_response]}
+
+
+def get_client(url: str, timeout: Optional[float] = None) -> httpx.AsyncClient:
+    """
+    Shared client for the host of `url`. `timeout` applies when the client is first created,
+    so each upstream keeps its own timeout (Twelve Data 30s, AI 60s, Ollama 120s...).
+    """
+    host = _host_key(url)
+    client = _clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout or DEFAULT_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            http2=HTTP2_AVAILABLE,
+            event_hooks=_make_hooks(host),
+        )
+        _clients[host] = client
+    return client
+
+
+def set_client(url: str, client: httpx.AsyncClient) -> None:
+    """Inject a client for a host (e.g. one with a mock transport)."""
+    _clients[_host_key(url)] = client
+
+
+async def close_clients() -> None:
+    for client in list(_clients.values()):
+        await client.aclose()
+    _clients.clear()
+
+
+def pool_stats() -> Dict[str, Dict]:
+    """Per-host request counters plus the current connections in the pool."""
+    out = {}
+    for host, client in _clients.items():
+        # httpx doesn't expose the pool publicly – read it defensively
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        out[host] = {
+            **_stats.get(host, {}),
+            "http2": HTTP2_AVAILABLE,
+            "connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "closed": client.is_closed,
+        }
+    return out
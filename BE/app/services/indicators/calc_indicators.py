@@ -1,6 +1,12 @@
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
 import pandas as pd
 import ta
-from typing import List, Dict, Any, Union
+
+from ...settings import settings
 
 # -------- Helpers --------
 def _get_series(df: pd.DataFrame, source: str = "close") -> pd.Series:
@@ -10,36 +16,153 @@ def _get_series(df: pd.DataFrame, source: str = "close") -> pd.Series:
         source = "close"
     return df[source]
 
-# -------- Indicators --------
-def calculate_rsi(df: pd.DataFrame, period: int = 14, source: str = "close", **_: Any):
-    s = _get_series(df, source)
-    df["RSI"] = ta.momentum.RSIIndicator(s, window=period).rsi()
-    return df
+def _resolve_source(df_columns, source: Optional[str]) -> str:
+    source = (source or "close").lower()
+    return source if source in df_columns else "close"
 
-def calculate_sma(df: pd.DataFrame, period: int = 20, source: str = "close", **_: Any):
-    s = _get_series(df, source)
-    df["SMA"] = ta.trend.SMAIndicator(s, window=period).sma_indicator()
-    return df
+# -------- Plan --------
+# כל צומת בתוכנית = סדרה אחת, עם שם עמודה שנגזר מהפרמטרים (למשל SMA_50_close).
+# צמתים זהים (גם בין חוקי כניסה ויציאה, וגם ה-EMAs שמאחורי MACD) מחושבים פעם אחת.
+class IndicatorNode(NamedTuple):
+    name: str
+    kind: str                 # rsi | sma | ema | macd | macd_signal | macd_hist
+    source: str
+    params: Tuple[int, ...]
+    deps: Tuple[str, ...] = ()
 
-def calculate_ema(df: pd.DataFrame, period: int = 20, source: str = "close", **_: Any):
-    s = _get_series(df, source)
-    df["EMA"] = ta.trend.EMAIndicator(s, window=period).ema_indicator()
-    return df
+DEFAULT_PARAMS = {
+    "rsi": {"period": 14},
+    "sma": {"period": 20},
+    "ema": {"period": 20},
+    "macd": {"fast": 12, "slow": 26, "signal": 9},
+}
 
-def calculate_macd(
-    df: pd.DataFrame,
-    fast: int = 12,
-    slow: int = 26,
-    signal: int = 9,
-    source: str = "close",
-    **_: Any,
-):
-    s = _get_series(df, source)
-    macd = ta.trend.MACD(s, window_slow=slow, window_fast=fast, window_sign=signal)
-    df["MACD"] = macd.macd()
-    df["MACD_SIGNAL"] = macd.macd_signal()
-    df["MACD_HIST"] = macd.macd_diff()
-    return df
+def _int_param(params: Dict[str, Any], name: str, default: int) -> int:
+    value = params.get(name)
+    return default if value is None else int(value)
+
+def _ema_node(source: str, period: int) -> IndicatorNode:
+    return IndicatorNode(f"EMA_{period}_{source}", "ema", source, (period,))
+
+def _sma_node(source: str, period: int) -> IndicatorNode:
+    return IndicatorNode(f"SMA_{period}_{source}", "sma", source, (period,))
+
+def _macd_nodes(source: str, fast: int, slow: int, signal: int) -> List[IndicatorNode]:
+    ema_fast, ema_slow = _ema_node(source, fast), _ema_node(source, slow)
+    line = IndicatorNode(f"MACD_{fast}_{slow}_{source}", "macd", source, (fast, slow), (ema_fast.name, ema_slow.name))
+    sig = IndicatorNode(f"MACD_SIGNAL_{fast}_{slow}_{signal}_{source}", "macd_signal", source, (fast, slow, signal), (line.name,))
+    hist = IndicatorNode(f"MACD_HIST_{fast}_{slow}_{signal}_{source}", "macd_hist", source, (fast, slow, signal), (line.name, sig.name))
+    return [ema_fast, ema_slow, line, sig, hist]
+
+def _rule_nodes(rule: "IndicatorRuleLike", df_columns=("close",)) -> Tuple[List[IndicatorNode], Optional[str]]:
+    """הצמתים שחוק אחד צריך בסדר טופולוגי, ושם העמודה שמחזיקה את ערך החוק (None = לא ממומש)."""
+    ind_name = str(_get_rule_field(rule, "indicator") or "").lower()
+    params = {**DEFAULT_PARAMS.get(ind_name, {}), **(_get_rule_field(rule, "params", {}) or {})}
+    source = _resolve_source(df_columns, params.get("source"))
+
+    if ind_name in ("rsi", "sma", "ema"):
+        period = _int_param(params, "period", DEFAULT_PARAMS[ind_name]["period"])
+        if ind_name == "rsi":
+            node = IndicatorNode(f"RSI_{period}_{source}", "rsi", source, (period,))
+        else:
+            node = _ema_node(source, period) if ind_name == "ema" else _sma_node(source, period)
+        return [node], node.name
+    if ind_name == "macd":
+        nodes = _macd_nodes(
+            source,
+            _int_param(params, "fast", 12),
+            _int_param(params, "slow", 26),
+            _int_param(params, "signal", 9),
+        )
+        return nodes, nodes[2].name  # קו ה-MACD
+    return [], None
+
+def _compare_node(rule: "IndicatorRuleLike", df_columns=("close",)) -> Optional[IndicatorNode]:
+    """compare_to=sma/ema: הממוצע (compare_period) על אותו source של החוק, שמולו משווים במקום value."""
+    kind = str(_get_rule_field(rule, "compare_to") or "none").lower()
+    if kind not in ("sma", "ema"):
+        return None
+    source = _resolve_source(df_columns, (_get_rule_field(rule, "params", {}) or {}).get("source"))
+    period = _get_rule_field(rule, "compare_period") or DEFAULT_PARAMS[kind]["period"]
+    return _ema_node(source, int(period)) if kind == "ema" else _sma_node(source, int(period))
+
+def compare_column(rule: "IndicatorRuleLike", df_columns=("close",)) -> Optional[str]:
+    """שם העמודה של compare_to=sma/ema (למשל SMA_50_close), או None."""
+    node = _compare_node(rule, df_columns)
+    return node.name if node else None
+
+def iter_rule_leaves(rules: List["IndicatorRuleLike"]):
+    """כל החוקים (IndicatorRule) בתוך רשימה שיכולה להכיל קבוצות מקוננות (RuleGroup)."""
+    for rule in rules or []:
+        children = _get_rule_field(rule, "rules")
+        if children is not None:
+            yield from iter_rule_leaves(children)
+        else:
+            yield rule
+
+def indicator_column(rule: "IndicatorRuleLike", df_columns=("close",)) -> str:
+    """
+    שם העמודה שמחזיקה את הערך של החוק, למשל RSI_14_close / SMA_50_close / MACD_12_26_close (קו ה-MACD).
+    df_columns: העמודות של ה-DF – source שלא קיים בו נופל ל-close, כמו בחישוב.
+    """
+    _, column = _rule_nodes(rule, df_columns)
+    # אינדיקטור שעוד לא ממומש – שם ישן, כמו קודם
+    return column or str(_get_rule_field(rule, "indicator") or "").upper()
+
+def build_indicator_plan(rules: List["IndicatorRuleLike"], df_columns=("close",)) -> List[IndicatorNode]:
+    """רשימת צמתים ייחודיים בסדר חישוב (תלויות לפני מי שצריך אותן)."""
+    plan: "OrderedDict[str, IndicatorNode]" = OrderedDict()
+    for rule in iter_rule_leaves(rules):
+        nodes, _ = _rule_nodes(rule, df_columns)
+        if not nodes and _get_rule_field(rule, "indicator"):
+            print(f"Indicator {_get_rule_field(rule, 'indicator')} not implemented yet.")
+        compare = _compare_node(rule, df_columns)
+        for node in nodes + ([compare] if compare else []):
+            plan.setdefault(node.name, node)
+    return list(plan.values())
+
+# -------- Cache --------
+# (data version של סדרת המקור, שם הצומת) -> ערכים. data version = hash של ערכי המקור,
+# כך שנרות חדשים / טווח אחר יוצרים מפתח חדש ולא מחזירים סדרה ישנה.
+_cache: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+
+def _data_version(series: pd.Series) -> str:
+    values = np.ascontiguousarray(series.to_numpy(dtype=np.float64))
+    return hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+
+def _cache_get(key: Tuple[str, str]) -> Optional[np.ndarray]:
+    values = _cache.get(key)
+    if values is not None:
+        _cache.move_to_end(key)
+    return values
+
+def _cache_put(key: Tuple[str, str], values: np.ndarray) -> None:
+    if settings.INDICATOR_CACHE_SIZE <= 0:
+        return
+    _cache[key] = values
+    _cache.move_to_end(key)
+    while len(_cache) > settings.INDICATOR_CACHE_SIZE:
+        _cache.popitem(last=False)
+
+def clear_indicator_cache() -> None:
+    _cache.clear()
+
+# -------- Indicators --------
+def _compute_node(node: IndicatorNode, source: pd.Series, done: Dict[str, pd.Series]) -> pd.Series:
+    if node.kind == "rsi":
+        return ta.momentum.RSIIndicator(source, window=node.params[0]).rsi()
+    if node.kind == "sma":
+        return ta.trend.SMAIndicator(source, window=node.params[0]).sma_indicator()
+    if node.kind == "ema":
+        return ta.trend.EMAIndicator(source, window=node.params[0]).ema_indicator()
+    if node.kind == "macd":
+        # זהה ל-ta.trend.MACD, רק שה-EMAs משותפים עם חוקי EMA / MACD אחרים
+        return done[node.deps[0]] - done[node.deps[1]]
+    if node.kind == "macd_signal":
+        return ta.trend.EMAIndicator(done[node.deps[0]], window=node.params[2]).ema_indicator()
+    if node.kind == "macd_hist":
+        return done[node.deps[0]] - done[node.deps[1]]
+    raise ValueError(f"Unknown indicator node {node.kind}")
 
 # -------- Dispatcher --------
 IndicatorRuleLike = Union[Dict[str, Any], Any]  # Pydantic או dict
@@ -56,36 +179,39 @@ def calculate_indicators(df: pd.DataFrame, rules: List[IndicatorRuleLike], timef
     df: DataFrame עם OHLC
     rules: רשימת חוקים לכל מניה (יכול להיות Pydantic או dict)
     timeframe: נשמר לשימוש עתידי אם תרצה cross-TF
-    """
-    indicator_map = {
-        "rsi": calculate_rsi,
-        "sma": calculate_sma,
-        "ema": calculate_ema,
-        "macd": calculate_macd,
-        # הוסף כאן אינדיקטורים נוספים לפי הצורך
-    }
 
+    מוסיף עמודה לכל צומת בתוכנית (indicator_column(rule) נותן את שם העמודה של חוק).
+    עמודה שכבר קיימת ב-df לא מחושבת שוב, וסדרות שכבר חושבו על אותם נתונים נלקחות מה-cache.
+    """
     if not rules:
         return df
 
-    for rule in rules:
-        ind_name = _get_rule_field(rule, "indicator")
-        params = _get_rule_field(rule, "params", {}) or {}
-
-        if not ind_name:
+    plan = build_indicator_plan(rules, df.columns)
+    done: Dict[str, pd.Series] = {}
+    versions: Dict[str, str] = {}
+    for node in plan:
+        if node.name in df.columns:
+            done[node.name] = df[node.name]
             continue
-
-        func = indicator_map.get(str(ind_name).lower())
-        if func:
-            # הפונקציות מקבלות **kwargs ולכן params יכול לכלול source/period/fast/...
-            df = func(df, **params)
+        source = _get_series(df, node.source)
+        if node.source not in versions:
+            versions[node.source] = _data_version(source)
+        key = (versions[node.source], node.name)
+        values = _cache_get(key)
+        if values is None:
+            series = _compute_node(node, source, done)
+            values = series.to_numpy(dtype=np.float64, copy=True)
+            values.flags.writeable = False  # משותף בין DataFrames – לא לשנות במקום
+            _cache_put(key, values)
         else:
-            print(f"Indicator {ind_name} not implemented yet.")
+            series = pd.Series(values, index=df.index)
+        done[node.name] = series
+        df[node.name] = values
 
     return df
 
 # פונקציה עוטפת ל-exit_conditions: שולפת רק תנאי יציאה מסוג אינדיקטור ומעבירה ל-calculate_indicators
-def calculate_exit_indicators(df: pd.DataFrame, exit_conditions: List[Any], timeframe: str):
+def exit_indicator_rules(exit_conditions: List[Any]) -> List[IndicatorRuleLike]:
     indicator_rules = []
     for cond in exit_conditions or []:
         # Pydantic: cond.type / cond.indicator_rule ; dict: cond["type"] / cond["indicator_rule"]
@@ -94,5 +220,7 @@ def calculate_exit_indicators(df: pd.DataFrame, exit_conditions: List[Any], time
             ir = cond.indicator_rule if hasattr(cond, "indicator_rule") else cond.get("indicator_rule")
             if ir:
                 indicator_rules.append(ir)
+    return indicator_rules
 
-    return calculate_indicators(df, indicator_rules, timeframe)
+def calculate_exit_indicators(df: pd.DataFrame, exit_conditions: List[Any], timeframe: str):
+    return calculate_indicators(df, exit_indicator_rules(exit_conditions), timeframe)
@@ -0,0 +1,185 @@
+# app/services/jobs.py
+"""
+Backtest jobs: submit returns a job id right away, and a fixed number of workers (JOB_WORKERS) run the queued
+jobs on top of iter_backtest – so a long backtest no longer lives inside the HTTP request.
+Each job reports progress, can be cancelled (queued or running), and keeps its results for JOB_TTL_SECONDS.
+Every client can have at most JOB_MAX_PER_CLIENT queued/running jobs.
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .backtest import iter_backtest
+from .fin_apis.scheduler import PRIORITY_BACKGROUND
+from ..models import StockStrategy
+from ..settings import settings
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobLimitExceeded(Exception):
+    """The client already has JOB_MAX_PER_CLIENT active jobs, or the queue is full."""
+
+
+class BacktestJob:
+    def __init__(self, stocks: List[StockStrategy], owner: str):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.stocks = stocks
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.completed = 0
+        self.failed = 0
+        self.results: List[Optional[Dict]] = [None] * len(stocks)
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status not in FINISHED
+
+    @property
+    def run_seconds(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.time()) - self.started_at
+
+    def info(self) -> Dict[str, Any]:
+        total = len(self.stocks)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "progress": self.completed / total if total else 1.0,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queued_seconds": (self.started_at or time.time()) - self.created_at,
+            "run_seconds": self.run_seconds,
+            "error": self.error,
+        }
+
+    async def run(self) -> None:
+        # עבודת רקע: משיכות מהספק מחכות לבקשות אינטראקטיביות
+        async for index, result in iter_backtest(self.stocks, return_exceptions=True, priority=PRIORITY_BACKGROUND):
+            self.completed += 1
+            if isinstance(result, Exception):
+                self.failed += 1
+                result = {"symbol": self.stocks[index].symbol, "error": str(result)}
+            self.results[index] = result
+
+
+class JobQueue:
+    def __init__(self):
+        self.jobs: Dict[str, BacktestJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._run_times: List[float] = []
+        self._closing = False
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < max(1, settings.JOB_WORKERS):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def _purge(self) -> None:
+        cutoff = time.time() - settings.JOB_TTL_SECONDS
+        for job_id in [j.id for j in self.jobs.values() if not j.active and (j.finished_at or 0) < cutoff]:
+            del self.jobs[job_id]
+
+    def submit(self, stocks: List[StockStrategy], owner: str = "") -> BacktestJob:
+        self._purge()
+        if sum(1 for j in self.jobs.values() if j.active and j.owner == owner) >= settings.JOB_MAX_PER_CLIENT:
+            raise JobLimitExceeded(f"Too many active jobs (max {settings.JOB_MAX_PER_CLIENT} per client)")
+        if self.queue_depth >= settings.JOB_MAX_QUEUED:
+            raise JobLimitExceeded(f"Job queue is full ({settings.JOB_MAX_QUEUED})")
+
+        self._ensure_workers()
+        job = BacktestJob(stocks, owner)
+        self.jobs[job.id] = job
+        self._queue.put_nowait(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[BacktestJob]:
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[BacktestJob]:
+        job = self.jobs.get(job_id)
+        if job is None or not job.active:
+            return job
+        if job.task is not None:
+            job.task.cancel()  # הסטטוס מתעדכן ב-worker
+        else:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.status != QUEUED:  # בוטל בזמן שחיכה בתור
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+                job.task = asyncio.create_task(job.run())
+                try:
+                    await job.task
+                    job.status = DONE
+                except asyncio.CancelledError:
+                    job.status = CANCELLED
+                    # ה-worker עצמו מבוטל (shutdown): הביטול עובר גם ל-job.task, אז job.task.cancelled()
+                    # לא מבדיל בין המקרים – בלי raise ה-worker חוזר ל-queue.get וה-shutdown תקוע
+                    if self._closing or not job.task.cancelled():
+                        raise
+                except Exception as e:
+                    job.status = FAILED
+                    job.error = str(e)
+                    print(f"❌ Backtest job {job.id} failed: {e}")
+                finally:
+                    job.finished_at = time.time()
+                    job.task = None
+                    self._run_times = (self._run_times + [job.run_seconds])[-100:]
+            finally:
+                self._queue.task_done()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for j in self.jobs.values() if j.status == QUEUED)
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        run_times = self._run_times
+        return {
+            "workers": len([w for w in self._workers if not w.done()]),
+            "queue_depth": counts[QUEUED],
+            "jobs": counts,
+            # זמני ריצה של 100 העבודות האחרונות
+            "avg_run_seconds": sum(run_times) / len(run_times) if run_times else None,
+            "max_run_seconds": max(run_times) if run_times else None,
+        }
+
+    async def shutdown(self) -> None:
+        self._closing = True
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._closing = False
+
+
+job_queue = JobQueue()
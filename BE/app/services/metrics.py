@@ -0,0 +1,231 @@
+# app/services/metrics.py
+"""
+Process-wide metrics in the Prometheus text format (served at /metrics by factory.create_app):
+counters, latency histograms and callback gauges, in a small in-house registry (no prometheus_client dependency).
+Timing spans (Histogram.time) also feed an optional per-request breakdown (start_breakdown), which the app returns
+as a Server-Timing header when DEBUG_TIMINGS is on.
+Stages that run in a process-pool worker are timed there with stage_timer and recorded here (record_stages).
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# שם שלב -> [סה"כ שניות, מספר מדידות] של הבקשה הנוכחית (None = לא נאסף)
+_breakdown: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("timing_breakdown", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        return iter(())
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_fmt(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, timing_name: str = ""):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # קידומת לשם השלב ב-breakdown של הבקשה (ערכי ה-labels מצטרפים אליה)
+        self.timing_name = timing_name
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(elapsed, **labels)
+            record_timing(".".join([p for p in (self.timing_name, *self._key(labels)) if p]), elapsed)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def samples(self) -> Iterator[str]:
+        for key in sorted(self._counts):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), self._counts[key]):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(self._sums[key])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+class Gauge(_Metric):
+    """ערך שנקרא בזמן ה-scrape מתוך פונקציה (עומק תור, גודל cache...)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> Iterator[str]:
+        try:
+            yield f"{self.name} {_fmt(self.read())}"
+        except Exception as e:
+            print(f"❌ Could not read gauge {self.name}: {e}")
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, **kwargs))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help, read))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+BACKTEST_STAGE_SECONDS = REGISTRY.histogram(
+    "backtest_stage_seconds", "Time spent per backtest stage", ["stage"])
+BACKTEST_BARS = REGISTRY.counter(
+    "backtest_bars_processed_total", "Bars run through indicators, signals and the trade simulation")
+BACKTEST_STOCKS = REGISTRY.counter(
+    "backtest_stocks_total", "Per-stock backtests by outcome (computed / cached / error)", ["outcome"])
+OHLC_LOADS = REGISTRY.counter(
+    "ohlc_loads_total", "OHLC loads by source (cache = local Arrow cache, derived = resampled, db)", ["source"])
+RESULT_CACHE_LOOKUPS = REGISTRY.counter(
+    "backtest_result_cache_lookups_total", "Per-stock result cache lookups", ["result"])
+PROVIDER_SECONDS = REGISTRY.histogram(
+    "provider_fetch_seconds", "Market-data provider fetch latency", ["provider", "outcome"], timing_name="provider")
+PROVIDER_CALLS = REGISTRY.counter(
+    "provider_calls_total", "Market-data provider fetches by outcome (ok / empty / error / timeout)", ["provider", "outcome"])
+PROVIDER_THROTTLE_SECONDS = REGISTRY.histogram(
+    "provider_throttle_wait_seconds", "Time a provider request waited for its credit budget (token bucket)", ["provider"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+AI_SECONDS = REGISTRY.histogram(
+    "ai_request_seconds", "ask_ai_free latency", ["provider"], timing_name="ai")
+AI_REQUESTS = REGISTRY.counter(
+    "ai_requests_total", "ask_ai_free calls by outcome (ok / error)", ["provider", "outcome"])
+WS_TICK_SECONDS = REGISTRY.histogram(
+    "ws_tick_seconds", "Websocket tick handling time (compute = candles + indicators + decision, send)", ["phase"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0), timing_name="ws")
+WS_TICKS = REGISTRY.counter("ws_ticks_total", "Ticks processed on the websocket stream")
+
+
+# ---------- per-request breakdown ----------
+def start_breakdown() -> Tuple[Dict[str, List[float]], object]:
+    """מתחיל לאסוף breakdown לבקשה הנוכחית (וכל ה-tasks שנוצרים ממנה). מחזיר (dict, token ל-reset)."""
+    breakdown: Dict[str, List[float]] = {}
+    return breakdown, _breakdown.set(breakdown)
+
+
+def stop_breakdown(token) -> None:
+    _breakdown.reset(token)
+
+
+def record_timing(name: str, seconds: float) -> None:
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        entry = breakdown.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+def server_timing(breakdown: Dict[str, List[float]], total: Optional[float] = None) -> str:
+    """ערך ל-header Server-Timing: שלב;dur=ms (סכום על כל המניות בבקשה) ;desc="n=כמה פעמים"."""
+    parts = [f'{name};dur={seconds * 1000:.2f};desc="n={n}"' for name, (seconds, n) in breakdown.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# ---------- stages in worker processes ----------
+@contextmanager
+def stage_timer(timings: Dict[str, float], stage: str):
+    """מודד שלב לתוך dict רגיל – עובד גם ב-process pool, שם ה-registry של התהליך הראשי לא נגיש."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def record_stages(timings: Dict[str, float]) -> None:
+    for stage, seconds in timings.items():
+        BACKTEST_STAGE_SECONDS.observe(seconds, stage=stage)
+        record_timing(stage, seconds)
@@ -0,0 +1,213 @@
+"""
+Portfolio backtest: כל המניות חולקות קופה אחת.
+הסיגנלים של כל מניה מחושבים בנפרד (במקביל, ב-process pool), ואז מעבר אחד על ציר זמן ממוזג:
+k-way merge עם heap שמחזיק לכל מניה רק את האירוע הבא שלה (כניסה אפשרית / יציאה מתוכננת) –
+כך ה-heap בגודל מספר המניות, ולא מחזיקים ציר זמן ממוזג של מניות × נרות.
+נקודת היציאה של פוזיציה תלויה רק במחירים של המניה עצמה, ולכן היא נמצאת כבר בכניסה (_find_exit),
+והלולאה רצה רק על כניסות/יציאות ולא על כל נר.
+"""
+import asyncio
+import heapq
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .backtest import load_ohlc, _date_range
+from .compute import portfolio_inputs
+from .cpu_pool import run_cpu
+from .process_trades import _exit_thresholds, _find_exit, summarize_trades
+from ..models import PortfolioBacktestRequest, StockStrategy
+from ..settings import settings
+
+# בזמן זהה: קודם יציאות (משחררות כסף), אחר כך כניסות
+EXIT, ENTRY = 0, 1
+
+
+class _Position:
+    __slots__ = ("k", "entry_bar", "exit_bar", "entry_price", "shares", "allocation", "entry_event", "exit_event")
+
+    def __init__(self, k: int, entry_bar: int, exit_bar: Optional[int], entry_price: float, shares: float,
+                 allocation: float, entry_event: int):
+        self.k = k
+        self.entry_bar = entry_bar
+        self.exit_bar = exit_bar
+        self.entry_price = entry_price
+        self.shares = shares
+        self.allocation = allocation
+        self.entry_event = entry_event
+        self.exit_event: Optional[int] = None
+
+
+def _price_at(data: Dict[str, np.ndarray], t: int) -> float:
+    """המחיר האחרון הידוע של מניה בזמן t (mark-to-market)."""
+    i = int(np.searchsorted(data["times"], t, side="right")) - 1
+    return float(data["close"][max(i, 0)])
+
+
+def _event_drawdown(
+    inputs: List[Dict[str, np.ndarray]],
+    event_times: np.ndarray,
+    cash_after: np.ndarray,
+    history: List[_Position],
+    capital: float,
+) -> float:
+    """
+    Max drawdown (%) של ה-equity בנקודות האירוע, וקטורי אחרי הסימולציה:
+    equity = cash + Σ shares * המחיר האחרון הידוע של כל מניה באותו רגע.
+    עובר מניה-מניה, כך שהזיכרון הוא O(אירועים) ולא מניות × נרות.
+    """
+    n_events = len(event_times)
+    if n_events == 0:
+        return 0.0
+    equity = cash_after.astype(np.float64, copy=True)
+    by_symbol: Dict[int, List[_Position]] = {}
+    for pos in history:
+        by_symbol.setdefault(pos.k, []).append(pos)
+    for k, held in by_symbol.items():
+        # כמה מניות מוחזקות אחרי כל אירוע: מהאירוע של הכניסה ועד (לא כולל) האירוע של היציאה
+        shares = np.zeros(n_events + 1)
+        for pos in held:
+            shares[pos.entry_event] += pos.shares
+            shares[n_events if pos.exit_event is None else pos.exit_event] -= pos.shares
+        held_shares = np.cumsum(shares[:-1])
+        bars = np.searchsorted(inputs[k]["times"], event_times, side="right") - 1
+        equity += held_shares * inputs[k]["close"][np.maximum(bars, 0)]
+    peak = np.maximum.accumulate(np.concatenate(([capital], equity)))[1:]
+    return float(np.max((peak - equity) / peak) * 100)
+
+
+def simulate_portfolio(
+    inputs: List[Dict[str, np.ndarray]],
+    stocks: List[StockStrategy],
+    capital: float,
+    max_position_pct: float = 1.0,
+    max_positions: Optional[int] = None,
+) -> Dict:
+    cash = capital
+    positions: Dict[int, _Position] = {}
+    trades: List[Dict] = []
+    skipped = 0
+    max_open = 0
+    event_times: List[int] = []
+    cash_after: List[float] = []
+    history: List[_Position] = []
+    thresholds = [_exit_thresholds(stock) for stock in stocks]
+
+    def equity_at(t: int) -> float:
+        return cash + sum(p.shares * _price_at(inputs[p.k], t) for p in positions.values())
+
+    def next_entry(k: int, from_bar: int):
+        entries = inputs[k]["entries"]
+        e = int(np.searchsorted(entries, from_bar))
+        if e < len(entries):
+            bar = int(entries[e])
+            heapq.heappush(heap, (int(inputs[k]["times"][bar]), ENTRY, k, bar))
+
+    heap: list = []
+    for k in range(len(inputs)):
+        next_entry(k, 0)
+
+    while heap:
+        t, kind, k, bar = heapq.heappop(heap)
+        data, stock = inputs[k], stocks[k]
+
+        if kind == EXIT:
+            pos = positions.pop(k)
+            pos.exit_event = len(event_times)
+            price = float(data["close"][bar])
+            pnl = (price - pos.entry_price) * pos.shares
+            cash += pos.shares * price
+            trades.append({
+                "symbol": stock.symbol,
+                "entry_date": pd.Timestamp(data["dates"][pos.entry_bar]),
+                "exit_date": pd.Timestamp(data["dates"][bar]),
+                "entry_price": pos.entry_price,
+                "exit_price": price,
+                "shares": pos.shares,
+                "allocation": pos.allocation,
+                "pnl": pnl,
+                "pct_return": pnl / pos.allocation * 100,
+                "type": "BUY",
+            })
+            next_entry(k, bar + 1)
+        else:
+            # equity (mark-to-market) נחוץ רק כשיש מגבלת % – אחרת חוסכים את המעבר על הפוזיציות הפתוחות
+            equity = equity_at(t) if max_position_pct < 1 else float("inf")
+            size = min(stock.investment, max_position_pct * equity, cash)
+            if (max_positions is not None and len(positions) >= max_positions) or size <= 0:
+                skipped += 1
+                next_entry(k, bar + 1)
+                continue
+            entry_price = float(data["close"][bar])
+            shares = size / entry_price
+            # TP/SL מוגדרים בכסף ביחס ל-investment המלא – בפוזיציה קטנה יותר הם קטנים באותו יחס
+            scale = size / stock.investment
+            tp, sl = thresholds[k]
+            exit_bar = _find_exit(
+                data["close"], data["exit_signal"], bar + 1, entry_price, shares,
+                None if tp is None else tp * scale, None if sl is None else sl * scale,
+            )
+            cash -= size
+            positions[k] = _Position(k, bar, exit_bar, entry_price, shares, size, len(event_times))
+            history.append(positions[k])
+            max_open = max(max_open, len(positions))
+            if exit_bar is not None:
+                heapq.heappush(heap, (int(data["times"][exit_bar]), EXIT, k, exit_bar))
+
+        event_times.append(t)
+        cash_after.append(cash)
+
+    # פוזיציות שנשארו פתוחות – לפי המחיר האחרון של כל מניה
+    open_positions = [
+        {
+            "symbol": stocks[p.k].symbol,
+            "entry_date": pd.Timestamp(inputs[p.k]["dates"][p.entry_bar]),
+            "entry_price": p.entry_price,
+            "shares": p.shares,
+            "allocation": p.allocation,
+            "last_price": float(inputs[p.k]["close"][-1]),
+            "unrealized_pnl": (float(inputs[p.k]["close"][-1]) - p.entry_price) * p.shares,
+        }
+        for p in positions.values()
+    ]
+    final_equity = cash + sum(p["shares"] * p["last_price"] for p in open_positions)
+    # drawdown נמדד בנקודות האירוע (כניסות/יציאות), עם הפוזיציות הפתוחות לפי המחיר באותו רגע
+    max_drawdown_pct = _event_drawdown(
+        inputs, np.array(event_times, dtype=np.int64), np.array(cash_after), history, capital,
+    )
+    closed = summarize_trades(trades, capital)
+
+    return {
+        "summary": {
+            **closed,
+            "final_equity": final_equity,
+            "cash": cash,
+            "return_pct": (final_equity - capital) / capital * 100,
+            "max_drawdown_pct": max_drawdown_pct,
+            "max_concurrent_positions": max_open,
+            "skipped_entries": skipped,
+        },
+        "per_symbol": {
+            stock.symbol: summarize_trades([t for t in trades if t["symbol"] == stock.symbol], stock.investment)
+            for stock in stocks
+        },
+        "trades": trades,
+        "open_positions": open_positions,
+    }
+
+
+async def run_portfolio_backtest(req: PortfolioBacktestRequest) -> Dict:
+    started = time.perf_counter()
+    load_slots = asyncio.Semaphore(max(1, settings.BACKTEST_MAX_CONCURRENT_LOADS))
+
+    async def prepare(stock: StockStrategy):
+        start_date, end_date = _date_range(stock)
+        async with load_slots:
+            ohlc = await load_ohlc(stock.symbol, stock.timeframe, start_date, end_date)
+        return await run_cpu(portfolio_inputs, ohlc, stock)
+
+    inputs = await asyncio.gather(*(prepare(stock) for stock in req.stocks))
+    result = simulate_portfolio(inputs, req.stocks, req.capital, req.max_position_pct, req.max_positions)
+    return {**result, "capital": req.capital, "elapsed_seconds": time.perf_counter() - started}
@@ -1,93 +1,156 @@
+import numpy as np
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from ..models import StockStrategy
 
-async def process_trades(ohlc: pd.DataFrame, stock: StockStrategy):
+# גודל הבלוק הראשון בחיפוש נקודת היציאה; מוכפל בכל סיבוב (exponential search)
+EXIT_SCAN_BLOCK = 64
+
+def _exit_thresholds(stock: StockStrategy) -> Tuple[Optional[float], Optional[float]]:
+    """
+    TP/SL כספים: pnl >= tp או pnl <= -sl.
+    כמה תנאים מאותו סוג -> מספיק שאחד יתקיים, כלומר הסף הנמוך מביניהם.
+    """
+    tps = [c.value for c in stock.exit_conditions if c.type == "take_profit" and c.value is not None]
+    sls = [c.value for c in stock.exit_conditions if c.type == "stop_loss" and c.value is not None]
+    return (min(tps) if tps else None), (min(sls) if sls else None)
+
+def _find_exit(
+    close: np.ndarray,
+    exit_signal: np.ndarray,
+    start: int,
+    entry_price: float,
+    shares: float,
+    tp: Optional[float],
+    sl: Optional[float],
+) -> Optional[int]:
+    """
+    הבר הראשון מ-start והלאה שבו מתקיים TP / SL / exit_signal, או None אם העסקה לא נסגרת.
+    סורק בבלוקים שגדלים פי 2 – כך עלות כל עסקה פרופורציונלית לאורכה ולא לאורך כל הסדרה.
+    """
+    n = len(close)
+    block = EXIT_SCAN_BLOCK
+    while start < n:
+        stop = min(n, start + block)
+        pnl = (close[start:stop] - entry_price) * shares
+        hit = exit_signal[start:stop].copy()
+        if tp is not None:
+            hit |= pnl >= tp
+        if sl is not None:
+            hit |= pnl <= -sl
+        if hit.any():
+            return start + int(np.argmax(hit))
+        start = stop
+        block *= 2
+    return None
+
+def simulate_trades(
+    ohlc: pd.DataFrame,
+    stock: StockStrategy,
+    with_columns: bool = True,
+    close_at_end: bool = False,
+) -> Tuple[pd.DataFrame, List[Dict]]:
     """
     Process buy/sell trades based on entry_signal and exit_conditions (TP/SL).
     Returns updated DF with in_position, position_type, pnl columns,
     and a list of executed trades.
-    """
+    with_columns=False: רק העסקאות – ה-DF חוזר כמו שהוא, בלי copy ובלי העמודות (sweep).
+    close_at_end=True: פוזיציה שעדיין פתוחה בבר האחרון נסגרת בו (עם "closed_at_end": True בעסקה),
+    במקום להיזרק – למשל בסוף חלון out-of-sample של walk-forward.
 
+    עובד על מערכי NumPy: קופץ מכניסה לכניסה עם searchsorted על אינדקסי ה-entry_signal,
+    ומוצא את היציאה בסריקה וקטורית – בלי לולאה על כל בר.
+    """
     if ohlc.empty:
         return ohlc, []
 
-    # הוספת עמודות ל-DF
-    ohlc = ohlc.copy()
-    ohlc["in_position"] = False
-    ohlc["position_type"] = None
-    ohlc["pnl"] = 0.0
-
-    trades = []
-    in_position = False
-    entry_price = 0.0
-    shares = 0
-    entry_index = None
+    n = len(ohlc)
+    close = ohlc["close"].to_numpy(dtype=np.float64)
+    entry_signal = ohlc["entry_signal"].to_numpy(dtype=bool) if "entry_signal" in ohlc.columns else np.zeros(n, dtype=bool)
+    exit_signal = ohlc["exit_signal"].to_numpy(dtype=bool) if "exit_signal" in ohlc.columns else np.zeros(n, dtype=bool)
+    dates = ohlc["datetime"] if "datetime" in ohlc.columns else ohlc.index.to_series()
+    tp, sl = _exit_thresholds(stock)
 
-    # קבלת ערכי יציאה
-    sl_or_tp = stock.exit_conditions
+    in_position = np.zeros(n, dtype=bool)
+    position_type = np.full(n, None, dtype=object)
+    pnl_col = np.zeros(n, dtype=np.float64)
 
     # TODO: בעתיד אפשר להמיר את הערכים לאחוזים אם יגיעו בערך מוחלט או אחוז
     # TODO: בעתיד להוסיף אפשרות SHORT
+    closed = []  # (entry bar, exit bar, entry_price, shares)
+    entries = np.flatnonzero(entry_signal)
+    pos = 0
+    forced = False  # העסקה האחרונה נסגרה בכוח בבר האחרון (close_at_end)
+    while True:
+        k = np.searchsorted(entries, pos)
+        if k >= len(entries):
+            break
+        i = int(entries[k])
+        entry_price = float(close[i])
+        shares = stock.investment / entry_price  # TODO: בדוק rounding אם צריך
+
+        j = _find_exit(close, exit_signal, i + 1, entry_price, shares, tp, sl)
+        forced = j is None and close_at_end and i < n - 1
+        if forced:
+            j = n - 1
+        last = n - 1 if j is None else j
+        in_position[i:last + 1] = True
+        position_type[i:last + 1] = "BUY"
+        pnl_col[i + 1:last + 1] = (close[i + 1:last + 1] - entry_price) * shares
+        if j is None:
+            break
+
+        position_type[j] = "SELL"
+        closed.append((i, j, entry_price, shares))
+        # אחרי יציאה אפשר להיכנס שוב רק מהבר הבא
+        pos = j + 1
+        if forced:
+            break
+
+    # תאריכים ואינדקסים נשלפים בבת אחת לכל העסקאות (iloc לכל עסקה בנפרד יקר)
+    entry_bars = [t[0] for t in closed]
+    exit_bars = [t[1] for t in closed]
+    trades = [
+        {
+            "entry_index": entry_index,
+            "exit_index": exit_index,
+            "entry_date": entry_date,
+            "exit_date": exit_date,
+            "entry_price": entry_price,
+            "exit_price": close[j],
+            "shares": shares,
+            "pnl": pnl_col[j],
+            "pct_return": (pnl_col[j] / (entry_price * shares)) * 100,
+            "type": "BUY"  # TODO: בעתיד להוסיף אפשרות SHORT
+        }
+        for (i, j, entry_price, shares), entry_index, exit_index, entry_date, exit_date in zip(
+            closed,
+            ohlc.index[entry_bars].tolist(),
+            ohlc.index[exit_bars].tolist(),
+            dates.iloc[entry_bars].tolist(),
+            dates.iloc[exit_bars].tolist(),
+        )
+    ]
+
+    if forced:
+        trades[-1]["closed_at_end"] = True
+
+    if not with_columns:
+        return ohlc, trades
 
-    for idx, row in ohlc.iterrows():
-        price = row["close"]
-
-        # כניסה לעסקה
-        if row.get("entry_signal", False) and not in_position:
-            in_position = True
-            entry_price = price
-            shares = stock.investment / price  # TODO: בדוק rounding אם צריך
-            entry_index = idx
-            ohlc.at[idx, "in_position"] = True
-            ohlc.at[idx, "position_type"] = "BUY"
-            # TODO: אפשרות להוסיף סוג הוראה (MKT, LMT וכו')
-            continue
-
-        # אם בעסקה פעילה
-        if in_position:
-            pnl = (price - entry_price) * shares
-            ohlc.at[idx, "in_position"] = True
-            ohlc.at[idx, "position_type"] = "BUY"
-            ohlc.at[idx, "pnl"] = pnl
-
-            # בדיקה ל-TP / SL אם קיימים
-            # TODO: implement technical indicators checks
-            exit_flag = False
-            for condition in sl_or_tp:  # עבר על כל תנאי יציאה
-              ctype = condition.type
-              cvalue = condition.value
-      
-              if ctype == "take_profit" and pnl >= cvalue:
-                  exit_flag = True
-              elif ctype == "stop_loss" and pnl <= -cvalue:
-                  exit_flag = True
-            
-            if row.get("exit_signal", False):
-                exit_flag = True
-
-            if exit_flag:
-                in_position = False
-                ohlc.at[idx, "position_type"] = "SELL"
-                trades.append({
-                    "entry_index": entry_index,
-                    "exit_index": idx,
-                    "entry_date": ohlc.at[entry_index, "datetime"],
-                    "exit_date": ohlc.at[idx, "datetime"],
-                    "entry_price": entry_price,
-                    "exit_price": price,
-                    "shares": shares,
-                    "pnl": pnl,
-                    "pct_return": (pnl / (entry_price * shares)) * 100,
-                    "type": "BUY"  # TODO: בעתיד להוסיף אפשרות SHORT
-                })
-                entry_price = 0.0
-                shares = 0
-                entry_index = None
-
+    ohlc = ohlc.copy()
+    ohlc["in_position"] = in_position
+    ohlc["position_type"] = pd.Series(position_type, index=ohlc.index, dtype=object)
+    ohlc["pnl"] = pnl_col
     return ohlc, trades
 
-from typing import List, Dict
+async def process_trades(ohlc: pd.DataFrame, stock: StockStrategy):
+    """
+    Process buy/sell trades based on entry_signal and exit_conditions (TP/SL).
+    Returns updated DF with in_position, position_type, pnl columns,
+    and a list of executed trades.
+    """
+    return simulate_trades(ohlc, stock)
 
 def summarize_trades(trades: List[Dict], start_capital: float) -> Dict:
     """
@@ -0,0 +1,124 @@
+# app/services/result_cache.py
+"""
+Content-addressed cache for per-stock backtest results.
+key = hash(canonical JSON of the StockStrategy) + hash(the OHLC it ran on), so the same strategy on the same
+candles is never recomputed, and new candles produce a new key. Entries of a symbol are also dropped as soon as
+new candles for it are saved (invalidate_results).
+In-memory LRU (RESULT_CACHE_SIZE), optionally persisted to Mongo (RESULT_CACHE_MONGO).
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from ..db.results_db import get_result, save_result, delete_results
+from ..models import StockStrategy
+from ..settings import settings
+
+# גרסת הלוגיקה של backtest_stock – להעלות כששינוי בקוד משנה תוצאות, כדי לא להחזיר תוצאות ישנות
+RESULT_VERSION = 3
+
+_memory: "OrderedDict[str, Tuple[str, Dict]]" = OrderedDict()  # key -> (symbol, result)
+_stats = {"hits": 0, "mongo_hits": 0, "misses": 0, "invalidated": 0}
+
+
+def data_fingerprint(ohlc: pd.DataFrame) -> str:
+    """hash של הנרות עצמם (זמנים + OHLCV)."""
+    h = hashlib.sha256()
+    h.update(str(len(ohlc)).encode())
+    if "datetime" in ohlc.columns:
+        dts = ohlc["datetime"].to_numpy()
+        if dts.dtype.kind != "M":
+            dts = pd.to_datetime(dts).to_numpy()
+        # יחידה (ms/ns) + ה-int64 עצמם; בלי המרה ל-ns – היא עולה יותר מה-hash
+        h.update(str(dts.dtype).encode())
+        h.update(np.ascontiguousarray(dts).view(np.int64).tobytes())
+    for col in ("open", "high", "low", "close", "volume"):
+        if col in ohlc.columns:
+            h.update(np.ascontiguousarray(ohlc[col].to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+def result_key(stock: StockStrategy, ohlc: pd.DataFrame) -> str:
+    strategy = json.dumps(stock.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{RESULT_VERSION}|{strategy}|{data_fingerprint(ohlc)}".encode()).hexdigest()
+
+
+def _remember(key: str, symbol: str, result: Dict) -> None:
+    if settings.RESULT_CACHE_SIZE <= 0:
+        return
+    _memory[key] = (symbol, result)
+    _memory.move_to_end(key)
+    while len(_memory) > settings.RESULT_CACHE_SIZE:
+        _memory.popitem(last=False)
+
+
+def _timestamp(value):
+    return None if value is None else pd.Timestamp(value)
+
+
+def _decode(result: Dict) -> Dict:
+    """
+    תוצאה מ-Mongo נשמרה דרך jsonable_encoder – התאריכים הם מחרוזות ISO.
+    מחזירים אותם ל-pd.Timestamp, כמו בתוצאה טרייה ובזיכרון.
+    """
+    trades = [
+        {**t, "entry_date": _timestamp(t.get("entry_date")), "exit_date": _timestamp(t.get("exit_date"))}
+        for t in result.get("trades", [])
+    ]
+    decoded = {**result, "trades": trades}
+    curve = result.get("equity_curve")
+    if curve and "datetime" in curve:
+        decoded["equity_curve"] = {**curve, "datetime": [_timestamp(v) for v in curve["datetime"]]}
+    return decoded
+
+
+async def get_cached_result(key: str) -> Optional[Dict]:
+    """התוצאה השמורה (עותק רדוד – לא לשנות את רשימת העסקאות במקום), או None."""
+    entry = _memory.get(key)
+    if entry is not None:
+        _memory.move_to_end(key)
+        _stats["hits"] += 1
+        return {**entry[1]}
+    if settings.RESULT_CACHE_MONGO:
+        try:
+            result = await get_result(key)
+        except Exception as e:
+            print(f"❌ Could not read cached result: {e}")
+            result = None
+        if result is not None:
+            result = _decode(result)
+            _stats["mongo_hits"] += 1
+            _remember(key, result.get("symbol", ""), result)
+            return {**result}
+    _stats["misses"] += 1
+    return None
+
+
+async def put_cached_result(key: str, stock: StockStrategy, result: Dict) -> None:
+    _remember(key, stock.symbol, result)
+    if settings.RESULT_CACHE_MONGO:
+        try:
+            await save_result(key, stock.symbol, stock.timeframe, jsonable_encoder(result))
+        except Exception as e:
+            print(f"❌ Could not save cached result: {e}")
+
+
+async def invalidate_results(symbol: str) -> None:
+    """נרות חדשים ל-symbol (בכל timeframe – גם timeframes שנגזרים ממנו) -> כל התוצאות שלו לא רלוונטיות."""
+    for key in [k for k, (s, _) in _memory.items() if s == symbol]:
+        del _memory[key]
+        _stats["invalidated"] += 1
+    if settings.RESULT_CACHE_MONGO:
+        try:
+            _stats["invalidated"] += await delete_results(symbol)
+        except Exception as e:
+            print(f"❌ Could not invalidate cached results: {e}")
+
+
+def result_cache_stats() -> Dict:
+    return {**_stats, "entries": len(_memory), "mongo": settings.RESULT_CACHE_MONGO}
@@ -0,0 +1,76 @@
+"""
+Monte Carlo על רצף העסקאות של backtest: כמה התוצאה תלויה במזל של הסדר / של העסקאות הספציפיות.
+כל הסימולציות רצות כמטריצות NumPy (סימולציה = שורה, עסקה = עמודה), בלי לולאת Python על מסלולים.
+- bootstrap: כל מסלול דוגם n עסקאות עם החזרה – פיזור של הון סופי, drawdown ו-win rate.
+- reshuffle: אותן עסקאות בסדר אקראי – ההון הסופי וה-win rate זהים, רק ה-drawdown משתנה.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# מקסימום תאים (סימולציות × עסקאות) למטריצה אחת – מעבר לזה מחלקים ל-batches כדי להגביל זיכרון
+MAX_BATCH_CELLS = 4_000_000
+
+
+def _distribution(values: np.ndarray, percentiles: List[float]) -> Dict:
+    return {
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "percentiles": {str(p): float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+    }
+
+
+def _paths_metrics(paths: np.ndarray, start_capital: float):
+    """paths: (סימולציות, עסקאות) של pnl. מחזיר הון סופי, max drawdown %, win rate % לכל מסלול."""
+    equity = start_capital + np.cumsum(paths, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), start_capital)
+    drawdown = ((peak - equity) / peak).max(axis=1) * 100
+    return equity[:, -1], drawdown, (paths > 0).mean(axis=1) * 100
+
+
+def monte_carlo(
+    pnl: np.ndarray,
+    start_capital: float,
+    simulations: int = 10000,
+    method: str = "bootstrap",
+    percentiles: Optional[List[float]] = None,
+    seed: Optional[int] = None,
+) -> Dict:
+    percentiles = percentiles or [5, 25, 50, 75, 95]
+    pnl = np.asarray(pnl, dtype=np.float64)
+    n = len(pnl)
+    rng = np.random.default_rng(seed)
+
+    final = np.empty(simulations)
+    drawdown = np.empty(simulations)
+    win_rate = np.empty(simulations)
+    batch = max(1, MAX_BATCH_CELLS // n)
+    for start in range(0, simulations, batch):
+        rows = min(batch, simulations - start)
+        if method == "reshuffle":
+            paths = rng.permuted(np.tile(pnl, (rows, 1)), axis=1)
+        else:
+            paths = pnl[rng.integers(0, n, size=(rows, n))]
+        final[start:start + rows], drawdown[start:start + rows], win_rate[start:start + rows] = _paths_metrics(paths, start_capital)
+
+    observed_final, observed_dd, observed_win = (m[0] for m in _paths_metrics(pnl[None, :], start_capital))
+    return {
+        "method": method,
+        "simulations": simulations,
+        "num_trades": n,
+        "start_capital": start_capital,
+        "observed": {
+            "final_capital": float(observed_final),
+            "max_drawdown_pct": float(observed_dd),
+            "win_rate": float(observed_win),
+        },
+        "final_capital": _distribution(final, percentiles),
+        "max_drawdown_pct": _distribution(drawdown, percentiles),
+        "win_rate": _distribution(win_rate, percentiles),
+        "prob_loss": float((final < start_capital).mean()),
+        # באיזה אחוזון נמצא ה-drawdown שנמדד בפועל (% מהמסלולים עם drawdown קטן או שווה לו):
+        # גבוה = לא היה מזל בסדר העסקאות (רוב הסדרים נותנים drawdown קטן יותר), נמוך = היה מזל
+        "observed_drawdown_percentile": float((drawdown <= observed_dd).mean() * 100),
+    }
@@ -0,0 +1,177 @@
+# app/services/rules.py
+"""
+מנוע חוקים משותף לכניסה וליציאה: רשימת IndicatorRule / RuleGroup (או תנאי יציאה) מתקמפלת לתוכנית –
+DAG של צמתים (עמודה, קבוע, השוואה, shift, and/or) – שמחושבת על מערכי NumPy.
+- קבועים נשארים scalar ועוברים broadcasting (בלי Series באורך ה-DF לכל value)
+- צמתים זהים נבנים פעם אחת (hash-consing): אותה עמודה / אותה השוואה / אותו shift בכמה חוקים = חישוב אחד
+- קבוצות AND/OR מקוננות, טווחים (value2) ו-compare_to (price / sma / ema)
+כך כל בדיקת החוקים היא כמה מעברים על מערכים, לפי מספר תתי-הביטויים השונים ולא לפי מספר החוקים.
+"""
+from functools import reduce
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .indicators.calc_indicators import indicator_column, compare_column, _get_rule_field
+
+_COMPARE = {
+    ">": np.greater,
+    "<": np.less,
+    ">=": np.greater_equal,
+    "<=": np.less_equal,
+}
+# ההשוואה ההפוכה (מחוץ לטווח) – לכל השוואה בגבולות הטווח
+_OUTSIDE = {">": "<=", ">=": "<", "<": ">=", "<=": ">"}
+
+Node = Tuple[Any, ...]
+
+
+class RulePlan:
+    """
+    תוכנית מקומפלת: nodes בסדר טופולוגי, כל node הוא (kind, *args) כש-args מפנים לאינדקסים של nodes קודמים.
+    kinds: col (שם עמודה), const (scalar), cmp (op, a, b), shift (a), and / or (*a).
+    """
+
+    def __init__(self):
+        self.nodes: List[Node] = []
+        self._ids: Dict[Node, int] = {}
+        self.root: Optional[int] = None
+
+    # ---------- building (hash-consing) ----------
+    def _add(self, node: Node) -> int:
+        node_id = self._ids.get(node)
+        if node_id is None:
+            node_id = self._ids[node] = len(self.nodes)
+            self.nodes.append(node)
+        return node_id
+
+    def col(self, name: str) -> int:
+        return self._add(("col", name))
+
+    def const(self, value: Any) -> int:
+        # הטיפוס חלק מהמפתח: False ו-0.0 שווים ב-hash אבל הם לא אותו צומת
+        return self._add(("const", value, type(value).__name__))
+
+    def cmp(self, op: str, a: int, b: int) -> int:
+        return self._add(("cmp", op, a, b))
+
+    def shift(self, a: int) -> int:
+        # הערך של הבר הקודם; קבוע נשאר קבוע
+        return a if self.nodes[a][0] == "const" else self._add(("shift", a))
+
+    def group(self, op: str, children: List[int]) -> int:
+        # פריסת and בתוך and (ו-or בתוך or), מיון והסרת כפילויות – כדי ש-CSE יתפוס גם סדר שונה
+        flat = set()
+        for child in children:
+            node = self.nodes[child]
+            flat.update(node[1:] if node[0] == op else (child,))
+        if not flat:
+            return self.const(False)  # קבוצה ריקה = אין סיגנל
+        if len(flat) == 1:
+            return flat.pop()
+        return self._add((op, *sorted(flat)))
+
+    # ---------- evaluation ----------
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        n = len(df)
+        if self.root is None or n == 0:
+            return np.zeros(n, dtype=bool)
+        values: List[Any] = []
+        for node in self.nodes:
+            kind = node[0]
+            if kind == "col":
+                values.append(df[node[1]].to_numpy(dtype=np.float64))
+            elif kind == "const":
+                values.append(node[1])
+            elif kind == "cmp":
+                values.append(_COMPARE[node[1]](values[node[2]], values[node[3]]))
+            elif kind == "shift":
+                values.append(_shift(values[node[1]]))
+            else:  # and / or
+                ufunc = np.logical_and if kind == "and" else np.logical_or
+                values.append(reduce(ufunc, (values[i] for i in node[1:])))
+        return np.broadcast_to(np.asarray(values[self.root], dtype=bool), (n,)).copy()
+
+
+def _shift(values: np.ndarray) -> np.ndarray:
+    """כמו Series.shift(1): בבר הראשון אין ערך קודם (NaN לסדרה, False לתנאי)."""
+    out = np.empty_like(values)
+    out[1:] = values[:-1]
+    out[0] = False if values.dtype == bool else np.nan
+    return out
+
+
+# ---------- compiler ----------
+def _comparand(plan: RulePlan, rule: Any, df_columns) -> int:
+    compare_to = str(_get_rule_field(rule, "compare_to") or "none").lower()
+    if compare_to == "price":
+        return plan.col("close")
+    if compare_to in ("sma", "ema"):
+        return plan.col(compare_column(rule, df_columns))
+    value = _get_rule_field(rule, "value")
+    # כמו קודם: value חסר / 0 / שלילי -> השוואה ל-close
+    if value is None or value is False or (isinstance(value, (int, float)) and value <= 0):
+        return plan.col("close")
+    return plan.const(float(value))
+
+
+def _compile_range(plan: RulePlan, op: str, series: int, low: float, high: float) -> int:
+    """value..value2: > / < = גבולות פתוחים, >= / <= = סגורים; crossesAbove = נכנס לטווח, crossesBelow = יוצא ממנו."""
+    low_op, high_op = (">", "<") if op in (">", "<") else (">=", "<=")
+    lo, hi = plan.const(low), plan.const(high)
+    inside = plan.group("and", [plan.cmp(low_op, series, lo), plan.cmp(high_op, series, hi)])
+    if op not in ("crossesAbove", "crossesBelow"):
+        return inside
+    # מחוץ לטווח נבדק במפורש (ולא not inside), כדי שבר בלי ערך (NaN) לא ייחשב "בחוץ"
+    outside = plan.group("or", [plan.cmp(_OUTSIDE[low_op], series, lo), plan.cmp(_OUTSIDE[high_op], series, hi)])
+    if op == "crossesAbove":
+        return plan.group("and", [plan.shift(outside), inside])
+    return plan.group("and", [plan.shift(inside), outside])
+
+
+def _compile_rule(plan: RulePlan, rule: Any, df_columns) -> int:
+    op = _get_rule_field(rule, "operator")
+    series = plan.col(indicator_column(rule, df_columns))
+    value2 = _get_rule_field(rule, "value2")
+    compare_to = str(_get_rule_field(rule, "compare_to") or "none").lower()
+    if value2 is not None and compare_to == "none":
+        value = float(_get_rule_field(rule, "value") or 0.0)
+        return _compile_range(plan, op, series, min(value, value2), max(value, value2))
+
+    other = _comparand(plan, rule, df_columns)
+    if op in _COMPARE:
+        return plan.cmp(op, series, other)
+    if op == "crossesAbove":
+        return plan.group("and", [plan.cmp("<=", plan.shift(series), plan.shift(other)), plan.cmp(">", series, other)])
+    if op == "crossesBelow":
+        return plan.group("and", [plan.cmp(">=", plan.shift(series), plan.shift(other)), plan.cmp("<", series, other)])
+    return plan.const(False)  # אופרטור לא מוכר – החוק לא מתקיים
+
+
+def _compile_node(plan: RulePlan, rule: Any, df_columns) -> int:
+    children = _get_rule_field(rule, "rules")
+    if children is not None:  # RuleGroup
+        op = str(_get_rule_field(rule, "op") or "and").lower()
+        return plan.group(op, [_compile_node(plan, child, df_columns) for child in children])
+    return _compile_rule(plan, rule, df_columns)
+
+
+def compile_rules(rules: List[Any], op: str = "and", df_columns=("close",)) -> RulePlan:
+    """רשימת חוקים/קבוצות -> תוכנית. op מחבר את החוקים ברמה העליונה (and לכניסה, or ליציאה)."""
+    plan = RulePlan()
+    plan.root = plan.group(op, [_compile_node(plan, rule, df_columns) for rule in rules or []])
+    return plan
+
+
+def compile_exit_conditions(exit_conditions: List[Any], df_columns=("close",)) -> RulePlan:
+    """
+    כל תנאי יציאה שיש לו indicator_rule, ב-OR (TP / SL נבדקים בסימולציה ולא כאן).
+    כמו ב-check_exit_conditions הישן – לא מסננים לפי type, כדי שהסיגנלים לא ישתנו.
+    """
+    rules = [
+        _get_rule_field(cond, "indicator_rule")
+        for cond in exit_conditions or []
+        if _get_rule_field(cond, "indicator_rule") is not None
+    ]
+    return compile_rules(rules, "or", df_columns)
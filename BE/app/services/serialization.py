@@ -0,0 +1,133 @@
+# app/services/serialization.py
+"""
+פורמטים לתשובת backtest (content negotiation ב-/strategies-test):
+- json: אותו מבנה כמו קודם (רשימת dict לכל עסקה), אבל מסודר עם orjson כשהוא מותקן – בלי jsonable_encoder
+- columnar: העסקאות של כל מניה כמערך לכל שדה (בלי המפתחות בכל עסקה), תאריכים כ-epoch ms
+- arrow: Arrow IPC stream – טבלת עסקאות אחת לכל המניות (עמודת symbol), וה-summary + עקומת ה-equity
+  של כל מניה כ-JSON ב-metadata של הסכמה (מפתח "results")
+"""
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import orjson
+except ImportError:  # orjson אופציונלי – נופלים ל-json הרגיל
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow אופציונלי – בלעדיו אין פורמט arrow
+    pa = None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+TRADE_FIELDS = (
+    "entry_index", "exit_index", "entry_date", "exit_date",
+    "entry_price", "exit_price", "shares", "pnl", "pct_return", "type",
+)
+DATE_FIELDS = ("entry_date", "exit_date")
+FLOAT_FIELDS = ("entry_price", "exit_price", "shares", "pnl", "pct_return")
+
+
+# ---------- JSON ----------
+def _default(obj: Any) -> Any:
+    """מה ש-orjson לא מכיר: Timestamp / NaT / numpy scalars (ואחרים דרך jsonable_encoder, כמו קודם)."""
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return jsonable_encoder(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(obj)).encode()
+
+
+# ---------- columnar ----------
+def _epoch_ms(values: List[Any]) -> List[int]:
+    """Timestamp (מהזיכרון) או מחרוזת ISO (מ-Mongo) -> epoch ms; תאריך חסר -> None."""
+    dates = pd.to_datetime(pd.Series(values, dtype=object))
+    ms = dates.to_numpy(dtype="datetime64[ms]").view(np.int64).tolist()
+    return [None if missing else v for v, missing in zip(ms, dates.isna().tolist())]
+
+
+def _floats(values: List[Any]) -> List[float]:
+    return np.asarray(values, dtype=np.float64).tolist()
+
+
+def columnar_trades(trades: List[Dict]) -> Dict[str, List[Any]]:
+    columns = {}
+    for field in TRADE_FIELDS:
+        values = [t.get(field) for t in trades]
+        if field in DATE_FIELDS:
+            values = _epoch_ms(values)
+        elif field in FLOAT_FIELDS:
+            values = _floats(values)
+        columns[field] = values
+    return columns
+
+
+def _columnar_curve(curve: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+    return {
+        field: _epoch_ms(values) if field == "datetime" else _floats(values)
+        for field, values in (curve or {}).items()
+    }
+
+
+def columnar_result(result: Dict) -> Dict:
+    """תוצאה של מניה אחת (backtest_stock) בפורמט עמודות."""
+    out = {**result, "trades": columnar_trades(result.get("trades") or [])}
+    if "equity_curve" in result:
+        out["equity_curve"] = _columnar_curve(result["equity_curve"])
+    return out
+
+
+# ---------- Arrow ----------
+def _index_array(values: List[Any]) -> "pa.Array":
+    """אינדקס ה-DF הוא בד"כ RangeIndex (int); אינדקס מסוג אחר נשמר כמחרוזת."""
+    if all(isinstance(v, (int, np.integer)) for v in values):
+        return pa.array(values, type=pa.int64())
+    return pa.array([str(v) for v in values], type=pa.string())
+
+
+def arrow_results(results: List[Dict]) -> bytes:
+    if pa is None:
+        raise RuntimeError("Arrow format requires pyarrow")
+    columns: Dict[str, List[Any]] = {field: [] for field in ("symbol",) + TRADE_FIELDS}
+    meta = []
+    for result in results:
+        trades = columnar_trades(result.get("trades") or [])
+        columns["symbol"].extend([result.get("symbol")] * len(trades["pnl"]))
+        for field in TRADE_FIELDS:
+            columns[field].extend(trades[field])
+        meta.append({k: v for k, v in result.items() if k != "trades"})
+        if "equity_curve" in result:
+            meta[-1]["equity_curve"] = _columnar_curve(result["equity_curve"])
+
+    arrays = {
+        "symbol": pa.array(columns["symbol"], type=pa.string()).dictionary_encode(),
+        "entry_index": _index_array(columns["entry_index"]),
+        "exit_index": _index_array(columns["exit_index"]),
+        "type": pa.array(columns["type"], type=pa.string()).dictionary_encode(),
+        **{f: pa.array(columns[f], type=pa.timestamp("ms")) for f in DATE_FIELDS},
+        **{f: pa.array(columns[f], type=pa.float64()) for f in FLOAT_FIELDS},
+    }
+    table = pa.table({name: arrays[name] for name in ("symbol",) + TRADE_FIELDS})
+    table = table.replace_schema_metadata({"results": dumps(meta)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
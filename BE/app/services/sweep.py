@@ -0,0 +1,103 @@
+"""
+Parameter sweep (grid search) על אסטרטגיה אחת:
+- ה-OHLC נטען פעם אחת,
+- כל סדרת אינדיקטור ייחודית (indicator + params) מחושבת פעם אחת: התוכנית של calculate_indicators
+  על איחוד החוקים של כל השילובים נותנת DF אחד עם עמודה לכל פרמטריזציה, שכל השילובים חולקים,
+- השילובים מחולקים ל-chunks שרצים במקביל ב-process pool, והתוצאה היא טבלה מדורגת.
+"""
+import asyncio
+import itertools
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from .backtest import load_ohlc, _date_range
+from .compute import evaluate_combinations, rank_rows, strategy_trades, LOWER_IS_BETTER  # noqa: F401 (re-export)
+from .cpu_pool import run_cpu
+from .fin_apis.scheduler import PRIORITY_BACKGROUND
+from .indicators.calc_indicators import calculate_indicators, exit_indicator_rules
+from ..models import IndicatorRule, StockStrategy, SweepRange, SweepRequest
+from ..settings import settings
+
+def _grid_values(values) -> List[Any]:
+    if isinstance(values, SweepRange):
+        if values.step <= 0:
+            raise ValueError("step must be positive")
+        values = np.arange(values.start, values.stop + values.step / 2, values.step).round(10).tolist()
+    # period=14.0 -> 14, אחרת rolling() של ta נכשל
+    return [int(v) if isinstance(v, float) and v.is_integer() else v for v in values]
+
+
+def expand_grid(grid: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """כל השילובים של הערכים, כ-dict של path -> value."""
+    paths = list(grid)
+    return [dict(zip(paths, combo)) for combo in itertools.product(*(_grid_values(grid[p]) for p in paths))]
+
+
+def apply_params(stock: StockStrategy, params: Dict[str, Any]) -> StockStrategy:
+    """עותק של האסטרטגיה עם הערכים מה-grid. path כמו "entry_rules.0.params.period"."""
+    data = stock.model_dump()
+    for path, value in params.items():
+        *parents, leaf = path.split(".")
+        node = data
+        try:
+            for part in parents:
+                node = node[int(part)] if isinstance(node, list) else node[part]
+            if isinstance(node, list):
+                node[int(leaf)] = value
+            elif isinstance(node, dict):
+                node[leaf] = value
+            else:
+                raise TypeError
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise ValueError(f"Invalid sweep path: {path}")
+    return StockStrategy.model_validate(data)
+
+
+def _indicator_rules(stock: StockStrategy) -> List[IndicatorRule]:
+    return list(stock.entry_rules) + exit_indicator_rules(stock.exit_conditions)
+
+
+async def prepare_combinations(base: StockStrategy, grid: Dict[str, Any]):
+    """
+    כל השילובים של ה-grid, וה-OHLC של base עם האינדיקטורים של כולם (מחושבים פעם אחת על כל הסדרה).
+    מחזיר (combos, ohlc, מספר עמודות האינדיקטורים).
+    """
+    params_list = expand_grid(grid)
+    if len(params_list) > settings.SWEEP_MAX_COMBINATIONS:
+        raise ValueError(f"{len(params_list)} combinations (max {settings.SWEEP_MAX_COMBINATIONS})")
+    combos = [(params, apply_params(base, params)) for params in params_list]
+
+    start_date, end_date = _date_range(base)
+    # grid search (sweep / walk-forward) הוא עבודת batch – המשיכות שלו מהספק אחרי backtests אינטראקטיביים
+    ohlc = await load_ohlc(base.symbol, base.timeframe, start_date, end_date, PRIORITY_BACKGROUND)
+    columns = len(ohlc.columns)
+    ohlc = calculate_indicators(ohlc, [rule for _, stock in combos for rule in _indicator_rules(stock)], base.timeframe)
+    return combos, ohlc, len(ohlc.columns) - columns
+
+
+async def run_sweep(req: SweepRequest) -> Dict:
+    started = time.perf_counter()
+    combos, ohlc, indicator_columns = await prepare_combinations(req.stock, req.grid)
+
+    # chunk אחד לכל worker – ה-DF עם האינדיקטורים עובר לכל worker פעם אחת ולא לכל שילוב
+    n_chunks = max(1, min(len(combos), settings.BACKTEST_WORKERS))
+    chunks = [combos[i::n_chunks] for i in range(n_chunks)]
+    chunk_rows = await asyncio.gather(*(run_cpu(evaluate_combinations, ohlc, chunk) for chunk in chunks if chunk))
+    rows = [row for chunk in chunk_rows for row in chunk]
+
+    rows = rank_rows(rows, req.rank_by, req.ascending)
+    rows = rows[:req.top] if req.top else rows
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+
+    return {
+        "symbol": req.stock.symbol,
+        "timeframe": req.stock.timeframe,
+        "bars": len(ohlc),
+        "combinations": len(combos),
+        "indicator_columns": indicator_columns,
+        "elapsed_seconds": time.perf_counter() - started,
+        "results": rows,
+    }
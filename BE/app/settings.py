@@ -7,11 +7,47 @@ class Settings:
     FINNHUB_API_KEY: Optional[str] = os.getenv("FINNHUB_API_KEY")
     ALPHA_API_KEY: Optional[str] = os.getenv("ALPHA_API_KEY")
     TWELVE_DATA_API_KEY: Optional[str] = os.getenv("TWELVE_DATA_API_KEY")
+    TWELVE_DATA_MAX_CONCURRENCY: int = int(os.getenv("TWELVE_DATA_MAX_CONCURRENCY", "4"))
+    # Provider credit budgets (per API key, per minute)
+    TWELVE_DATA_CREDITS_PER_MINUTE: float = float(os.getenv("TWELVE_DATA_CREDITS_PER_MINUTE", "8"))
+    FINNHUB_CALLS_PER_MINUTE: float = float(os.getenv("FINNHUB_CALLS_PER_MINUTE", "60"))
+    ALPHA_CALLS_PER_MINUTE: float = float(os.getenv("ALPHA_CALLS_PER_MINUTE", "5"))
+    # Market-data routing: enabled providers in preference order (only ones with an API key are used)
+    MARKET_DATA_PROVIDERS: str = os.getenv("MARKET_DATA_PROVIDERS", "twelve_data,finnhub,alpha_vantage")
+    PROVIDER_TIMEOUT_SECONDS: float = float(os.getenv("PROVIDER_TIMEOUT_SECONDS", "180"))
+    PROVIDER_MAX_CONSECUTIVE_ERRORS: int = int(os.getenv("PROVIDER_MAX_CONSECUTIVE_ERRORS", "3"))
+    PROVIDER_COOLDOWN_SECONDS: float = float(os.getenv("PROVIDER_COOLDOWN_SECONDS", "60"))
+    # Backtest execution: concurrent OHLC loads per request, CPU worker processes (0 = run in the event loop process)
+    BACKTEST_MAX_CONCURRENT_LOADS: int = int(os.getenv("BACKTEST_MAX_CONCURRENT_LOADS", "8"))
+    BACKTEST_WORKERS: int = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+    # Backtest job queue
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_MAX_PER_CLIENT: int = int(os.getenv("JOB_MAX_PER_CLIENT", "3"))
+    JOB_MAX_QUEUED: int = int(os.getenv("JOB_MAX_QUEUED", "100"))
+    JOB_TTL_SECONDS: int = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+    # Behind a reverse proxy: identify the client by X-Forwarded-For / X-Real-IP (only if the proxy sets them)
+    TRUST_PROXY_HEADERS: bool = os.getenv("TRUST_PROXY_HEADERS", "false").lower() in ("1", "true", "yes")
+    # Per-stock backtest result cache (in-memory LRU, optionally persisted to Mongo)
+    RESULT_CACHE_SIZE: int = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+    RESULT_CACHE_MONGO: bool = os.getenv("RESULT_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+    # Computed indicator series kept per process, keyed by (source data version, indicator column)
+    INDICATOR_CACHE_SIZE: int = int(os.getenv("INDICATOR_CACHE_SIZE", "128"))
+    # Points kept in the per-stock equity curve returned to the frontend (LTTB downsampling)
+    EQUITY_CURVE_POINTS: int = int(os.getenv("EQUITY_CURVE_POINTS", "1000"))
+    # Per-request stage timings in a Server-Timing response header (debug only)
+    DEBUG_TIMINGS: bool = os.getenv("DEBUG_TIMINGS", "false").lower() in ("1", "true", "yes")
+    SWEEP_MAX_COMBINATIONS: int = int(os.getenv("SWEEP_MAX_COMBINATIONS", "10000"))
     ALLOW_ORIGINS: List[str] = [
         os.getenv("FRONTEND_ORIGIN", "http://localhost:5173"),
         "http://localhost:3000",
         "*",
     ]
+    # Shared HTTP clients (one pool per upstream host)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
     # AI
     AI_PROVIDER: str = os.getenv("AI_PROVIDER", "groq")  # groq | openrouter | ollama
     AI_ENDPOINT: str = os.getenv("AI_ENDPOINT", "https://api.groq.com/openai/v1/chat/completions")
@@ -27,6 +63,19 @@ class Settings:
     MONGO_CLUSTER: Optional[str] = os.getenv("MONGO_CLUSTER")
     MONGO_DB: Optional[str] = os.getenv("MONGO_DB", "ai_trading")
 
+    # OHLC bucket storage: "docs" (candle subdocuments) or "packed" (delta-encoded binary columns)
+    OHLC_STORAGE_FORMAT: str = os.getenv("OHLC_STORAGE_FORMAT", "docs")
+    OHLC_PACKED_FLOAT_DTYPE: str = os.getenv("OHLC_PACKED_FLOAT_DTYPE", "float64")  # float64 | float32
+    OHLC_PACKED_COMPRESSION: str = os.getenv("OHLC_PACKED_COMPRESSION", "zlib")  # zlib | none
+
+    # Local OHLC cache (Arrow IPC, memory-mapped)
+    OHLC_CACHE_DIR: str = os.getenv(
+        "OHLC_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ohlc_cache"),
+    )
+    OHLC_CACHE_MAX_MB: int = int(os.getenv("OHLC_CACHE_MAX_MB", "512"))
+    OHLC_CACHE_TTL_SECONDS: int = int(os.getenv("OHLC_CACHE_TTL_SECONDS", "900"))
+
     @property
     def MONGO_URI(self) -> str:
         return f"mongodb+srv://{self.MONGO_USER}:{self.MONGO_PASSWORD}@{self.MONGO_CLUSTER}/{self.MONGO_DB}?retryWrites=true&w=majority"
@@ -5,6 +5,7 @@ from ..settings import settings
 from ..routers.strategies import STRATS
 from ..services.candles import add_tick, get_candles
 from ..services.indicatiors import compute_indicators, decide
+from ..services.metrics import WS_TICK_SECONDS, WS_TICKS
 from typing import Optional
 
 FINNHUB_KEY = settings.FINNHUB_API_KEY
@@ -45,18 +46,21 @@ async def stream_endpoint(ws: WebSocket):
             pass
 
 async def process_tick_and_emit(ws: WebSocket, symbol: str, price: float, ts_ms: int, strat_id: Optional[str]):
-    add_tick(symbol, price, ts_ms)
-    candles = get_candles(symbol)
-    ind = compute_indicators(candles)
-    rules = (STRATS.get(strat_id) or {}).get("rules", [])
-    decision, reason = decide(rules, price, ind)
+    WS_TICKS.inc()
+    with WS_TICK_SECONDS.time(phase="compute"):
+        add_tick(symbol, price, ts_ms)
+        candles = get_candles(symbol)
+        ind = compute_indicators(candles)
+        rules = (STRATS.get(strat_id) or {}).get("rules", [])
+        decision, reason = decide(rules, price, ind)
 
-    await ws.send_json({
-        "type":"tick",
-        "symbol": symbol,
-        "price": price,
-        "ts": ts_ms,
-        **ind,
-        "decision": decision,
-        "reason": reason,
-    })
+    with WS_TICK_SECONDS.time(phase="send"):
+        await ws.send_json({
+            "type":"tick",
+            "symbol": symbol,
+            "price": price,
+            "ts": ts_ms,
+            **ind,
+            "decision": decision,
+            "reason": reason,
+        })
@@ -0,0 +1,237 @@
+"""
+Benchmark של כל שלבי ה-backtest על נתונים סינתטיים דטרמיניסטיים ו-Mongo בתוך התהליך (mongomock-motor),
+כך שהכל רץ offline: calculate_indicators, check_entry_conditions, check_exit_conditions, process_trades,
+get_ohlc_from_db ו-run_backtest מקצה לקצה.
+לכל גודל ולכל שלב נשמרים זמן (best / median) ו-peak memory (tracemalloc, בריצה נפרדת) לקובץ JSON
+עם מפתחות ממויינים – אפשר לעשות לו diff בין commits, או להשוות ישירות עם --compare.
+הזמנים של get_ohlc_from_db / run_backtest כוללים את מנוע השאילתות של mongomock (Python טהור, איטי בהרבה מ-Mongo
+אמיתי) – הם טובים להשוואה בין ריצות באותה סביבה, לא כמספר מוחלט. 1M נרות לוקח כמה דקות.
+
+הרצה (מתוך BE/, אחרי pip install -r benchmarks/requirements.txt):
+    python -m benchmarks.bench_pipeline --compare benchmarks/baseline.json
+    python -m benchmarks.bench_pipeline --bars 10000 --bars 100000 --compare benchmarks/baseline.json
+benchmarks/baseline.json הוא ה-baseline השמור ב-repo (1k / 10k / 100k נרות; גדלים שחסרים בו לא מושווים); ברירת המחדל של --output היא קובץ בתיקייה הזמנית,
+ורענון ה-baseline (אחרי שינוי מכוון בביצועים) הוא --output benchmarks/baseline.json.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# ה-cache המקומי (Arrow) של הבנצ'מרק בתיקייה זמנית – לא נוגעים ב-data/ohlc_cache. חייב לקרות לפני import של settings
+os.environ.setdefault("OHLC_CACHE_DIR", os.path.join(tempfile.mkdtemp(prefix="bench_ohlc_"), "ohlc_cache"))
+
+import numpy as np
+import pandas as pd
+
+try:
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+except ImportError:
+    raise SystemExit("bench_pipeline needs mongomock-motor (pip install -r benchmarks/requirements.txt)")
+
+# כל ה-app מקבל Mongo בזיכרון; חייב לקרות לפני import של app.db.ohlc_db
+motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+from app.db.ohlc_db import save_ohlc_to_db, get_ohlc_from_db  # noqa: E402
+from app.models import StockStrategy, IndicatorRule, ExitCondition  # noqa: E402
+from app.services.backtest import run_backtest  # noqa: E402
+from app.services.check_entry import check_entry_conditions, check_exit_conditions  # noqa: E402
+from app.services.indicators.calc_indicators import (  # noqa: E402
+    calculate_indicators, calculate_exit_indicators, clear_indicator_cache,
+)
+from app.services.process_trades import process_trades  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+DEFAULT_BARS = [1_000, 10_000, 100_000, 1_000_000]
+TIMEFRAME = "5m"
+START = pd.Timestamp("2000-01-03 09:30")
+STAGES = (
+    "calculate_indicators", "check_entry_conditions", "check_exit_conditions",
+    "process_trades", "get_ohlc_from_db", "run_backtest",
+)
+
+
+# ---------- data ----------
+def synthetic_ohlc(bars: int, seed: int = 0) -> pd.DataFrame:
+    """Random walk דטרמיניסטי (אותו seed -> אותם נרות) עם high/low/volume עקביים."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, bars)) * close
+    return pd.DataFrame({
+        "datetime": pd.date_range(START, periods=bars, freq="5min"),
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "volume": rng.integers(1_000, 100_000, bars).astype(np.float64),
+    })
+
+
+def make_stock(symbol: str, ohlc: pd.DataFrame) -> StockStrategy:
+    return StockStrategy(
+        symbol=symbol,
+        timeframe=TIMEFRAME,
+        investment=1000,
+        max_loss=15,
+        start_date=ohlc["datetime"].iloc[0].date(),
+        end_date=ohlc["datetime"].iloc[-1].date(),
+        entry_rules=[
+            IndicatorRule(indicator="rsi", params={"period": 14}, operator="<", value=35),
+            IndicatorRule(indicator="sma", params={"period": 50}, operator="<", value=0),  # value <= 0 -> מול close
+        ],
+        exit_conditions=[
+            ExitCondition(type="take_profit", value=20),
+            ExitCondition(type="stop_loss", value=15),
+            ExitCondition(type="indicator", indicator_rule=IndicatorRule(
+                indicator="macd", params={"fast": 12, "slow": 26, "signal": 9}, operator="crossesBelow", value=0,
+            )),
+        ],
+    )
+
+
+# ---------- measurement ----------
+async def _call(fn: Callable, args: tuple) -> Any:
+    out = fn(*args)
+    if inspect.isawaitable(out):
+        out = await out
+    return out
+
+
+async def measure(fn: Callable, setup: Optional[Callable[[], tuple]] = None, repeat: int = 3) -> Dict[str, float]:
+    """setup (לא נמדד) מכין את הקלט לכל ריצה; peak memory נמדד בריצה נוספת, כדי ש-tracemalloc לא ישפיע על הזמנים."""
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        started = time.perf_counter()
+        await _call(fn, args)
+        timings.append(time.perf_counter() - started)
+
+    args = setup() if setup else ()
+    tracemalloc.start()
+    await _call(fn, args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_ms": round(min(timings) * 1000, 3),
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "peak_mb": round(peak / 2**20, 3),
+    }
+
+
+async def bench_size(bars: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    symbol = f"BENCH{bars}"
+    ohlc = synthetic_ohlc(bars)
+    stock = make_stock(symbol, ohlc)
+    start_date, end_date = stock.start_date.isoformat(), stock.end_date.isoformat()
+    # כל הטווח מסומן כ-covered, כך ש-run_backtest לא פונה לספק
+    await save_ohlc_to_db(symbol, TIMEFRAME, start_date, end_date, ohlc)
+
+    def fresh(frame: Optional[pd.DataFrame] = None) -> Callable[[], tuple]:
+        """כל ריצה על עותק נקי, בלי סדרות אינדיקטורים מה-cache של הריצה הקודמת."""
+        def setup():
+            clear_indicator_cache()
+            return () if frame is None else (frame.copy(),)
+        return setup
+
+    def indicators(df: pd.DataFrame) -> pd.DataFrame:
+        df = calculate_indicators(df, stock.entry_rules, stock.timeframe)
+        return calculate_exit_indicators(df, stock.exit_conditions, stock.timeframe)
+
+    with_indicators = indicators(ohlc.copy())
+    with_signals = check_exit_conditions(check_entry_conditions(with_indicators.copy(), stock.entry_rules), stock.exit_conditions)
+
+    results = {
+        "calculate_indicators": await measure(indicators, fresh(ohlc), repeat),
+        "check_entry_conditions": await measure(
+            lambda df: check_entry_conditions(df, stock.entry_rules), fresh(with_indicators), repeat),
+        "check_exit_conditions": await measure(
+            lambda df: check_exit_conditions(df, stock.exit_conditions), fresh(with_indicators), repeat),
+        "process_trades": await measure(lambda df: process_trades(df, stock), fresh(with_signals), repeat),
+        "get_ohlc_from_db": await measure(
+            lambda: get_ohlc_from_db(symbol, TIMEFRAME, start_date, end_date), None, repeat),
+        # הריצה הראשונה טוענת מה-DB וממלאת את ה-cache המקומי; best = טעינה חמה + כל החישוב
+        "run_backtest": await measure(lambda: run_backtest([stock]), fresh(), repeat),
+    }
+    return results
+
+
+# ---------- report ----------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: Dict, new: Dict) -> None:
+    for bars, stages in new["results"].items():
+        for stage, metrics in stages.items():
+            before = old.get("results", {}).get(bars, {}).get(stage)
+            if not before:
+                continue
+            change = (metrics["best_ms"] - before["best_ms"]) / before["best_ms"] * 100 if before["best_ms"] else 0.0
+            print(
+                f"{bars:>9} | {stage:<24} | {before['best_ms']:10.2f} -> {metrics['best_ms']:10.2f} ms ({change:+6.1f}%)"
+                f" | {before['peak_mb']:8.2f} -> {metrics['peak_mb']:8.2f} MB"
+            )
+
+
+async def main(bars_list: List[int], repeat: int, output: str, compare_to: Optional[str]) -> None:
+    # הכל בתהליך הנוכחי ובלי cache תוצאות – אחרת run_backtest מודד hit של cache / עבודה ב-worker ש-tracemalloc לא רואה
+    settings.BACKTEST_WORKERS = 0
+    settings.RESULT_CACHE_SIZE = 0
+    settings.RESULT_CACHE_MONGO = False
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "timeframe": TIMEFRAME,
+            "storage_format": settings.OHLC_STORAGE_FORMAT,
+        },
+        "results": {},
+    }
+    for bars in bars_list:
+        report["results"][str(bars)] = stages = await bench_size(bars, repeat)
+        for stage in STAGES:
+            m = stages[stage]
+            print(f"{bars:>9} bars | {stage:<24} | best {m['best_ms']:10.2f} ms | median {m['median_ms']:10.2f} ms | peak {m['peak_mb']:8.2f} MB")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"saved {output}")
+
+    if compare_to:
+        with open(compare_to, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the backtest pipeline offline")
+    parser.add_argument("--bars", type=int, action="append", help="frame size (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=os.path.join(tempfile.gettempdir(), "bench_pipeline.json"),
+                        help="where to write this run (benchmarks/baseline.json to refresh the committed baseline)")
+    parser.add_argument("--compare", dest="compare_to", help="previous baseline JSON to diff against")
+    args = parser.parse_args()
+    asyncio.run(main(args.bars or DEFAULT_BARS, args.repeat, args.output, args.compare_to))
@@ -0,0 +1,159 @@
+"""
+Benchmark: simulate_trades (NumPy) מול לולאת ה-iterrows המקורית של process_trades.
+בודק שהתוצאות זהות (עסקאות + עמודות in_position / position_type / pnl) ומדפיס את ההאצה.
+
+הרצה (מתוך BE/):
+    python -m benchmarks.bench_process_trades
+    python -m benchmarks.bench_process_trades --bars 100000 --bars 7500
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.models import StockStrategy, ExitCondition
+from app.services.process_trades import simulate_trades
+
+
+def legacy_process_trades(ohlc: pd.DataFrame, stock: StockStrategy):
+    """המימוש הקודם (לולאה על כל בר) – נשמר כאן כ-reference לבדיקת זהות ולמדידה."""
+
+    if ohlc.empty:
+        return ohlc, []
+
+    # הוספת עמודות ל-DF
+    ohlc = ohlc.copy()
+    ohlc["in_position"] = False
+    ohlc["position_type"] = None
+    ohlc["pnl"] = 0.0
+
+    trades = []
+    in_position = False
+    entry_price = 0.0
+    shares = 0
+    entry_index = None
+
+    # קבלת ערכי יציאה
+    sl_or_tp = stock.exit_conditions
+
+    # TODO: בעתיד אפשר להמיר את הערכים לאחוזים אם יגיעו בערך מוחלט או אחוז
+    # TODO: בעתיד להוסיף אפשרות SHORT
+
+    for idx, row in ohlc.iterrows():
+        price = row["close"]
+
+        # כניסה לעסקה
+        if row.get("entry_signal", False) and not in_position:
+            in_position = True
+            entry_price = price
+            shares = stock.investment / price  # TODO: בדוק rounding אם צריך
+            entry_index = idx
+            ohlc.at[idx, "in_position"] = True
+            ohlc.at[idx, "position_type"] = "BUY"
+            # TODO: אפשרות להוסיף סוג הוראה (MKT, LMT וכו')
+            continue
+
+        # אם בעסקה פעילה
+        if in_position:
+            pnl = (price - entry_price) * shares
+            ohlc.at[idx, "in_position"] = True
+            ohlc.at[idx, "position_type"] = "BUY"
+            ohlc.at[idx, "pnl"] = pnl
+
+            # בדיקה ל-TP / SL אם קיימים
+            # TODO: implement technical indicators checks
+            exit_flag = False
+            for condition in sl_or_tp:  # עבר על כל תנאי יציאה
+              ctype = condition.type
+              cvalue = condition.value
+      
+              if ctype == "take_profit" and pnl >= cvalue:
+                  exit_flag = True
+              elif ctype == "stop_loss" and pnl <= -cvalue:
+                  exit_flag = True
+            
+            if row.get("exit_signal", False):
+                exit_flag = True
+
+            if exit_flag:
+                in_position = False
+                ohlc.at[idx, "position_type"] = "SELL"
+                trades.append({
+                    "entry_index": entry_index,
+                    "exit_index": idx,
+                    "entry_date": ohlc.at[entry_index, "datetime"],
+                    "exit_date": ohlc.at[idx, "datetime"],
+                    "entry_price": entry_price,
+                    "exit_price": price,
+                    "shares": shares,
+                    "pnl": pnl,
+                    "pct_return": (pnl / (entry_price * shares)) * 100,
+                    "type": "BUY"  # TODO: בעתיד להוסיף אפשרות SHORT
+                })
+                entry_price = 0.0
+                shares = 0
+                entry_index = None
+
+    return ohlc, trades
+
+
+def synthetic_ohlc(bars: int, seed: int = 0) -> pd.DataFrame:
+    """Random-walk closes עם entry/exit signals דלילים – דומה לפלט של check_entry/check_exit."""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+    return pd.DataFrame({
+        "datetime": pd.date_range("2020-01-01 09:30", periods=bars, freq="5min"),
+        "close": close,
+        "entry_signal": rng.random(bars) < 0.02,
+        "exit_signal": rng.random(bars) < 0.005,
+    })
+
+
+def make_stock() -> StockStrategy:
+    return StockStrategy(
+        symbol="BENCH",
+        timeframe="5m",
+        investment=1000,
+        max_loss=15,
+        entry_rules=[],
+        exit_conditions=[
+            ExitCondition(type="take_profit", value=20),
+            ExitCondition(type="stop_loss", value=15),
+        ],
+    )
+
+
+def assert_identical(ohlc: pd.DataFrame, stock: StockStrategy) -> None:
+    legacy_df, legacy_trades = legacy_process_trades(ohlc, stock)
+    new_df, new_trades = simulate_trades(ohlc, stock)
+    assert legacy_trades == new_trades, "trades differ"
+    for col in ("in_position", "position_type", "pnl"):
+        assert legacy_df[col].tolist() == new_df[col].tolist(), f"column {col} differs"
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(bars_list, repeat: int) -> None:
+    stock = make_stock()
+    for bars in bars_list:
+        ohlc = synthetic_ohlc(bars)
+        assert_identical(ohlc, stock)
+        legacy = best_of(lambda: legacy_process_trades(ohlc, stock), 1)
+        vectorized = best_of(lambda: simulate_trades(ohlc, stock), repeat)
+        print(f"{bars:>9} bars | legacy {legacy * 1000:10.1f} ms | numpy {vectorized * 1000:8.2f} ms | x{legacy / vectorized:,.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the trade simulator")
+    parser.add_argument("--bars", type=int, action="append", help="frame size (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.bars or [7500, 100_000], args.repeat)